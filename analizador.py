@@ -5,6 +5,7 @@ import requests
 from datetime import datetime
 from entrenamiento_fino import EntrenamientoFino
 from generar_pdf import GeneradorPDF
+from json_incremental import ExtractorCampoJSON
 import base64 
 
 # class AnalizadorContexto:
@@ -19,34 +20,55 @@ class AnalizadorContexto:
         # self.entrenamiento_fino = entrenamiento_fino if entrenamiento_fino else EntrenamientoFino()
         # self.generar_pdf = generador_pdf if generador_pdf else GeneradorPDF(self.entrenamiento_fino)
     
-    def analizar_pregunta(self, pregunta, conversacion):
+    def _sin_contexto(self, resumen_conversacion):
+        """Sin resumen previo: primer mensaje de la conversación"""
+        return not resumen_conversacion or resumen_conversacion == "Sin conversación previa"
+    
+    def _consulta_busqueda(self, pregunta, resumen_conversacion):
+        """Texto para buscar en la base de conocimiento: la pregunta y, si existe, el resumen previo"""
+        if self._sin_contexto(resumen_conversacion):
+            return pregunta
+        return f"{pregunta}\n\nContexto previo: {resumen_conversacion}"
+    
+    def _clave_cache(self, pregunta, resumen_conversacion):
+        """Clave de la caché semántica de respuestas. Solo se cachean turnos sin contexto previo (primer mensaje):
+        con historial la respuesta depende de la conversación de ese cliente y no se puede reutilizar para otro"""
+        return pregunta if self._sin_contexto(resumen_conversacion) else None
+    
+    def _respuesta_valida(self, respuesta):
+        """Solo se cachean respuestas que son JSON y cumplen el esquema mínimo del vendedor"""
         try:
-            # Resumir la conversacion previa para el uso del contexto
-            # del modelo y tenga idea de la conversación previa pasada
-            conversacion_resumida = self.entrenamiento_fino.obtener_informacion_modelo(
-                """
-                    Eres un asistente especializado en resumir conversaciones de ventas de productos gamer.
-                    Tu tarea es analizar el historial de conversación y crear un resumen BREVE y DIRECTO que capture únicamente la información comercial relevante.
-                    INSTRUCCIONES:
-                    - Resume SOLO información útil para ventas: productos mencionados, presupuesto, necesidades específicas, preferencias
-                    - Elimina saludos, cortesías y conversación casual
-                    - Máximo 2-3 líneas por intercambio importante
-                    - Enfócate en: qué busca el cliente, qué se recomendó, decisiones tomadas
-                    Responde con un párrafo corto y directo con los puntos clave de la conversación.
-                """,
-                 conversacion
-            )
-            
-            # Obtener el resumen para usarlo en el contexto del vendedor
-            resumen_conversacion = ""
-            if conversacion_resumida['status'] == 'success':
-                resumen_conversacion = conversacion_resumida['data']
-            else:
-                resumen_conversacion = "Sin conversación previa"
-            
-            # Obtener respuesta del agente vendedor con contexto completo
-            datos_contexto = self.entrenamiento_fino.obtener_informacion_modelo(
-                f"""
+            datos = json.loads(respuesta) if isinstance(respuesta, str) else respuesta
+        except json.JSONDecodeError:
+            return False
+        return self._validar_turno(datos)[0] is not None
+    
+    def actualizar_resumen(self, resumen_previo, mensaje_cliente, respuesta_agente):
+        """Resumen acumulado: integra el último intercambio al resumen anterior (sin re-resumir el historial)"""
+        resultado = self.entrenamiento_fino.obtener_respuesta_directa(
+            """
+                Eres un asistente que mantiene el resumen de una conversación de ventas de productos gamer.
+                Recibes el resumen actual y el último intercambio entre el cliente y el vendedor.
+                INSTRUCCIONES:
+                - Devuelve el resumen actualizado integrando SOLO información útil para ventas del nuevo intercambio
+                - Conserva del resumen actual lo que siga siendo relevante: productos mencionados, presupuesto, necesidades, preferencias, decisiones
+                - Elimina saludos, cortesías y conversación casual
+                - Máximo un párrafo corto y directo
+                Responde únicamente con el resumen actualizado.
+            """,
+            f"RESUMEN ACTUAL:\n{resumen_previo or 'Sin conversación previa'}\n\n"
+            f"ÚLTIMO INTERCAMBIO:\nCliente: {mensaje_cliente}\nVendedor: {respuesta_agente}"
+        )
+        
+        if resultado['status'] == 'success':
+            return resultado['data'].strip()
+        
+        print(f"⚠️ No se pudo actualizar el resumen: {resultado.get('error_details', resultado.get('message'))}")
+        return None
+    
+    def _prompt_vendedor(self, resumen_conversacion):
+        """Instrucciones de personalidad y negocio del vendedor (compartidas por todos los modos de respuesta)"""
+        return f"""
                 Eres un vendedor HUMANO especialista en productos gamer trabajando en una tienda física. Tu comunicación será enviada por WhatsApp, así que usa formato elegante con saltos de línea apropiados.
                 
                 PERSONALIDAD Y ESTILO:
@@ -78,7 +100,243 @@ class AnalizadorContexto:
                 
                 CONTEXTO DE CONVERSACIÓN PREVIA:
                 {resumen_conversacion}
+                """
+    
+    def _preparar_respuesta(self, respuesta_json):
+        """Determina el interés de la respuesta del modelo y genera el PDF correspondiente"""
+        respuesta_agente = respuesta_json.get("respuesta_agente", "")
+        
+        # Determinar qué tipo de interés existe (solo uno debería existir)
+        if "interes_coleccion" in respuesta_json and respuesta_json["interes_coleccion"]:
+            tipo_interes = "coleccion"
+            titulo_interes = respuesta_json["interes_coleccion"]
+        elif "interes_promocion" in respuesta_json and respuesta_json["interes_promocion"]:
+            tipo_interes = "promocion"
+            titulo_interes = respuesta_json["interes_promocion"]
+        elif "interes" in respuesta_json:
+            tipo_interes = "indefinido"
+            titulo_interes = respuesta_json["interes"]
+        else:
+            # Fallback por si no viene ninguno
+            tipo_interes = "indefinido"
+            titulo_interes = "indefinido"
+        
+        # Se procede a evaluar el tipo de interes que se ha detectado
+        print(f"Tipo de interés detectado: {tipo_interes} - Valor: {titulo_interes}")
+        
+        # Generar PDF según el tipo de interés
+        pdf_generado = None
+        if tipo_interes == "coleccion":
+            # Obtener un pdf de la colección
+            pdf_generado = self.generar_pdf.informacion_coleccion(titulo_interes)
+        elif tipo_interes == "promocion":
+            # Obtener un pdf de la promoción
+            pdf_generado = self.generar_pdf.informacion_promocion(titulo_interes)
+        else:
+            # No se genera PDF si el interés es indefinido
+            pdf_generado = "No se generará PDF ya que el interés es indefinido"
+        
+        # Preparar respuesta final para el cliente
+        respuesta_enviar_cliente = {
+            "respuesta_agente": respuesta_agente,
+            "pdf_generado": pdf_generado,
+            "tipo_interes": tipo_interes,
+            "titulo_interes": titulo_interes
+        }
+        
+        return respuesta_enviar_cliente
+    
+    def analizar_turno(self, pregunta, resumen_conversacion, productos_disponibles=None, al_recibir_respuesta=None):
+        """Análisis del turno en una sola llamada JSON: respuesta del vendedor, interés (colección/promoción),
+        intereses en productos y resumen actualizado de la conversación.
+        
+        Args:
+            pregunta: Mensaje del cliente
+            resumen_conversacion: Resumen acumulado previo ("" si no hay)
+            productos_disponibles: {nombre: id_producto} para validar los intereses en productos
+            al_recibir_respuesta: Callback opcional; recibe el texto de "respuesta_agente" a medida que se genera
+        """
+        try:
+            al_recibir = None
+            if al_recibir_respuesta is not None:
+                extractor = ExtractorCampoJSON("respuesta_agente")
+                
+                def al_recibir(fragmento):
+                    texto = extractor.agregar(fragmento)
+                    if texto:
+                        al_recibir_respuesta(texto)
+            
+            datos_turno = self.entrenamiento_fino.obtener_respuesta_json(
+                f"""
+                {self._prompt_vendedor(resumen_conversacion or "Sin conversación previa")}
+                
+                FORMATO DE RESPUESTA OBLIGATORIO (un único objeto JSON válido, con "respuesta_agente" como primer campo):
+                {{
+                    "respuesta_agente": "Tu respuesta como vendedor humano aquí",
+                    "interes_coleccion": "nombre_coleccion",
+                    "intereses_productos": [{{"nombre": "nombre_exacto_del_producto", "nivel_interes": "alto"}}],
+                    "resumen_conversacion": "Resumen actualizado de la conversación"
+                }}
                 
+                REGLAS IMPORTANTES PARA CLASIFICAR INTERÉS:
+                - Incluye SOLO UNO de estos campos: "interes_coleccion", "interes_promocion" o "interes": "indefinido"
+                - Si el cliente muestra interés en una COLECCIÓN específica de productos: usa "interes_coleccion"
+                - Si el cliente muestra interés en una PROMOCIÓN específica: usa "interes_promocion"
+                - Si NO está claro qué busca o es conversación general: usa "interes": "indefinido"
+                - Verifica que la colección/promoción exista en nuestra base de datos antes de clasificarla
+                
+                INTERESES EN PRODUCTOS ("intereses_productos"):
+                - Productos que el cliente menciona o busca en su mensaje, con el nombre EXACTO de la base de conocimiento
+                - "alto": pregunta precio, características o disponibilidad; "medio": consulta general; "bajo": mención casual
+                - Si no hay interés en ningún producto: []
+                
+                RESUMEN ("resumen_conversacion"):
+                - Integra este intercambio al contexto previo en un párrafo corto y directo
+                - Solo información útil para ventas: productos, presupuesto, necesidades, preferencias, decisiones
+                
+                Usa toda la base de conocimiento de productos disponible para dar respuestas precisas y relevantes sobre nuestra sucursal.
+                """,
+                pregunta,
+                consulta_busqueda=self._consulta_busqueda(pregunta, resumen_conversacion),
+                al_recibir=al_recibir,
+                clave_cache=self._clave_cache(pregunta, resumen_conversacion),
+                validar_respuesta=self._respuesta_valida
+            )
+            
+            if datos_turno['status'] != 'success':
+                return {
+                    "status": "error",
+                    "message": "Error al obtener respuesta del agente vendedor",
+                    "details": datos_turno
+                }
+            
+            turno, errores = self._validar_turno(datos_turno['data'], productos_disponibles)
+            if turno is None:
+                return {
+                    "status": "error",
+                    "message": "Respuesta del modelo no cumple el esquema del turno",
+                    "details": errores
+                }
+            for error in errores:
+                print(f"⚠️ {error}")
+            
+            if datos_turno.get('desde_cache'):
+                # El resumen cacheado es de otra conversación (también sin contexto previo): se actualiza aparte con este intercambio
+                turno["resumen_conversacion"] = ""
+            
+            respuesta_enviar_cliente = self._preparar_respuesta(turno)
+            respuesta_enviar_cliente["intereses_productos"] = turno["intereses_productos"]
+            respuesta_enviar_cliente["resumen_conversacion"] = turno["resumen_conversacion"]
+            
+            return {
+                "status": "success",
+                "data": respuesta_enviar_cliente
+            }
+        
+        except Exception as e:
+            return {
+                "status": "error",
+                "message": "Error general en análisis de turno",
+                "details": str(e)
+            }
+    
+    def _validar_turno(self, datos, productos_disponibles=None):
+        """Valida el JSON del turno contra su esquema.
+        
+        Devuelve (turno normalizado, errores). Campos opcionales inválidos se descartan y se reportan;
+        si falta la respuesta del agente el turno es None.
+        """
+        errores = []
+        if not isinstance(datos, dict):
+            return None, ["La respuesta no es un objeto JSON"]
+        
+        respuesta_agente = datos.get("respuesta_agente")
+        if not isinstance(respuesta_agente, str) or not respuesta_agente.strip():
+            return None, ["'respuesta_agente' debe ser un texto no vacío"]
+        
+        turno = {"respuesta_agente": respuesta_agente.strip()}
+        
+        # Un solo campo de interés (se respeta la prioridad colección > promoción > indefinido)
+        campos_interes = [campo for campo in ("interes_coleccion", "interes_promocion", "interes")
+                          if isinstance(datos.get(campo), str) and datos[campo].strip()]
+        if len(campos_interes) > 1:
+            errores.append(f"Varios campos de interés {campos_interes}, se usa '{campos_interes[0]}'")
+        if campos_interes:
+            turno[campos_interes[0]] = datos[campos_interes[0]].strip()
+        else:
+            turno["interes"] = "indefinido"
+        
+        intereses = datos.get("intereses_productos", [])
+        if not isinstance(intereses, list):
+            errores.append("'intereses_productos' no es una lista")
+            intereses = []
+        
+        turno["intereses_productos"] = []
+        for interes in intereses:
+            if not isinstance(interes, dict) or not isinstance(interes.get("nombre"), str):
+                errores.append(f"Interés inválido: {interes}")
+            elif interes.get("nivel_interes") not in ("bajo", "medio", "alto"):
+                errores.append(f"Nivel de interés inválido: {interes}")
+            elif productos_disponibles is not None and interes["nombre"] not in productos_disponibles:
+                errores.append(f"Producto no encontrado: {interes['nombre']}")
+            else:
+                turno["intereses_productos"].append({"nombre": interes["nombre"], "nivel_interes": interes["nivel_interes"]})
+        
+        resumen = datos.get("resumen_conversacion")
+        turno["resumen_conversacion"] = resumen.strip() if isinstance(resumen, str) else ""
+        if not isinstance(resumen, str):
+            errores.append("'resumen_conversacion' ausente o inválido")
+        
+        return turno, errores
+    
+    def analizar_pregunta(self, pregunta, conversacion, resumen_conversacion=None):
+        """Genera la respuesta del vendedor.
+        
+        Si se pasa resumen_conversacion (resumen acumulado ya guardado) no se vuelve a resumir la conversación.
+        """
+        try:
+            if resumen_conversacion is not None:
+                return self._responder_como_vendedor(pregunta, resumen_conversacion or "Sin conversación previa")
+            
+            # Resumir la conversacion previa para el uso del contexto
+            # del modelo y tenga idea de la conversación previa pasada
+            # (no necesita la base de conocimiento: va directo al modelo, sin búsqueda de documentos)
+            conversacion_resumida = self.entrenamiento_fino.obtener_respuesta_directa(
+                """
+                    Eres un asistente especializado en resumir conversaciones de ventas de productos gamer.
+                    Tu tarea es analizar el historial de conversación y crear un resumen BREVE y DIRECTO que capture únicamente la información comercial relevante.
+                    INSTRUCCIONES:
+                    - Resume SOLO información útil para ventas: productos mencionados, presupuesto, necesidades específicas, preferencias
+                    - Elimina saludos, cortesías y conversación casual
+                    - Máximo 2-3 líneas por intercambio importante
+                    - Enfócate en: qué busca el cliente, qué se recomendó, decisiones tomadas
+                    Responde con un párrafo corto y directo con los puntos clave de la conversación.
+                """,
+                 conversacion
+            )
+            
+            # Obtener el resumen para usarlo en el contexto del vendedor
+            resumen_conversacion = ""
+            if conversacion_resumida['status'] == 'success':
+                resumen_conversacion = conversacion_resumida['data']
+            else:
+                resumen_conversacion = "Sin conversación previa"
+            
+            return self._responder_como_vendedor(pregunta, resumen_conversacion)
+        
+        except Exception as e:
+            return {
+                "status": "error",
+                "message": "Error general en análisis de contexto",
+                "details": str(e)
+            }
+    
+    def _responder_como_vendedor(self, pregunta, resumen_conversacion):
+        try:
+            # Obtener respuesta del agente vendedor con contexto completo
+            datos_contexto = self.entrenamiento_fino.obtener_informacion_modelo(
+                f"""
+                {self._prompt_vendedor(resumen_conversacion)}
                 FORMATO DE RESPUESTA OBLIGATORIO (JSON válido):
                 SOLO incluye "respuesta_agente" + UNO de estos campos según corresponda:
                 
@@ -115,51 +373,16 @@ class AnalizadorContexto:
                 
                 Usa toda la base de conocimiento de productos disponible para dar respuestas precisas y relevantes sobre nuestra sucursal.
                 """,
-                pregunta
+                pregunta,
+                consulta_busqueda=self._consulta_busqueda(pregunta, resumen_conversacion),
+                clave_cache=self._clave_cache(pregunta, resumen_conversacion),
+                validar_respuesta=self._respuesta_valida
             )
             
             # Obtener la respuesta del agente vendedor con el contexto completo
             if datos_contexto['status'] == 'success':
                 respuesta_json = json.loads(datos_contexto['data'])
-                respuesta_agente = respuesta_json.get("respuesta_agente", "")
-                
-                # Determinar qué tipo de interés existe (solo uno debería existir)
-                if "interes_coleccion" in respuesta_json and respuesta_json["interes_coleccion"]:
-                    tipo_interes = "coleccion"
-                    titulo_interes = respuesta_json["interes_coleccion"]
-                elif "interes_promocion" in respuesta_json and respuesta_json["interes_promocion"]:
-                    tipo_interes = "promocion"
-                    titulo_interes = respuesta_json["interes_promocion"]
-                elif "interes" in respuesta_json:
-                    tipo_interes = "indefinido"
-                    titulo_interes = respuesta_json["interes"]
-                else:
-                    # Fallback por si no viene ninguno
-                    tipo_interes = "indefinido"
-                    titulo_interes = "indefinido"
-                
-                # Se procede a evaluar el tipo de interes que se ha detectado
-                print(f"Tipo de interés detectado: {tipo_interes} - Valor: {titulo_interes}")
-                
-                # Generar PDF según el tipo de interés
-                pdf_generado = None
-                if tipo_interes == "coleccion":
-                    # Obtener un pdf de la colección
-                    pdf_generado = self.generar_pdf.informacion_coleccion(titulo_interes)
-                elif tipo_interes == "promocion":
-                    # Obtener un pdf de la promoción
-                    pdf_generado = self.generar_pdf.informacion_promocion(titulo_interes)
-                else:
-                    # No se genera PDF si el interés es indefinido
-                    pdf_generado = "No se generará PDF ya que el interés es indefinido"
-                
-                # Preparar respuesta final para el cliente
-                respuesta_enviar_cliente = {
-                    "respuesta_agente": respuesta_agente,
-                    "pdf_generado": pdf_generado,
-                    "tipo_interes": tipo_interes,
-                    "titulo_interes": titulo_interes
-                }
+                respuesta_enviar_cliente = self._preparar_respuesta(respuesta_json)
                 
                 return {
                     "status": "success",
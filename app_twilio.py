@@ -1,8 +1,11 @@
 # app_twilio_local.py - Versión simplificada para desarrollo local
 
 import os
+import re
 import base64
 import tempfile
+import threading
+import zlib
 import requests  # Para subir PDFs
 from datetime import datetime
 
@@ -17,6 +20,8 @@ from entrenamiento_fino import EntrenamientoFino
 from generar_pdf import GeneradorPDF
 from manejador_conversaciones import ManejadorConversaciones
 from generador_intereses import GeneradorIntereses
+from cola_trabajos import ColaTrabajos, PoolTrabajadores
+from intereses_diferidos import ExtractorInteresesDiferido
 
 # ============================================
 # CONFIGURACIÓN LOCAL
@@ -30,6 +35,23 @@ TWILIO_ACCOUNT_SID = ''  # Tu Account SID real
 TWILIO_AUTH_TOKEN = ''     # Tu Auth Token real
 TWILIO_WHATSAPP_NUMBER = ''            # Número sandbox
 
+# Streaming: la respuesta se envía por la API REST mientras el modelo la genera
+STREAMING_RESPUESTAS = True
+MAX_CARACTERES_WHATSAPP = 1500         # Twilio corta los mensajes de WhatsApp en 1600
+
+# Webhook asíncrono: encola el mensaje (la cola lo persiste), responde 200 al instante y un trabajador lo procesa
+PROCESAMIENTO_ASINCRONO = True
+NUM_TRABAJADORES = 4                   # Clientes atendidos en paralelo (cada cliente, en orden)
+
+# Ráfagas ("hola", "tienen ps5?", "precio?"): los mensajes de un cliente separados por menos de la ventana
+# se responden en un solo turno (0 = un turno por mensaje). Solo en modo asíncrono
+VENTANA_AGRUPACION_SEGUNDOS = 3
+ESPERA_MAXIMA_AGRUPACION = 10          # Tope de espera desde el primer mensaje de la ráfaga
+RUTA_COLA_TRABAJOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cola_trabajos.db")
+
+# El PDF adjunto se envía unos segundos después del texto para que lleguen en orden (envío programado en la cola)
+ESPERA_ENVIO_PDF_SEGUNDOS = 3
+
 print("🚀 Inicializando sistema para desarrollo local...")
 
 # Inicializar módulos
@@ -38,9 +60,14 @@ generador_pdf = GeneradorPDF(entrenamiento_fino)
 analizador = AnalizadorContexto(entrenamiento_fino, generador_pdf)
 manejador_conversaciones = ManejadorConversaciones()
 generador_intereses = GeneradorIntereses()
+extractor_intereses = ExtractorInteresesDiferido(generador_intereses)
+cola_trabajos = ColaTrabajos(RUTA_COLA_TRABAJOS)
 
 print("✅ Todos los módulos inicializados correctamente")
 
+# Modo síncrono: un candado por fragmento de teléfonos (ver candado_cliente)
+CANDADOS_CLIENTES = [threading.Lock() for _ in range(64)]
+
 # ============================================
 # FUNCIONES AUXILIARES LOCALES
 # ============================================
@@ -53,47 +80,115 @@ def limpiar_telefono_twilio(numero):
     """Limpia número de teléfono PARA TWILIO (con +)"""
     return numero.replace('whatsapp:', '').replace(' ', '').replace('-', '')
 
-def obtener_conversacion_previa(telefono_limpio, limite=5):
-    """Obtiene contexto de conversación previa (simplificado)"""
+# Candados del resumen repartidos por conversación (cantidad fija): las actualizaciones
+# de una misma conversación se aplican en orden
+CANDADOS_RESUMEN = [threading.Lock() for _ in range(64)]
+
+def _actualizar_resumen(id_conversacion, telefono_limpio, mensaje_cliente, respuesta_agente, id_mensaje=None):
+    """Integra el último intercambio al resumen acumulado de la conversación"""
+    lock = CANDADOS_RESUMEN[zlib.crc32(str(id_conversacion).encode()) % len(CANDADOS_RESUMEN)]
+    
+    with lock:
+        try:
+            # Se lee dentro del lock para partir del resumen que dejó la actualización anterior
+            resumen_previo = manejador_conversaciones.obtener_resumen(telefono_limpio)
+            resumen_nuevo = analizador.actualizar_resumen(resumen_previo, mensaje_cliente, respuesta_agente)
+            if resumen_nuevo:
+                manejador_conversaciones.guardar_resumen(id_conversacion, resumen_nuevo, id_mensaje)
+        except Exception as e:
+            print(f"⚠️ Error actualizando resumen: {e}")
+
+def actualizar_resumen_en_segundo_plano(id_conversacion, telefono_limpio, mensaje_cliente, respuesta_agente, id_mensaje=None):
+    """Actualiza el resumen fuera del camino de respuesta (la llamada al modelo no retrasa el mensaje al cliente)"""
+    threading.Thread(
+        target=_actualizar_resumen,
+        args=(id_conversacion, telefono_limpio, mensaje_cliente, respuesta_agente, id_mensaje),
+        daemon=True
+    ).start()
+
+class EnvioIncremental:
+    """Envía por WhatsApp el texto de la respuesta a medida que se genera, en trozos de tamaño WhatsApp.
+    
+    El primer trozo sale apenas se completa la primera oración; los siguientes se agrupan por párrafo.
+    """
+    
+    def __init__(self, telefono, min_primer_envio=60, min_envio=400):
+        self.numero_destino = f'whatsapp:{limpiar_telefono_twilio(telefono)}'
+        self.min_primer_envio = min_primer_envio
+        self.min_envio = min_envio
+        self.buffer = ""
+        self.texto = ""          # Todo lo recibido hasta ahora
+        self.enviados = []
+        self._cliente = None
+    
+    def agregar(self, texto):
+        self.texto += texto
+        self.buffer += texto
+        self._despachar(final=False)
+    
+    def finalizar(self):
+        self._despachar(final=True)
+        return self.enviados
+    
+    def _despachar(self, final):
+        while True:
+            corte = self._buscar_corte(final)
+            if not corte:
+                return
+            trozo, self.buffer = self.buffer[:corte].strip(), self.buffer[corte:]
+            if trozo:
+                self._enviar(trozo)
+    
+    def _buscar_corte(self, final):
+        """Posición hasta donde enviar el buffer, o None si conviene esperar más texto"""
+        if len(self.buffer) > MAX_CARACTERES_WHATSAPP:
+            ventana = self.buffer[:MAX_CARACTERES_WHATSAPP]
+            return self._ultimo_limite(ventana, r'\n\n') or self._ultimo_limite(ventana, r'[.!?…]\s') \
+                or self._ultimo_limite(ventana, r'\s') or MAX_CARACTERES_WHATSAPP
+        
+        if final:
+            return len(self.buffer) if self.buffer.strip() else None
+        
+        if not self.enviados:
+            # Tiempo a la primera oración: se envía en cuanto hay una oración completa
+            limite = re.search(r'[.!?…](\s)|\n', self.buffer[self.min_primer_envio:])
+            return self.min_primer_envio + limite.end() if limite else None
+        
+        if len(self.buffer) >= self.min_envio:
+            return self._ultimo_limite(self.buffer, r'\n\n')
+        return None
+    
+    def _ultimo_limite(self, texto, patron):
+        limites = [coincidencia.end() for coincidencia in re.finditer(patron, texto)]
+        return limites[-1] if limites else None
+    
+    def _enviar(self, trozo):
+        try:
+            if self._cliente is None:
+                self._cliente = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+            mensaje = self._cliente.messages.create(from_=TWILIO_WHATSAPP_NUMBER, body=trozo, to=self.numero_destino)
+            self.enviados.append(mensaje.sid)
+            print(f"📤 Trozo enviado ({len(trozo)} caracteres): {mensaje.sid}")
+        except Exception as e:
+            print(f"❌ Error enviando trozo de respuesta: {e}")
+
+def guardar_resultado_turno(telefono_limpio, id_conversacion, mensaje_cliente, data, productos_disponibles, id_mensaje=None):
+    """Guarda los intereses en productos y el resumen que devolvió analizar_turno"""
     try:
-        import mysql.connector
-        
-        config = {
-            'host': 'localhost',
-            'user': 'root',
-            'password': '',
-            'database': 'bot_productos_db',
-            'charset': 'utf8mb4'
-        }
-        
-        conexion = mysql.connector.connect(**config)
-        cursor = conexion.cursor(dictionary=True)
-        
-        # Obtener últimos mensajes
-        cursor.execute("""
-            SELECT m.contenido, m.emisor, m.fecha_envio
-            FROM mensaje m
-            INNER JOIN conversacion c ON m.id_conversacion = c.id_conversacion
-            INNER JOIN cliente cl ON c.id_cliente = cl.id_cliente
-            WHERE cl.telefono = %s
-            ORDER BY m.fecha_envio DESC
-            LIMIT %s
-        """, (telefono_limpio, limite))
-        
-        mensajes = cursor.fetchall()
-        conexion.close()
-        
-        # Formatear conversación
-        conversacion = ""
-        for msg in reversed(mensajes):
-            emisor = "Cliente" if msg['emisor'] == 'usuario' else "Vendedor"
-            conversacion += f"{emisor}: {msg['contenido']}\n"
-        
-        return conversacion.strip()
+        intereses = data.get('intereses_productos') or []
+        if intereses:
+            exito = generador_intereses.guardar_intereses_en_bd(telefono_limpio, intereses, productos_disponibles)
+            print(f"💾 Intereses procesados: {'exito' if exito else 'error'}")
         
+        if data.get('resumen_conversacion'):
+            manejador_conversaciones.guardar_resumen(id_conversacion, data['resumen_conversacion'], id_mensaje)
+        else:
+            # El modelo no devolvió el resumen: se actualiza aparte, sin bloquear la respuesta
+            actualizar_resumen_en_segundo_plano(
+                id_conversacion, telefono_limpio, mensaje_cliente, data['respuesta_agente'], id_mensaje
+            )
     except Exception as e:
-        print(f"⚠️ Error obteniendo conversación: {e}")
-        return ""
+        print(f"⚠️ Error guardando resultado del turno: {e}")
 
 def subir_pdf_temporal(filepath, filename):
     """Sube PDF a servicios compatibles (sin transfer.sh)"""
@@ -173,8 +268,38 @@ def enviar_whatsapp_sin_pdf(telefono, mensaje):
             'metodo': 'error_total'
         }
 
-def simular_envio_pdf(telefono, pdf_base64, mensaje):
-    """Envía mensaje + PDF por WhatsApp - VERSION CORREGIDA"""
+def programar_envio_whatsapp(telefono, cuerpo, media_url=None, retraso=0):
+    """Envía un mensaje de WhatsApp dentro de 'retraso' segundos desde la cola de trabajos (ningún hilo queda esperando).
+    Va en el grupo del cliente, que se atiende en orden de llegada a la cola: sale antes que las respuestas a los
+    mensajes que lleguen después de programarlo, pero los que llegaron mientras se atendía el turno actual
+    (ya encolados) se responden primero. Devuelve el id del trabajo."""
+    pool_trabajadores.iniciar()
+    return cola_trabajos.encolar('envio_whatsapp', {
+        'telefono': telefono,
+        'cuerpo': cuerpo,
+        'media_url': media_url
+    }, grupo=limpiar_telefono(telefono), retraso=retraso)
+
+def trabajo_envio_whatsapp(datos):
+    """Trabajo de la cola: envía un mensaje programado (la cola lo reintenta si Twilio falla)"""
+    client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+    parametros = {}
+    if datos.get('media_url'):
+        parametros['media_url'] = [datos['media_url']]
+    
+    mensaje = client.messages.create(
+        from_=TWILIO_WHATSAPP_NUMBER,
+        body=datos['cuerpo'],
+        to=f"whatsapp:{limpiar_telefono_twilio(datos['telefono'])}",
+        **parametros
+    )
+    print(f"📄 Mensaje programado enviado: {mensaje.sid}")
+
+def simular_envio_pdf(telefono, pdf_base64, mensaje, enviar_texto=True):
+    """Envía mensaje + PDF por WhatsApp - VERSION CORREGIDA
+    
+    Con enviar_texto=False solo se envía el PDF (el texto ya salió por streaming).
+    """
     try:
         client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
         numero_destino = f'whatsapp:{limpiar_telefono_twilio(telefono)}'
@@ -194,48 +319,44 @@ def simular_envio_pdf(telefono, pdf_base64, mensaje):
             print(f"📄 PDF guardado: {filepath}")
             
             # ENVIAR MENSAJE PRINCIPAL PRIMERO
-            mensaje_principal = client.messages.create(
-                from_=TWILIO_WHATSAPP_NUMBER,
-                body=mensaje,
-                to=numero_destino
-            )
-            print(f"📱 Mensaje principal enviado: {mensaje_principal.sid}")
+            mensaje_principal = None
+            if enviar_texto:
+                mensaje_principal = client.messages.create(
+                    from_=TWILIO_WHATSAPP_NUMBER,
+                    body=mensaje,
+                    to=numero_destino
+                )
+                print(f"📱 Mensaje principal enviado: {mensaje_principal.sid}")
             
             # INTENTAR ENVIAR PDF
             pdf_url = subir_pdf_temporal(filepath, filename)
-            pdf_sid = None
+            id_envio_pdf = None
             
             if pdf_url:
                 try:
-                    # Esperar un momento antes del PDF
-                    import time
-                    time.sleep(3)
-                    
-                    # ENVIAR PDF COMO ADJUNTO
-                    mensaje_pdf = client.messages.create(
-                        from_=TWILIO_WHATSAPP_NUMBER,
-                        body="📎 Tu documento adjunto:",
-                        media_url=[pdf_url],
-                        to=numero_destino
+                    # ENVIAR PDF COMO ADJUNTO unos segundos después del texto, sin bloquear este hilo
+                    id_envio_pdf = programar_envio_whatsapp(
+                        telefono,
+                        "📎 Tu documento adjunto:",
+                        media_url=pdf_url,
+                        retraso=ESPERA_ENVIO_PDF_SEGUNDOS
                     )
-                    pdf_sid = mensaje_pdf.sid
-                    print(f"📄 PDF enviado: {pdf_sid}")
+                    print(f"📄 PDF programado para dentro de {ESPERA_ENVIO_PDF_SEGUNDOS}s (trabajo {id_envio_pdf})")
                     
                 except Exception as e_pdf:
-                    print(f"⚠️ Error enviando PDF adjunto: {e_pdf}")
+                    print(f"⚠️ Error programando PDF adjunto: {e_pdf}")
                     # PDF falló, pero mensaje principal ya se envió
-                    pdf_sid = None
             
             # ✅ RETORNO CORRECTO - SIEMPRE EXITOSO SI EL MENSAJE SE ENVIÓ
             return {
                 'exito': True,
-                'mensaje_sid': mensaje_principal.sid,
-                'pdf_sid': pdf_sid,
+                'mensaje_sid': mensaje_principal.sid if mensaje_principal else None,
+                'id_envio_pdf': id_envio_pdf,     # El PDF sale después, desde la cola de trabajos
                 'pdf_url': pdf_url if pdf_url else None,
                 'metodo': 'garantizado',  # Cambié de 'twilio_directo' para evitar confusión
                 'archivo_local': filepath
             }
-        else:
+        elif enviar_texto:
             # SIN PDF - Solo mensaje
             mensaje_simple = client.messages.create(
                 from_=TWILIO_WHATSAPP_NUMBER,
@@ -250,6 +371,12 @@ def simular_envio_pdf(telefono, pdf_base64, mensaje):
                 'mensaje_sid': mensaje_simple.sid,
                 'metodo': 'garantizado'
             }
+        else:
+            return {
+                'exito': False,
+                'error': 'PDF inválido',
+                'metodo': 'error'
+            }
             
     except Exception as e:
         print(f"❌ Error total en envío: {e}")
@@ -363,37 +490,12 @@ def enviar_pdf_directo_twilio(telefono, mensaje, pdf_url, filepath):
 # WEBHOOK PRINCIPAL - SIMPLIFICADO
 # ============================================
 
-@app.route('/twilio/webhook', methods=['POST'])
-def webhook_twilio():
-    """Webhook principal simplificado para desarrollo - SIN ERRORES"""
+def procesar_turno(numero_remitente, telefono_limpio, mensaje_entrante, id_conversacion):
+    """Procesa un mensaje ya guardado: comandos, análisis, PDF, intereses y resumen.
+    
+    Devuelve el texto que falta responder al cliente, o None si ya se le envió todo por la API REST.
+    """
     try:
-        # Obtener datos del mensaje
-        mensaje_entrante = request.form.get('Body', '').strip()
-        numero_remitente = request.form.get('From', '')
-        
-        print(f"\n📥 MENSAJE RECIBIDO")
-        print(f"De: {numero_remitente}")
-        print(f"Mensaje: {mensaje_entrante}")
-        print("-" * 50)
-        
-        # Limpiar teléfono
-        telefono_limpio = limpiar_telefono(numero_remitente)
-        
-        # Procesar mensaje en BD
-        datos_conversacion = manejador_conversaciones.procesar_mensaje_entrante(
-            telefono_limpio, 
-            mensaje_entrante
-        )
-        
-        if not datos_conversacion:
-            print("❌ Error procesando mensaje")
-            respuesta = MessagingResponse()
-            respuesta.message("Lo siento, hubo un error. Intenta de nuevo.")
-            return str(respuesta)
-        
-        id_conversacion = datos_conversacion['id_conversacion']
-        print(f"✅ Conversación ID: {id_conversacion}")
-        
         # COMANDOS ESPECIALES
         mensaje_lower = mensaje_entrante.lower()
         
@@ -411,14 +513,8 @@ def webhook_twilio():
             # ✅ CORRECCIÓN: NO enviar TwiML adicional para comandos especiales
             # Ya se procesó todo en simular_envio_pdf
             
-            # Procesar intereses para el comando
-            try:
-                resultado_intereses = generador_intereses.procesar_intereses_cliente(
-                    telefono_limpio, "chat_auto", mensaje_entrante
-                )
-                print(f"💾 Intereses procesados: {resultado_intereses.get('estado')}")
-            except Exception as ei:
-                print(f"⚠️ Error procesando intereses: {ei}")
+            # Intereses del comando: se extraen después, fuera del camino de la respuesta
+            extractor_intereses.programar(telefono_limpio, mensaje_entrante)
             
             # Guardar en BD (el mensaje ya se envió por simular_envio_pdf)
             texto_para_bd = "📊 Tu reporte personalizado de intereses:"
@@ -427,8 +523,8 @@ def webhook_twilio():
             print(f"✅ COMANDO PROCESADO: PDF de intereses enviado")
             print("=" * 50)
             
-            # NO retornar TwiML - ya se manejó en simular_envio_pdf
-            return "OK", 200
+            # Nada más que responder - ya se manejó en simular_envio_pdf
+            return None
         
         # Comando: Estado del sistema
         if 'estado' in mensaje_lower or 'status' in mensaje_lower:
@@ -446,41 +542,45 @@ Comandos disponibles:
 • Pregunta sobre productos gaming"""
             
             manejador_conversaciones.guardar_respuesta_bot(id_conversacion, estado_msg)
-            respuesta = MessagingResponse()
-            respuesta.message(estado_msg)
-            return str(respuesta)
+            return estado_msg
         
         # ANÁLISIS PRINCIPAL
         print("🤖 Analizando mensaje con IA...")
         
-        # Obtener contexto
-        conversacion_previa = obtener_conversacion_previa(telefono_limpio)
+        # Obtener contexto (resumen acumulado) y productos para validar intereses
+        resumen_conversacion = manejador_conversaciones.obtener_resumen(telefono_limpio)
+        productos_disponibles = generador_intereses.obtener_productos_disponibles()
         
-        # Analizar con tu sistema
-        resultado_analisis = analizador.analizar_pregunta(mensaje_entrante, conversacion_previa)
+        # Una sola llamada: respuesta, interés, intereses en productos y resumen actualizado.
+        # En streaming la respuesta sale por la API REST mientras se genera el resto del JSON
+        envio = EnvioIncremental(numero_remitente) if STREAMING_RESPUESTAS else None
+        resultado_analisis = analizador.analizar_turno(
+            mensaje_entrante, resumen_conversacion, productos_disponibles,
+            al_recibir_respuesta=envio.agregar if envio else None
+        )
         
         if resultado_analisis['status'] != 'success':
             print(f"❌ Error en análisis: {resultado_analisis}")
             respuesta_texto = "Disculpa, no pude procesar tu consulta. ¿Puedes reformular tu pregunta sobre productos gaming?"
             
-            # Procesar sin PDF
-            try:
-                resultado_intereses = generador_intereses.procesar_intereses_cliente(
-                    telefono_limpio, "chat_auto", mensaje_entrante
-                )
-                print(f"💾 Intereses procesados: {resultado_intereses.get('estado')}")
-            except Exception as ei:
-                print(f"⚠️ Error procesando intereses: {ei}")
+            if envio and envio.enviados:
+                # El cliente ya recibió parte de la respuesta: no se le envía el mensaje de error
+                envio.finalizar()
+                manejador_conversaciones.guardar_respuesta_bot(id_conversacion, envio.texto)
+                return None
             
-            manejador_conversaciones.guardar_respuesta_bot(id_conversacion, respuesta_texto)
+            # Sin análisis no hay intereses del turno: se extraen después, fuera del camino de la respuesta
+            extractor_intereses.programar(telefono_limpio, mensaje_entrante)
             
-            respuesta = MessagingResponse()
-            respuesta.message(respuesta_texto)
-            return str(respuesta)
+            manejador_conversaciones.guardar_respuesta_bot(id_conversacion, respuesta_texto)
+            return respuesta_texto
         else:
             data = resultado_analisis['data']
             respuesta_texto = data['respuesta_agente']
             
+            # Enviar lo que quede de la respuesta en streaming
+            enviada_por_streaming = bool(envio and envio.finalizar())
+            
             # Manejar PDF si se generó
             pdf_generado = data.get('pdf_generado')
             tipo_interes = data.get('tipo_interes')
@@ -492,63 +592,166 @@ Comandos disponibles:
                 resultado_pdf = simular_envio_pdf(
                     numero_remitente,
                     pdf_generado,
-                    respuesta_texto
+                    respuesta_texto,
+                    enviar_texto=not enviada_por_streaming
                 )
                 
-                # Procesar intereses en background
-                try:
-                    resultado_intereses = generador_intereses.procesar_intereses_cliente(
-                        telefono_limpio, "chat_auto", mensaje_entrante
-                    )
-                    print(f"💾 Intereses procesados: {resultado_intereses.get('estado')}")
-                except Exception as ei:
-                    print(f"⚠️ Error procesando intereses: {ei}")
-                
                 # Guardar respuesta en BD
-                manejador_conversaciones.guardar_respuesta_bot(id_conversacion, respuesta_texto)
+                id_respuesta = manejador_conversaciones.guardar_respuesta_bot(id_conversacion, respuesta_texto)
                 
                 # ✅ VERIFICAR SI SE ENVIÓ CORRECTAMENTE
                 if resultado_pdf.get('exito'):
+                    guardar_resultado_turno(telefono_limpio, id_conversacion, mensaje_entrante, data, productos_disponibles, id_respuesta)
+                    
                     print(f"✅ PDF y mensaje enviados exitosamente")
                     print(f"   📧 Mensaje SID: {resultado_pdf.get('mensaje_sid')}")
-                    print(f"   📄 PDF SID: {resultado_pdf.get('pdf_sid', 'N/A')}")
+                    print(f"   📄 Envío de PDF programado: {resultado_pdf.get('id_envio_pdf') or 'N/A'}")
                     print("=" * 50)
                     
-                    # NO retornar TwiML - ya se envió todo
-                    return "OK", 200
+                    # Nada más que responder - ya se envió todo
+                    return None
                 else:
                     print(f"⚠️ Error enviando PDF: {resultado_pdf.get('error')}")
                     # Continuar con envío normal como fallback
-                    respuesta_texto += "\n\n📄 PDF generado pero no se pudo enviar adjunto."
+                    aviso_pdf = "📄 PDF generado pero no se pudo enviar adjunto."
+                    if enviada_por_streaming:
+                        manejador_conversaciones.guardar_respuesta_bot(id_conversacion, respuesta_texto)
+                        return aviso_pdf
+                    respuesta_texto += f"\n\n{aviso_pdf}"
             
             # SI NO HAY PDF O FALLÓ EL ENVÍO - Enviar respuesta normal
-            try:
-                resultado_intereses = generador_intereses.procesar_intereses_cliente(
-                    telefono_limpio, "chat_auto", mensaje_entrante
-                )
-                print(f"💾 Intereses procesados: {resultado_intereses.get('estado')}")
-            except Exception as ei:
-                print(f"⚠️ Error procesando intereses: {ei}")
-            
             # Guardar respuesta
-            manejador_conversaciones.guardar_respuesta_bot(id_conversacion, respuesta_texto)
+            id_respuesta = manejador_conversaciones.guardar_respuesta_bot(id_conversacion, respuesta_texto)
+            
+            # Intereses y resumen ya vienen en el análisis del turno (sin llamadas extra al modelo)
+            guardar_resultado_turno(telefono_limpio, id_conversacion, mensaje_entrante, data, productos_disponibles, id_respuesta)
             
             print(f"✅ RESPUESTA ENVIADA: {respuesta_texto[:100]}...")
             print("=" * 50)
             
-            # Enviar respuesta TwiML normal
-            respuesta = MessagingResponse()
-            respuesta.message(respuesta_texto)
-            return str(respuesta)
+            if enviada_por_streaming:
+                # Ya se envió por la API REST
+                return None
+            
+            return respuesta_texto
+        
+    except Exception as e:
+        print(f"❌ ERROR PROCESANDO TURNO: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return "Ocurrió un error interno. El equipo técnico ha sido notificado."
+
+def responder_twiml(texto=None):
+    """TwiML de respuesta al webhook (vacío si no hay texto)"""
+    respuesta = MessagingResponse()
+    if texto:
+        respuesta.message(texto)
+    return str(respuesta)
+
+def candado_cliente(telefono_limpio):
+    """Candado del cliente en modo síncrono: sus mensajes se atienden de a uno (los de otros clientes no esperan)"""
+    return CANDADOS_CLIENTES[zlib.crc32(telefono_limpio.encode()) % len(CANDADOS_CLIENTES)]
+
+def atender_mensajes(numero_remitente, mensajes):
+    """Guarda los mensajes en su conversación y los responde en un solo turno. Devuelve el texto que falta responder.
+    
+    Debe correr de a un turno por cliente: obtener_conversacion_activa/crear_conversacion en paralelo
+    para el mismo teléfono abrirían dos conversaciones.
+    """
+    telefono_limpio = limpiar_telefono(numero_remitente)
+    
+    # Procesar mensaje en BD (cada mensaje de la ráfaga se guarda por separado)
+    datos_conversacion = manejador_conversaciones.procesar_mensaje_entrante(
+        telefono_limpio, 
+        mensajes[0]
+    )
+    
+    if not datos_conversacion:
+        print("❌ Error procesando mensaje")
+        return "Lo siento, hubo un error. Intenta de nuevo."
+    
+    id_conversacion = datos_conversacion['id_conversacion']
+    print(f"✅ Conversación ID: {id_conversacion}")
+    
+    for mensaje in mensajes[1:]:
+        manejador_conversaciones.guardar_mensaje(id_conversacion, mensaje, 'usuario')
+    
+    if len(mensajes) > 1:
+        print(f"🧩 {len(mensajes)} mensajes seguidos respondidos en un solo turno")
+    
+    return procesar_turno(numero_remitente, telefono_limpio, "\n".join(mensajes), id_conversacion)
+
+def trabajo_turno_whatsapp(lote):
+    """Trabajo de la cola: atiende los mensajes del lote y responde por la API REST de Twilio.
+    La cola entrega los mensajes de un mismo cliente en orden (grupo = teléfono), juntos si llegaron en ráfaga."""
+    numero_remitente = lote[0]['numero_remitente']
+    try:
+        texto = atender_mensajes(numero_remitente, [datos['mensaje'] for datos in lote])
+        if texto:
+            envio = EnvioIncremental(numero_remitente)
+            envio.agregar(texto)
+            if not envio.finalizar():
+                raise RuntimeError("No se pudo enviar la respuesta por la API REST de Twilio")
+    except Exception:
+        # El turno tiene un solo intento y queda en error: el cliente recibe la misma disculpa que en modo síncrono
+        disculpa = EnvioIncremental(numero_remitente)
+        disculpa.agregar("Ocurrió un error interno. El equipo técnico ha sido notificado.")
+        disculpa.finalizar()
+        raise
+
+pool_trabajadores = PoolTrabajadores(
+    cola_trabajos,
+    {'turno_whatsapp': trabajo_turno_whatsapp, 'envio_whatsapp': trabajo_envio_whatsapp},
+    num_trabajadores=NUM_TRABAJADORES,
+    tipos_en_lote=('turno_whatsapp',)
+)
+
+@app.route('/twilio/webhook', methods=['POST'])
+def webhook_twilio():
+    """Webhook principal. En modo asíncrono solo encola el mensaje (persistido en la cola) y responde 200
+    al instante; un trabajador lo procesa y responde por la API REST."""
+    try:
+        # Obtener datos del mensaje
+        mensaje_entrante = request.form.get('Body', '').strip()
+        numero_remitente = request.form.get('From', '')
+        id_mensaje_twilio = request.form.get('MessageSid')
+        
+        print(f"\n📥 MENSAJE RECIBIDO")
+        print(f"De: {numero_remitente}")
+        print(f"Mensaje: {mensaje_entrante}")
+        print("-" * 50)
+        
+        # Limpiar teléfono
+        telefono_limpio = limpiar_telefono(numero_remitente)
+        
+        if PROCESAMIENTO_ASINCRONO:
+            pool_trabajadores.iniciar()
+            # Clave: Twilio reintenta el webhook si no le respondemos a tiempo y un MessageSid se atiende una sola vez.
+            # Grupo: los mensajes de un cliente se atienden en orden; los de clientes distintos, en paralelo.
+            # Ventana: los mensajes en ráfaga del cliente se juntan en un solo turno.
+            # Un solo intento: reintentar repetiría la llamada al modelo y la respuesta al cliente
+            id_trabajo = cola_trabajos.encolar('turno_whatsapp', {
+                'numero_remitente': numero_remitente,
+                'mensaje': mensaje_entrante
+            }, clave=id_mensaje_twilio, grupo=telefono_limpio, max_intentos=1,
+               ventana_agrupacion=VENTANA_AGRUPACION_SEGUNDOS, espera_maxima=ESPERA_MAXIMA_AGRUPACION)
+            
+            if id_trabajo is None:
+                print(f"↩️ Reintento de Twilio ignorado: {id_mensaje_twilio}")
+            else:
+                print("📨 Mensaje encolado, la respuesta sale por la API REST")
+            return responder_twiml()
+        
+        with candado_cliente(telefono_limpio):
+            return responder_twiml(atender_mensajes(numero_remitente, [mensaje_entrante]))
         
     except Exception as e:
         print(f"❌ ERROR EN WEBHOOK: {str(e)}")
         import traceback
         traceback.print_exc()
         
-        respuesta = MessagingResponse()
-        respuesta.message("Ocurrió un error interno. El equipo técnico ha sido notificado.")
-        return str(respuesta)
+        return responder_twiml("Ocurrió un error interno. El equipo técnico ha sido notificado.")
+
 # ============================================
 # ENDPOINTS DE PRUEBA LOCAL
 # ============================================
@@ -569,12 +772,16 @@ def test_mensaje():
         
         if datos_conv:
             # Analizar
-            conversacion_previa = obtener_conversacion_previa(telefono_limpio)
-            resultado = analizador.analizar_pregunta(mensaje, conversacion_previa)
+            resumen_conversacion = manejador_conversaciones.obtener_resumen(telefono_limpio)
+            productos_disponibles = generador_intereses.obtener_productos_disponibles()
+            resultado = analizador.analizar_turno(mensaje, resumen_conversacion, productos_disponibles)
             
             if resultado['status'] == 'success':
                 respuesta_agente = resultado['data']['respuesta_agente']
-                manejador_conversaciones.guardar_respuesta_bot(datos_conv['id_conversacion'], respuesta_agente)
+                id_respuesta = manejador_conversaciones.guardar_respuesta_bot(datos_conv['id_conversacion'], respuesta_agente)
+                guardar_resultado_turno(
+                    telefono_limpio, datos_conv['id_conversacion'], mensaje, resultado['data'], productos_disponibles, id_respuesta
+                )
                 
                 return jsonify({
                     'exito': True,
@@ -655,6 +862,21 @@ def generar_pdf_local():
     
 
 
+@app.route('/api/sincronizar_base_conocimiento', methods=['POST'])
+def sincronizar_base_conocimiento():
+    """Aplica los cambios del catálogo (productos, promociones, colecciones, sucursales) a la base de conocimiento.
+    Llamar después de editar el catálogo: solo se re-embeben las entidades cuyo texto cambió."""
+    try:
+        resultado = entrenamiento_fino.gestor_bd.sincronizar_base_conocimiento()
+        return jsonify({
+            'exito': True,
+            'cambios': resultado,
+            'version_catalogo': entrenamiento_fino.gestor_bd.version_catalogo
+        })
+        
+    except Exception as e:
+        return jsonify({'exito': False, 'error': str(e)})
+
 @app.route('/api/health', methods=['GET'])
 def health():
     """Estado del sistema"""
@@ -683,10 +905,15 @@ def health():
         'webhook_url': '/twilio/webhook',
         'pdf_enabled': True,
         'servicios_pdf': ['file.io', '0x0.st'],
+        'cache_embeddings': entrenamiento_fino.gestor_bd.estadisticas_cache_embeddings(),
+        'cache_respuestas': entrenamiento_fino.estadisticas_cache_respuestas(),
+        'cola_trabajos': cola_trabajos.estadisticas(),
+        'intereses_diferidos': extractor_intereses.estadisticas(),
         'endpoints_test': {
             'test_mensaje': '/api/test_mensaje (POST)',
             'enviar_whatsapp': '/api/enviar_whatsapp_local (POST)',
-            'generar_pdf': '/api/generar_pdf_local (POST)'
+            'generar_pdf': '/api/generar_pdf_local (POST)',
+            'sincronizar_base_conocimiento': '/api/sincronizar_base_conocimiento (POST)'
         }
     })
 
@@ -717,7 +944,8 @@ def home():
             'health': '/api/health',
             'test_mensaje': '/api/test_mensaje',
             'enviar_whatsapp': '/api/enviar_whatsapp_local',
-            'generar_pdf': '/api/generar_pdf_local'
+            'generar_pdf': '/api/generar_pdf_local',
+            'sincronizar_base_conocimiento': '/api/sincronizar_base_conocimiento'
         }
     })
 
@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+class CacheRespuestasSemantica:
+    """Caché de respuestas del vendedor para preguntas casi repetidas ("qué laptops tienen" / "tienen laptops?").
+
+    Una respuesta se reutiliza solo si:
+      - la pregunta es semánticamente similar (coseno >= umbral_similitud),
+      - la búsqueda recuperó exactamente los mismos documentos,
+      - la consulta es del mismo espacio (ej. el mismo prompt y formato de respuesta), y
+      - la versión del catálogo no cambió (cada sincronización con cambios invalida toda la caché).
+    """
+    
+    def __init__(self, umbral_similitud=0.95, max_entradas=2000, ttl_segundos=24 * 3600):
+        self.umbral_similitud = umbral_similitud
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        
+        self.version_catalogo = None
+        self._entradas = OrderedDict()  # id entrada -> (grupo, vector normalizado, respuesta, timestamp)
+        self._grupos = {}               # (espacio, documentos recuperados) -> ids de entradas
+        self._siguiente_id = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+    
+    def _normalizar(self, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norma = np.linalg.norm(vector)
+        return vector / norma if norma else vector
+    
+    def _verificar_version(self, version_catalogo):
+        """Si el catálogo cambió desde la última consulta, ninguna respuesta guardada es válida"""
+        if version_catalogo != self.version_catalogo:
+            if self._entradas:
+                print(f"🧹 Caché de respuestas invalidada ({len(self._entradas)} entradas, catálogo v{version_catalogo})")
+            self._entradas.clear()
+            self._grupos.clear()
+            self.version_catalogo = version_catalogo
+    
+    def buscar(self, vector, ids_documentos, version_catalogo, espacio=None):
+        """Respuesta guardada para una pregunta similar con los mismos documentos y espacio, o None"""
+        grupo = (espacio, frozenset(ids_documentos))
+        vector = self._normalizar(vector)
+        ahora = time.time()
+        
+        with self._lock:
+            self._verificar_version(version_catalogo)
+            
+            ids_entradas = [
+                id_entrada for id_entrada in self._grupos.get(grupo, ())
+                if ahora - self._entradas[id_entrada][3] < self.ttl_segundos
+            ]
+            if ids_entradas:
+                similitudes = np.stack([self._entradas[id_entrada][1] for id_entrada in ids_entradas]) @ vector
+                mejor = int(np.argmax(similitudes))
+                if similitudes[mejor] >= self.umbral_similitud:
+                    id_entrada = ids_entradas[mejor]
+                    self._entradas.move_to_end(id_entrada)
+                    self.aciertos += 1
+                    return self._entradas[id_entrada][2]
+            
+            self.fallos += 1
+            return None
+    
+    def guardar(self, vector, ids_documentos, version_catalogo, respuesta, espacio=None):
+        grupo = (espacio, frozenset(ids_documentos))
+        
+        with self._lock:
+            self._verificar_version(version_catalogo)
+            
+            id_entrada = self._siguiente_id
+            self._siguiente_id += 1
+            self._entradas[id_entrada] = (grupo, self._normalizar(vector), respuesta, time.time())
+            self._grupos.setdefault(grupo, []).append(id_entrada)
+            
+            while len(self._entradas) > self.max_entradas:
+                id_viejo, (grupo_viejo, _, _, _) = self._entradas.popitem(last=False)
+                self._grupos[grupo_viejo].remove(id_viejo)
+                if not self._grupos[grupo_viejo]:
+                    del self._grupos[grupo_viejo]
+    
+    def invalidar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._grupos.clear()
+    
+    def estadisticas(self):
+        """Aciertos, fallos, tasa de aciertos y tamaño de la caché"""
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': round(self.aciertos / total, 4) if total else 0.0,
+                'entradas': len(self._entradas),
+                'max_entradas': self.max_entradas,
+                'version_catalogo': self.version_catalogo
+            }
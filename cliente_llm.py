@@ -0,0 +1,298 @@
+import asyncio
+import json
+import random
+import threading
+import time
+import weakref
+import httpx
+from openai import OpenAI, AsyncOpenAI
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+# HTTP/2 solo si el paquete h2 está instalado; si no, HTTP/1.1 con keep-alive
+try:
+    import h2  # noqa: F401
+    HTTP2_DISPONIBLE = True
+except ImportError:
+    HTTP2_DISPONIBLE = False
+
+# Respuestas que vale la pena reintentar
+ESTADOS_REINTENTABLES = {408, 409, 429, 500, 502, 503, 504}
+
+def _modelo_de(request):
+    """Modelo pedido en el cuerpo JSON de la request (clave del límite de concurrencia)"""
+    try:
+        return json.loads(request.content or b"{}").get("model") or "default"
+    except (ValueError, AttributeError):
+        return "default"
+
+def _espera_reintento(intento, respuesta=None):
+    """Retry-After si la API lo envía; si no, backoff exponencial con jitter completo"""
+    if respuesta is not None:
+        try:
+            return float(respuesta.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            pass
+    return random.uniform(0, min(2 ** intento, 20))
+
+class _StreamConLiberacion(httpx.SyncByteStream):
+    """Mantiene ocupado el cupo del modelo hasta que se termina de leer la respuesta (streaming incluido)"""
+    
+    def __init__(self, stream, liberar):
+        self._stream = stream
+        self._liberar = liberar
+    
+    def __iter__(self):
+        yield from self._stream
+    
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._liberar()
+
+class _StreamConLiberacionAsync(httpx.AsyncByteStream):
+    def __init__(self, stream, liberar):
+        self._stream = stream
+        self._liberar = liberar
+    
+    async def __aiter__(self):
+        async for parte in self._stream:
+            yield parte
+    
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._liberar()
+
+class TransporteLLM(httpx.BaseTransport):
+    """Transporte httpx con límite de concurrencia por modelo, reintentos con jitter y presupuesto de tiempo"""
+    
+    def __init__(self, cliente, transporte):
+        self._cliente = cliente
+        self._transporte = transporte
+    
+    def handle_request(self, request):
+        limite = time.monotonic() + self._cliente.presupuesto_segundos
+        semaforo = self._cliente.semaforo(_modelo_de(request))
+        
+        for intento in range(self._cliente.max_reintentos + 1):
+            if not semaforo.acquire(timeout=max(limite - time.monotonic(), 0)):
+                raise httpx.PoolTimeout("Sin cupo para el modelo dentro del presupuesto de tiempo", request=request)
+            
+            liberado = threading.Event()
+            
+            def liberar():
+                if not liberado.is_set():
+                    liberado.set()
+                    semaforo.release()
+            
+            try:
+                respuesta = self._transporte.handle_request(request)
+            except (httpx.TimeoutException, httpx.NetworkError):
+                liberar()
+                espera = _espera_reintento(intento)
+                if intento == self._cliente.max_reintentos or time.monotonic() + espera > limite:
+                    raise
+                time.sleep(espera)
+                continue
+            except Exception:
+                liberar()
+                raise
+            
+            if respuesta.status_code in ESTADOS_REINTENTABLES and intento < self._cliente.max_reintentos:
+                espera = _espera_reintento(intento, respuesta)
+                if time.monotonic() + espera <= limite:
+                    respuesta.close()
+                    liberar()
+                    print(f"⏳ OpenAI {respuesta.status_code}, reintentando en {espera:.1f}s")
+                    time.sleep(espera)
+                    continue
+            
+            return httpx.Response(
+                status_code=respuesta.status_code,
+                headers=respuesta.headers,
+                stream=_StreamConLiberacion(respuesta.stream, liberar),
+                extensions=respuesta.extensions,
+                request=request
+            )
+    
+    def close(self):
+        self._transporte.close()
+
+class TransporteLLMAsync(httpx.AsyncBaseTransport):
+    """Versión asyncio de TransporteLLM"""
+    
+    def __init__(self, cliente, transporte):
+        self._cliente = cliente
+        self._transporte = transporte
+    
+    async def handle_async_request(self, request):
+        limite = time.monotonic() + self._cliente.presupuesto_segundos
+        semaforo = self._cliente.semaforo_async(_modelo_de(request))
+        
+        for intento in range(self._cliente.max_reintentos + 1):
+            try:
+                await asyncio.wait_for(semaforo.acquire(), timeout=max(limite - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                raise httpx.PoolTimeout("Sin cupo para el modelo dentro del presupuesto de tiempo", request=request)
+            
+            liberado = []
+            
+            def liberar():
+                if not liberado:
+                    liberado.append(True)
+                    semaforo.release()
+            
+            try:
+                respuesta = await self._transporte.handle_async_request(request)
+            except (httpx.TimeoutException, httpx.NetworkError):
+                liberar()
+                espera = _espera_reintento(intento)
+                if intento == self._cliente.max_reintentos or time.monotonic() + espera > limite:
+                    raise
+                await asyncio.sleep(espera)
+                continue
+            except Exception:
+                liberar()
+                raise
+            
+            if respuesta.status_code in ESTADOS_REINTENTABLES and intento < self._cliente.max_reintentos:
+                espera = _espera_reintento(intento, respuesta)
+                if time.monotonic() + espera <= limite:
+                    await respuesta.aclose()
+                    liberar()
+                    print(f"⏳ OpenAI {respuesta.status_code}, reintentando en {espera:.1f}s")
+                    await asyncio.sleep(espera)
+                    continue
+            
+            return httpx.Response(
+                status_code=respuesta.status_code,
+                headers=respuesta.headers,
+                stream=_StreamConLiberacionAsync(respuesta.stream, liberar),
+                extensions=respuesta.extensions,
+                request=request
+            )
+    
+    async def aclose(self):
+        await self._transporte.aclose()
+
+class ClienteLLM:
+    """Capa única de acceso a OpenAI compartida por todos los módulos.
+
+    Un pool de conexiones keep-alive (HTTP/2 si está disponible) para clientes sync y asyncio,
+    límite de requests simultáneos por modelo, reintentos con jitter y presupuesto de tiempo por llamada.
+    """
+    
+    _instancia = None
+    _lock_instancia = threading.Lock()
+    
+    @classmethod
+    def obtener(cls, api_key=""):
+        """Instancia compartida del proceso (se crea con la primera api_key recibida)"""
+        with cls._lock_instancia:
+            if cls._instancia is None:
+                cls._instancia = cls(api_key)
+            return cls._instancia
+    
+    def __init__(self, api_key=""):
+        self.api_key = api_key
+        
+        # Requests simultáneos por modelo (el resto espera su turno)
+        self.limites_modelo = {
+            'gpt-4-turbo': 8,
+            'gpt-4o-mini': 16,
+            'text-embedding-ada-002': 8,
+            'default': 8
+        }
+        self.max_reintentos = 4
+        self.presupuesto_segundos = 90          # Tiempo total por llamada, incluidos reintentos y esperas
+        self.timeout = httpx.Timeout(60.0, connect=5.0)
+        
+        self._semaforos = {}
+        self._semaforos_async = weakref.WeakKeyDictionary()   # event loop -> {modelo: asyncio.Semaphore}
+        self._lock = threading.Lock()
+        
+        limites = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=120)
+        self.http_client = httpx.Client(
+            transport=TransporteLLM(self, httpx.HTTPTransport(http2=HTTP2_DISPONIBLE, limits=limites)),
+            timeout=self.timeout
+        )
+        self.http_client_async = httpx.AsyncClient(
+            transport=TransporteLLMAsync(self, httpx.AsyncHTTPTransport(http2=HTTP2_DISPONIBLE, limits=limites)),
+            timeout=self.timeout
+        )
+        
+        # Los reintentos los maneja el transporte (con límites y jitter), no el SDK
+        self.openai = OpenAI(api_key=api_key, http_client=self.http_client, max_retries=0)
+        self.openai_async = AsyncOpenAI(api_key=api_key, http_client=self.http_client_async, max_retries=0)
+        
+        print(f"🔌 Cliente LLM compartido ({'HTTP/2' if HTTP2_DISPONIBLE else 'HTTP/1.1 keep-alive'})")
+    
+    def semaforo(self, modelo):
+        with self._lock:
+            if modelo not in self._semaforos:
+                limite = self.limites_modelo.get(modelo, self.limites_modelo['default'])
+                self._semaforos[modelo] = threading.BoundedSemaphore(limite)
+            return self._semaforos[modelo]
+    
+    def semaforo_async(self, modelo):
+        # Los semáforos asyncio pertenecen a un event loop: uno por loop y modelo.
+        # Un semáforo que tuvo que esperar guarda referencia a su loop, así que los loops
+        # cerrados se quitan a mano (la referencia débil sola no alcanza para liberarlos)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            for loop_cerrado in [otro for otro in self._semaforos_async if otro.is_closed()]:
+                del self._semaforos_async[loop_cerrado]
+            
+            semaforos = self._semaforos_async.setdefault(loop, {})
+            if modelo not in semaforos:
+                limite = self.limites_modelo.get(modelo, self.limites_modelo['default'])
+                semaforos[modelo] = asyncio.Semaphore(limite)
+            return semaforos[modelo]
+    
+    # ============================================
+    # INTERFAZ SYNC Y ASYNCIO
+    # ============================================
+    
+    def chat(self, modelo, mensajes, **parametros):
+        """Chat completion; devuelve el texto de la respuesta"""
+        respuesta = self.openai.chat.completions.create(model=modelo, messages=mensajes, **parametros)
+        return respuesta.choices[0].message.content
+    
+    async def chat_async(self, modelo, mensajes, **parametros):
+        respuesta = await self.openai_async.chat.completions.create(model=modelo, messages=mensajes, **parametros)
+        return respuesta.choices[0].message.content
+    
+    def embeddings(self, modelo, textos):
+        """Embeddings de un lote de textos, en el mismo orden"""
+        respuesta = self.openai.embeddings.create(input=textos, model=modelo)
+        return [dato.embedding for dato in sorted(respuesta.data, key=lambda dato: dato.index)]
+    
+    async def embeddings_async(self, modelo, textos):
+        respuesta = await self.openai_async.embeddings.create(input=textos, model=modelo)
+        return [dato.embedding for dato in sorted(respuesta.data, key=lambda dato: dato.index)]
+    
+    # ============================================
+    # CLIENTES LANGCHAIN SOBRE EL MISMO POOL
+    # ============================================
+    
+    def chat_langchain(self, modelo, temperature=0.2, **parametros):
+        return ChatOpenAI(
+            openai_api_key=self.api_key,
+            model_name=modelo,
+            temperature=temperature,
+            http_client=self.http_client,
+            http_async_client=self.http_client_async,
+            max_retries=0,
+            **parametros
+        )
+    
+    def embeddings_langchain(self, modelo="text-embedding-ada-002"):
+        return OpenAIEmbeddings(
+            openai_api_key=self.api_key,
+            model=modelo,
+            http_client=self.http_client,
+            http_async_client=self.http_client_async,
+            max_retries=0
+        )
@@ -0,0 +1,263 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from contextlib import closing
+
+class ColaTrabajos:
+    """Cola de trabajos persistente en SQLite (sobrevive reinicios y puede compartirse entre procesos).
+
+    Un trabajo tomado queda reservado por 'duracion_reserva' segundos: si el proceso muere a mitad,
+    vuelve a estar disponible cuando vence la reserva.
+
+    Los trabajos con el mismo 'grupo' (ej. el teléfono del cliente) se entregan de a uno y en orden de
+    llegada; los de grupos distintos se procesan en paralelo. Los trabajos encolados con ventana de
+    agrupación se entregan juntos: todos los pendientes del grupo en un solo lote.
+    """
+    
+    COLUMNAS_AGREGADAS = {'grupo': 'TEXT', 'agrupable': 'INTEGER NOT NULL DEFAULT 0'}
+    
+    def __init__(self, ruta, duracion_reserva=300):
+        self.ruta = ruta
+        self.duracion_reserva = duracion_reserva
+        self._hay_trabajo = threading.Condition()
+        self._crear_tabla()
+    
+    def _conectar(self):
+        conexion = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+        conexion.row_factory = sqlite3.Row
+        return conexion
+    
+    def _crear_tabla(self):
+        with closing(self._conectar()) as conexion:
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("""
+                CREATE TABLE IF NOT EXISTS trabajos (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tipo TEXT NOT NULL,
+                    datos TEXT NOT NULL,
+                    clave TEXT UNIQUE,
+                    grupo TEXT,
+                    agrupable INTEGER NOT NULL DEFAULT 0,
+                    estado TEXT NOT NULL DEFAULT 'pendiente',
+                    intentos INTEGER NOT NULL DEFAULT 0,
+                    max_intentos INTEGER NOT NULL DEFAULT 3,
+                    disponible_en REAL NOT NULL,
+                    error TEXT,
+                    creado_en REAL NOT NULL,
+                    actualizado_en REAL NOT NULL
+                )
+            """)
+            # Colas creadas con una versión anterior de la tabla
+            columnas = {fila['name'] for fila in conexion.execute("PRAGMA table_info(trabajos)")}
+            for columna, definicion in self.COLUMNAS_AGREGADAS.items():
+                if columna not in columnas:
+                    conexion.execute(f"ALTER TABLE trabajos ADD COLUMN {columna} {definicion}")
+            conexion.execute("CREATE INDEX IF NOT EXISTS idx_trabajos_estado ON trabajos (estado, disponible_en)")
+            conexion.execute("CREATE INDEX IF NOT EXISTS idx_trabajos_grupo ON trabajos (grupo, estado)")
+    
+    def encolar(self, tipo, datos, clave=None, grupo=None, retraso=0, max_intentos=3, ventana_agrupacion=0, espera_maxima=None):
+        """Agrega un trabajo; con clave (ej. el MessageSid de Twilio) un duplicado se ignora.
+        Devuelve el id del trabajo, o None si la clave ya estaba encolada.
+
+        Con ventana_agrupacion (requiere grupo) el trabajo espera esos segundos por si llegan más del mismo
+        grupo y tipo: cada uno nuevo posterga a los pendientes, hasta espera_maxima desde que se encoló cada uno.
+        """
+        ahora = time.time()
+        agrupable = bool(ventana_agrupacion and grupo)
+        if agrupable:
+            retraso = max(retraso, ventana_agrupacion)
+        
+        conexion = self._conectar()
+        try:
+            conexion.execute("BEGIN IMMEDIATE")
+            cursor = conexion.execute(
+                "INSERT OR IGNORE INTO trabajos (tipo, datos, clave, grupo, agrupable, max_intentos, disponible_en, creado_en, actualizado_en) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (tipo, json.dumps(datos, ensure_ascii=False, default=str), clave, grupo, int(agrupable), max_intentos,
+                 ahora + retraso, ahora, ahora)
+            )
+            id_trabajo = cursor.lastrowid if cursor.rowcount else None
+            
+            if agrupable and id_trabajo is not None:
+                espera_maxima = espera_maxima if espera_maxima is not None else ventana_agrupacion
+                conexion.execute("""
+                    UPDATE trabajos SET disponible_en = MIN(?, creado_en + ?)
+                    WHERE grupo = ? AND tipo = ? AND agrupable = 1 AND estado = 'pendiente' AND id < ?
+                """, (ahora + ventana_agrupacion, espera_maxima, grupo, tipo, id_trabajo))
+            conexion.execute("COMMIT")
+        
+        except Exception:
+            conexion.execute("ROLLBACK")
+            raise
+        finally:
+            conexion.close()
+        
+        with self._hay_trabajo:
+            self._hay_trabajo.notify()
+        return id_trabajo
+    
+    def contiene(self, clave):
+        with closing(self._conectar()) as conexion:
+            return conexion.execute("SELECT 1 FROM trabajos WHERE clave = ?", (clave,)).fetchone() is not None
+    
+    def tomar(self):
+        """Reserva el trabajo disponible más antiguo: dict con id, tipo, datos, grupo e intentos, o None.
+        De cada grupo solo se entrega el trabajo más antiguo sin terminar, y mientras está reservado
+        ningún otro trabajo del grupo está disponible.
+
+        Si es agrupable se reservan también los pendientes agrupables que le siguen en su grupo, hasta el
+        primer trabajo de otra clase: 'ids' y 'lote' (los datos de cada uno, en orden) los incluyen a todos."""
+        ahora = time.time()
+        conexion = self._conectar()
+        try:
+            conexion.execute("BEGIN IMMEDIATE")
+            # Una reserva vencida vuelve a entregarse solo si le quedan intentos: las agotadas pasan a error
+            # (un turno con max_intentos=1 no se procesa dos veces) y dejan avanzar a su grupo
+            conexion.execute("""
+                UPDATE trabajos SET estado = 'error', error = 'Reserva vencida sin intentos restantes', actualizado_en = ?
+                WHERE estado = 'procesando' AND disponible_en <= ? AND intentos >= max_intentos
+            """, (ahora, ahora))
+            fila = conexion.execute("""
+                SELECT id, tipo, datos, grupo, agrupable, intentos FROM trabajos t
+                WHERE estado IN ('pendiente', 'procesando') AND disponible_en <= ?
+                  AND (grupo IS NULL OR NOT EXISTS (
+                      SELECT 1 FROM trabajos anterior
+                      WHERE anterior.grupo = t.grupo AND anterior.id < t.id
+                        AND anterior.estado IN ('pendiente', 'procesando')
+                  ))
+                ORDER BY disponible_en, id LIMIT 1
+            """, (ahora,)).fetchone()
+            
+            if fila is None:
+                conexion.execute("COMMIT")
+                return None
+            
+            filas = [fila]
+            if fila['agrupable']:
+                # Solo los que siguen sin otro trabajo del grupo en medio (ej. el envío de un PDF):
+                # el lote no puede adelantarse a un trabajo encolado antes que sus mensajes
+                filas += conexion.execute("""
+                    SELECT id, datos FROM trabajos
+                    WHERE grupo = ? AND tipo = ? AND agrupable = 1 AND estado = 'pendiente' AND id > ?
+                      AND id < COALESCE((
+                          SELECT MIN(id) FROM trabajos
+                          WHERE grupo = ? AND id > ? AND estado IN ('pendiente', 'procesando')
+                            AND NOT (tipo = ? AND agrupable = 1)
+                      ), 9223372036854775807)
+                    ORDER BY id
+                """, (fila['grupo'], fila['tipo'], fila['id'], fila['grupo'], fila['id'], fila['tipo'])).fetchall()
+            ids = [f['id'] for f in filas]
+            
+            conexion.execute(
+                f"UPDATE trabajos SET estado = 'procesando', intentos = intentos + 1, disponible_en = ?, actualizado_en = ? "
+                f"WHERE id IN ({', '.join('?' * len(ids))})",
+                (ahora + self.duracion_reserva, ahora, *ids)
+            )
+            conexion.execute("COMMIT")
+            return {
+                'id': fila['id'], 'ids': ids, 'tipo': fila['tipo'], 'datos': json.loads(fila['datos']),
+                'lote': [json.loads(f['datos']) for f in filas], 'grupo': fila['grupo'], 'intentos': fila['intentos'] + 1
+            }
+        
+        except Exception:
+            conexion.execute("ROLLBACK")
+            raise
+        finally:
+            conexion.close()
+    
+    def completar(self, id_trabajo):
+        with closing(self._conectar()) as conexion:
+            conexion.execute(
+                "UPDATE trabajos SET estado = 'completado', error = NULL, actualizado_en = ? WHERE id = ?",
+                (time.time(), id_trabajo)
+            )
+    
+    def fallar(self, id_trabajo, error):
+        """Reprograma el trabajo con backoff exponencial, o lo marca como error si agotó sus intentos"""
+        ahora = time.time()
+        with closing(self._conectar()) as conexion:
+            fila = conexion.execute("SELECT intentos, max_intentos FROM trabajos WHERE id = ?", (id_trabajo,)).fetchone()
+            if fila is None:
+                return
+            
+            if fila['intentos'] >= fila['max_intentos']:
+                conexion.execute(
+                    "UPDATE trabajos SET estado = 'error', error = ?, actualizado_en = ? WHERE id = ?",
+                    (str(error), ahora, id_trabajo)
+                )
+            else:
+                conexion.execute(
+                    "UPDATE trabajos SET estado = 'pendiente', error = ?, disponible_en = ?, actualizado_en = ? WHERE id = ?",
+                    (str(error), ahora + min(2 ** fila['intentos'], 60), ahora, id_trabajo)
+                )
+    
+    def esperar(self, timeout):
+        """Bloquea hasta que se encola un trabajo en este proceso o pasa el timeout"""
+        with self._hay_trabajo:
+            self._hay_trabajo.wait(timeout)
+    
+    def limpiar_completados(self, antiguedad_segundos=7 * 24 * 3600):
+        with closing(self._conectar()) as conexion:
+            conexion.execute(
+                "DELETE FROM trabajos WHERE estado = 'completado' AND actualizado_en < ?",
+                (time.time() - antiguedad_segundos,)
+            )
+    
+    def estadisticas(self):
+        """Cantidad de trabajos por estado"""
+        with closing(self._conectar()) as conexion:
+            return {fila['estado']: fila['total'] for fila in conexion.execute(
+                "SELECT estado, COUNT(*) AS total FROM trabajos GROUP BY estado"
+            )}
+
+class PoolTrabajadores:
+    """Hilos que toman trabajos de la cola y ejecutan el manejador registrado para su tipo.
+    La cola reparte por grupo: cada grupo avanza en orden y los grupos distintos usan todos los hilos.
+    Los manejadores de 'tipos_en_lote' reciben la lista de datos del lote (uno o más trabajos agrupados)."""
+    
+    def __init__(self, cola, manejadores, num_trabajadores=4, intervalo_sondeo=0.5, tipos_en_lote=()):
+        self.cola = cola
+        self.manejadores = manejadores        # tipo -> función(datos), o función(lista de datos) si está en tipos_en_lote
+        self.tipos_en_lote = set(tipos_en_lote)
+        self.num_trabajadores = num_trabajadores
+        self.intervalo_sondeo = intervalo_sondeo  # Para trabajos encolados por otros procesos o reprogramados
+        self._hilos = []
+        self._lock = threading.Lock()
+    
+    def iniciar(self):
+        """Arranca los trabajadores (solo la primera vez que se llama en el proceso)"""
+        with self._lock:
+            if self._hilos:
+                return
+            for numero in range(self.num_trabajadores):
+                hilo = threading.Thread(target=self._trabajar, name=f"trabajador-{numero}", daemon=True)
+                hilo.start()
+                self._hilos.append(hilo)
+        print(f"👷 {self.num_trabajadores} trabajadores procesando la cola {os.path.basename(self.cola.ruta)}")
+    
+    def _trabajar(self):
+        while True:
+            try:
+                trabajo = self.cola.tomar()
+            except Exception as e:
+                print(f"⚠️ Error leyendo la cola de trabajos: {e}")
+                time.sleep(self.intervalo_sondeo)
+                continue
+            
+            if trabajo is None:
+                self.cola.esperar(self.intervalo_sondeo)
+                continue
+            
+            try:
+                manejador = self.manejadores[trabajo['tipo']]
+                manejador(trabajo['lote'] if trabajo['tipo'] in self.tipos_en_lote else trabajo['datos'])
+                for id_trabajo in trabajo['ids']:
+                    self.cola.completar(id_trabajo)
+            except Exception as e:
+                print(f"❌ Error en trabajo {trabajo['id']} ({trabajo['tipo']}, intento {trabajo['intentos']}): {e}")
+                traceback.print_exc()
+                for id_trabajo in trabajo['ids']:
+                    self.cola.fallar(id_trabajo, e)
@@ -0,0 +1,115 @@
+import re
+import unicodedata
+import tiktoken
+from langchain_core.documents import Document
+
+# Secciones de los textos de la base de conocimiento que solo se incluyen si la pregunta las necesita
+PALABRAS_UBICACION = ('donde', 'ubicacion', 'ubicad', 'sucursal', 'tienda', 'local', 'almacen', 'direccion', 'stock', 'disponib', 'retirar', 'recoger')
+PALABRAS_PRECIO = ('precio', 'cuesta', 'cuanto', 'costo', 'vale', 'descuento', 'oferta', 'promo', 'mayor', 'barato', 'pagar')
+
+class EnsambladorContexto:
+    """Arma el contexto de la base de conocimiento para el prompt dentro de un presupuesto de tokens.
+
+    Los documentos llegan ordenados por relevancia: se quitan campos que no aportan a la pregunta
+    (imágenes, estados, ubicaciones o precios especiales si no se preguntó por ellos) y se agregan
+    en orden hasta agotar el presupuesto; el último que no entra se recorta y el resto se descarta.
+    """
+    
+    SECCIONES_CONDICIONALES = {
+        'UBICACIONES Y STOCK': PALABRAS_UBICACION,
+        'ALMACENES': PALABRAS_UBICACION,
+        'INVENTARIO PRINCIPAL': PALABRAS_UBICACION,
+        'PRECIOS ESPECIALES': PALABRAS_PRECIO
+    }
+    CAMPOS_OMITIDOS = ('IMAGEN:', 'ESTADO:')
+    CARACTERES_POR_TOKEN = 3   # Estimación conservadora para español si no hay tokenizador
+    
+    def __init__(self, presupuesto_tokens=2500, modelo="gpt-4-turbo", min_tokens_recorte=80):
+        self.presupuesto_tokens = presupuesto_tokens
+        self.min_tokens_recorte = min_tokens_recorte   # Por debajo de esto no vale la pena incluir un recorte
+        
+        try:
+            self.codificador = tiktoken.encoding_for_model(modelo)
+        except KeyError:
+            self.codificador = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            # tiktoken descarga el vocabulario la primera vez; sin red se estima por caracteres
+            print(f"⚠️ tiktoken no disponible ({e}), se estimarán los tokens por caracteres")
+            self.codificador = None
+    
+    def contar_tokens(self, texto):
+        if self.codificador is None:
+            return -(-len(texto) // self.CARACTERES_POR_TOKEN)
+        return len(self.codificador.encode(texto))
+    
+    def _normalizar(self, texto):
+        texto = unicodedata.normalize('NFKD', texto.lower())
+        return ''.join(c for c in texto if not unicodedata.combining(c))
+    
+    def limpiar(self, texto, pregunta):
+        """Quita sangrías, campos sin valor para el modelo y secciones que la pregunta no necesita"""
+        pregunta = self._normalizar(pregunta or "")
+        lineas = []
+        omitir_seccion = False
+        
+        for linea in texto.splitlines():
+            linea = linea.strip()
+            if not linea:
+                omitir_seccion = False
+                continue
+            
+            if linea.endswith(':'):
+                # Encabezado de sección: "UBICACIONES Y STOCK:", "PRODUCTOS INCLUIDOS (3 productos):"
+                titulo = re.sub(r'\s*\(.*\)', '', linea[:-1])
+                palabras = self.SECCIONES_CONDICIONALES.get(titulo)
+                omitir_seccion = palabras is not None and not any(palabra in pregunta for palabra in palabras)
+                if not omitir_seccion:
+                    lineas.append(linea)
+                continue
+            
+            if omitir_seccion or linea.startswith(self.CAMPOS_OMITIDOS):
+                continue
+            
+            # Secciones vacías ("Sin promociones activas", "Sin ubicaciones registradas")
+            if linea.startswith('Sin ') and lineas and lineas[-1].endswith(':'):
+                lineas.pop()
+                continue
+            
+            lineas.append(linea)
+        
+        return '\n'.join(lineas)
+    
+    def _recortar(self, texto, max_tokens):
+        """Primeros max_tokens tokens del texto, cortando en el último salto de línea"""
+        if self.codificador is None:
+            recorte = texto[:max_tokens * self.CARACTERES_POR_TOKEN]
+        else:
+            recorte = self.codificador.decode(self.codificador.encode(texto)[:max_tokens])
+        if '\n' in recorte:
+            recorte = recorte[:recorte.rindex('\n')]
+        return f"{recorte}\n…"
+    
+    def ensamblar(self, documentos, pregunta, registrar=True):
+        """Documentos limpios y recortados al presupuesto (en el mismo orden de relevancia) y el total de tokens"""
+        seleccionados = []
+        total_tokens = 0
+        
+        for documento in documentos:
+            texto = self.limpiar(documento.page_content, pregunta)
+            tokens = self.contar_tokens(texto)
+            disponibles = self.presupuesto_tokens - total_tokens
+            
+            if tokens > disponibles:
+                # El primero que no entra se recorta si queda espacio útil; los de menor relevancia se descartan
+                if disponibles >= self.min_tokens_recorte:
+                    texto = self._recortar(texto, disponibles - 2)
+                    seleccionados.append(Document(page_content=texto, metadata=documento.metadata))
+                    total_tokens += self.contar_tokens(texto)
+                break
+            
+            seleccionados.append(Document(page_content=texto, metadata=documento.metadata))
+            total_tokens += tokens
+        
+        if registrar:
+            print(f"🧾 Contexto: {total_tokens}/{self.presupuesto_tokens} tokens ({len(seleccionados)}/{len(documentos)} documentos)")
+        return seleccionados, total_tokens
@@ -1,32 +1,36 @@
 
-import requests
 import json
+import hashlib
 import mysql.connector
 import pickle
 import os
 import io
+import time
+import numpy as np
 from datetime import datetime
-from openai import OpenAI
+from cliente_llm import ClienteLLM
+from cache_respuestas import CacheRespuestasSemantica
+from ensamblador_contexto import EnsambladorContexto
+from recuperador import RecuperadorConfigurable, ESTRATEGIAS_RECUPERACION
 from gestor_base_conocimiento import GestorBaseConocimiento
 from langchain_community.vectorstores import FAISS
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain.chains import RetrievalQA
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.docstore.document import Document
+from langchain_core.messages import SystemMessage, HumanMessage
 
 class EntrenamientoFino:
-    def __init__(self):
+    def __init__(self, embeddings=None):
         # Tu configuración original
         self.api_key = ""
-        self.endpoint = 'https://api.openai.com/v1/chat/completions'
         
-        self.cliente_openai = OpenAI(api_key=self.api_key)
-        self.gestor_bd = GestorBaseConocimiento()
+        # Cliente OpenAI compartido por todos los módulos (ver cliente_llm)
+        self.cliente_llm = ClienteLLM.obtener(api_key=self.api_key)
+        self.cliente_openai = self.cliente_llm.openai
         
-        self.headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {self.api_key}'
-        }
+        # Embedder intercambiable (ver proveedores_embeddings): OpenAI por defecto, local o hash para pruebas
+        self.gestor_bd = GestorBaseConocimiento(embeddings=embeddings)
         
         # 🔥 CAMBIO PRINCIPAL: Usar la nueva función optimizada
         print("⚡ Cargando base de conocimiento...")
@@ -36,36 +40,59 @@ class EntrenamientoFino:
         self.llm = None
         self.qa = None
         
+        # Respuestas reutilizables para preguntas casi repetidas sobre los mismos documentos
+        self.cache_respuestas = CacheRespuestasSemantica(umbral_similitud=0.95, max_entradas=2000, ttl_segundos=24 * 3600)
+        
+        # Tokens máximos de documentos por prompt (el resto del prompt son instrucciones fijas)
+        self.ensamblador_contexto = EnsambladorContexto(presupuesto_tokens=2500, modelo="gpt-4-turbo")
+        
+        # Estrategia de recuperación: 'similitud', 'mmr', 'umbral' o 'hibrida' (ver recuperador)
+        self.estrategia_recuperacion = 'hibrida'
+        self.parametros_recuperacion = {'k': 10, 'fetch_k': 20, 'lambda_mult': 0.8}
+        
         if self.base_conocimiento:
             print("✅ EntrenamientoFino inicializado - LISTO PARA USAR")
         else:
             print("❌ Error inicializando base de conocimiento")
     
+    def _obtener_llm(self):
+        """Modelo de chat compartido por el QA y las consultas directas"""
+        if self.llm is None:
+            # Tu modelo único, sobre el pool de conexiones compartido
+            self.llm = self.cliente_llm.chat_langchain("gpt-4-turbo", temperature=0.2)
+        return self.llm
+    
+    def crear_recuperador(self, estrategia=None, **parametros):
+        """Retriever con la estrategia configurada (o la indicada) sobre el índice en memoria"""
+        return RecuperadorConfigurable(
+            gestor=self.gestor_bd,
+            estrategia=estrategia or self.estrategia_recuperacion,
+            **{**self.parametros_recuperacion, **parametros}
+        )
+    
+    def configurar_recuperacion(self, estrategia, **parametros):
+        """Cambia la estrategia de recuperación (y sus parámetros) del QA en uso"""
+        if estrategia not in ESTRATEGIAS_RECUPERACION:
+            raise ValueError(f"Estrategia no soportada: {estrategia}. Opciones: {', '.join(ESTRATEGIAS_RECUPERACION)}")
+        
+        self.estrategia_recuperacion = estrategia
+        self.parametros_recuperacion.update(parametros)
+        if self.qa is not None:
+            self.qa.retriever = self.crear_recuperador()
+        print(f"🔎 Recuperación: {estrategia} {self.parametros_recuperacion}")
+    
     def configurar_qa(self):
-        """Tu configuración original - SIN CAMBIOS."""
+        """Tu configuración original, con el retriever de la estrategia configurada."""
         try:
             if self.base_conocimiento is None:
                 print("❌ Base de conocimiento no disponible")
                 return False
             
-            # Tu modelo único
-            self.llm = ChatOpenAI(
-                openai_api_key=self.api_key,
-                model_name="gpt-4-turbo",
-                temperature=0.2
-            )
-            
             # Tu configuración original
             self.qa = RetrievalQA.from_chain_type(
-                llm=self.llm,
+                llm=self._obtener_llm(),
                 chain_type="stuff",
-                retriever=self.base_conocimiento.as_retriever(
-                    search_kwargs={
-                        "k": 10,
-                        "fetch_k": 20,
-                        "lambda_mult": 0.8
-                    }
-                ),
+                retriever=self.crear_recuperador(),
                 return_source_documents=True
             )
             
@@ -76,8 +103,47 @@ class EntrenamientoFino:
             print(f"❌ Error configurando QA: {e}")
             return False
     
-    def obtener_informacion_modelo(self, roleOf_system, roelOf_user):
-        """Función actualizada con invoke en lugar de __call__"""
+    def _espacio_cache(self, modo, roleOf_system):
+        """Espacio de la caché: las respuestas solo se reutilizan con el mismo prompt y formato ('texto' o 'json')"""
+        return f"{modo}:{hashlib.sha256(roleOf_system.encode('utf-8')).hexdigest()[:16]}"
+    
+    def _consultar_cache(self, clave_cache, documentos, espacio):
+        """Vector de la pregunta, entidades recuperadas y respuesta cacheada (None si no hay o si clave_cache es None)"""
+        if not clave_cache:
+            return None, None, None
+        
+        try:
+            vector = self.gestor_bd.embeddings.embed_query(clave_cache)
+            ids_documentos = [
+                (documento.metadata.get('tipo'), documento.metadata.get(f"id_{documento.metadata.get('tipo')}"))
+                for documento in documentos
+            ]
+            respuesta = self.cache_respuestas.buscar(vector, ids_documentos, self.gestor_bd.version_catalogo, espacio)
+            if respuesta is not None:
+                print(f"⚡ Respuesta desde caché semántica: {clave_cache[:60]}")
+            return vector, ids_documentos, respuesta
+        
+        except Exception as e:
+            print(f"⚠️ Error consultando caché de respuestas: {e}")
+            return None, None, None
+    
+    def _guardar_en_cache(self, vector, ids_documentos, respuesta, espacio):
+        if vector is not None:
+            self.cache_respuestas.guardar(vector, ids_documentos, self.gestor_bd.version_catalogo, respuesta, espacio)
+    
+    def estadisticas_cache_respuestas(self):
+        return self.cache_respuestas.estadisticas()
+    
+    def obtener_informacion_modelo(self, roleOf_system, roelOf_user, consulta_busqueda=None, clave_cache=None, validar_respuesta=None):
+        """Consulta al modelo con contexto de la base de conocimiento.
+        
+        La búsqueda de documentos usa solo consulta_busqueda (por defecto el texto del usuario),
+        no las instrucciones del sistema; el prompt completo se usa únicamente para generar la respuesta.
+        Con clave_cache se reutiliza la respuesta de una pregunta similar que recuperó los mismos
+        documentos con la misma versión del catálogo y el mismo prompt de sistema. La clave debe identificar todo lo que influye en la
+        respuesta (ej. solo la pregunta si no hay contexto de conversación). Si se pasa validar_respuesta,
+        solo se guardan en caché las respuestas para las que devuelve True.
+        """
         try:
             # Configurar QA si es necesario
             if self.qa is None:
@@ -87,23 +153,231 @@ class EntrenamientoFino:
                         "message": "No se pudo configurar el sistema QA"
                     }
             
-            # Procesar consulta - CAMBIO AQUÍ: usar invoke en lugar de __call__
-            query_completa = f"{roleOf_system}\n\nConsulta: {roelOf_user}"
-            resultado = self.qa.invoke({"query": query_completa})  # ← CAMBIO PRINCIPAL
+            # Recuperar documentos con la pregunta del cliente (embedding corto y relevante)
+            documentos = self.qa.retriever.invoke(consulta_busqueda or roelOf_user)
+            
+            espacio = self._espacio_cache('texto', roleOf_system)
+            vector, ids_documentos, contenido = self._consultar_cache(clave_cache, documentos, espacio)
+            desde_cache = contenido is not None
+            
+            if not desde_cache:
+                # Responder con las instrucciones completas sobre esos documentos (recortados al presupuesto)
+                documentos_contexto, _ = self.ensamblador_contexto.ensamblar(documentos, consulta_busqueda or roelOf_user)
+                query_completa = f"{roleOf_system}\n\nConsulta: {roelOf_user}"
+                resultado = self.qa.combine_documents_chain.invoke({
+                    "input_documents": documentos_contexto,
+                    "question": query_completa
+                })
+                contenido = resultado.get('output_text', '')
+                if validar_respuesta is None or validar_respuesta(contenido):
+                    self._guardar_en_cache(vector, ids_documentos, contenido, espacio)
+            
+            return {
+                "status": "success",
+                "message": "Consulta procesada correctamente",
+                "data": contenido,
+                "productos_encontrados": len(documentos),
+                "desde_cache": desde_cache
+            }
+            
+        except Exception as e:
+            return {
+                "status": "error",
+                "message": "Error interno del servidor",
+                "error_details": str(e)
+            }
+    
+    def obtener_respuesta_json(self, roleOf_system, roelOf_user, consulta_busqueda=None, al_recibir=None, clave_cache=None, validar_respuesta=None):
+        """Consulta con contexto de la base de conocimiento en modo JSON: 'data' es el objeto ya parseado.
+        
+        Si se pasa al_recibir, la respuesta se pide en streaming y cada fragmento de texto crudo
+        se entrega a ese callback a medida que llega. clave_cache y validar_respuesta funcionan como en
+        obtener_informacion_modelo (validar_respuesta recibe el objeto parseado; una respuesta cacheada
+        se entrega a al_recibir de una sola vez).
+        """
+        try:
+            if self.qa is None:
+                if not self.configurar_qa():
+                    return {
+                        "status": "error",
+                        "message": "No se pudo configurar el sistema QA"
+                    }
+            
+            documentos = self.qa.retriever.invoke(consulta_busqueda or roelOf_user)
+            
+            espacio = self._espacio_cache('json', roleOf_system)
+            vector, ids_documentos, contenido = self._consultar_cache(clave_cache, documentos, espacio)
+            desde_cache = contenido is not None
+            
+            if desde_cache:
+                if al_recibir is not None:
+                    al_recibir(contenido)
+            else:
+                documentos_contexto, _ = self.ensamblador_contexto.ensamblar(documentos, consulta_busqueda or roelOf_user)
+                contexto = "\n\n".join(documento.page_content for documento in documentos_contexto)
+                
+                # response_format json_object: el modelo solo puede devolver un objeto JSON válido
+                llm_json = self._obtener_llm().bind(response_format={"type": "json_object"})
+                mensajes = [
+                    SystemMessage(content=f"{roleOf_system}\n\nINFORMACIÓN DE LA BASE DE CONOCIMIENTO:\n{contexto}"),
+                    HumanMessage(content=roelOf_user)
+                ]
+                
+                if al_recibir is None:
+                    contenido = llm_json.invoke(mensajes).content
+                else:
+                    fragmentos = []
+                    for fragmento in llm_json.stream(mensajes):
+                        if fragmento.content:
+                            fragmentos.append(fragmento.content)
+                            al_recibir(fragmento.content)
+                    contenido = ''.join(fragmentos)
+            
+            data = json.loads(contenido)
+            if not desde_cache and (validar_respuesta is None or validar_respuesta(data)):
+                # Solo se cachean respuestas que son JSON válido (y cumplen el esquema si se pasó validar_respuesta)
+                self._guardar_en_cache(vector, ids_documentos, contenido, espacio)
             
             return {
                 "status": "success",
                 "message": "Consulta procesada correctamente",
-                "data": resultado.get('result', ''),
-                "productos_encontrados": len(resultado.get('source_documents', []))
+                "data": data,
+                "productos_encontrados": len(documentos),
+                "desde_cache": desde_cache
             }
             
+        except json.JSONDecodeError as e:
+            return {
+                "status": "error",
+                "message": "Error al parsear JSON de respuesta",
+                "error_details": str(e)
+            }
+        
         except Exception as e:
             return {
                 "status": "error",
                 "message": "Error interno del servidor",
                 "error_details": str(e)
             }
+    
+    def obtener_respuesta_directa(self, roleOf_system, roelOf_user):
+        """Chat completion sin recuperación de documentos (para tareas que no necesitan el catálogo, ej. resúmenes)"""
+        try:
+            respuesta = self._obtener_llm().invoke([
+                SystemMessage(content=roleOf_system),
+                HumanMessage(content=roelOf_user)
+            ])
+            
+            return {
+                "status": "success",
+                "message": "Consulta procesada correctamente",
+                "data": respuesta.content,
+                "productos_encontrados": 0
+            }
+            
+        except Exception as e:
+            return {
+                "status": "error",
+                "message": "Error interno del servidor",
+                "error_details": str(e)
+            }
+    
+    # ============================================
+    # BENCHMARK DE RECUPERACIÓN
+    # ============================================
+    
+    def _preguntas_benchmark(self, num_preguntas):
+        """Preguntas fijas generadas desde el catálogo, cada una con la entidad que debería recuperar"""
+        plantillas = {
+            'producto': ["¿Tienen {nombre}?", "¿Cuánto cuesta {nombre}?"],
+            'coleccion': ["¿Qué productos tienen en {nombre}?"],
+            'promocion': ["¿Cómo funciona la promoción {nombre}?"],
+            'sucursal': ["¿Dónde queda la sucursal {nombre}?"]
+        }
+        
+        vectorstore = self.gestor_bd.obtener_vectorstore()
+        entidades = sorted(
+            {(documento.metadata['tipo'], documento.metadata.get(f"id_{documento.metadata['tipo']}"), documento.metadata['nombre'])
+             for documento in map(vectorstore.docstore.search, vectorstore.index_to_docstore_id.values())
+             if documento.metadata.get('tipo') in plantillas and documento.metadata.get('nombre')},
+            key=str
+        )
+        
+        preguntas = [
+            (plantilla.format(nombre=nombre), [(tipo, id_entidad)])
+            for tipo, id_entidad, nombre in entidades
+            for plantilla in plantillas[tipo]
+        ]
+        generador = np.random.default_rng(42)
+        muestra = generador.choice(len(preguntas), size=min(num_preguntas, len(preguntas)), replace=False)
+        return [preguntas[i] for i in sorted(muestra)]
+    
+    def reporte_recuperacion(self, estrategias=ESTRATEGIAS_RECUPERACION, preguntas=None, num_preguntas=100, atajo_exacto=False):
+        """Compara las estrategias de recuperación sobre un conjunto fijo de preguntas.
+        
+        Args:
+            estrategias: Estrategias a comparar
+            preguntas: Lista de (pregunta, [(tipo, id_entidad), ...] esperadas); por defecto se generan desde el catálogo
+            num_preguntas: Tamaño del conjunto generado
+            atajo_exacto: Incluir el atajo por código/nombre exacto (desactivado por defecto para comparar solo las estrategias)
+        """
+        try:
+            if self.gestor_bd.obtener_vectorstore() is None:
+                print("❌ Base de conocimiento no disponible")
+                return {}
+            
+            preguntas = preguntas or self._preguntas_benchmark(num_preguntas)
+            
+            # Embeddings de consulta precalculados: la latencia medida es solo la de recuperación
+            for pregunta, _ in preguntas:
+                self.gestor_bd.embeddings.embed_query(pregunta)
+            
+            reporte = {}
+            for estrategia in estrategias:
+                recuperador = self.crear_recuperador(estrategia, atajo_exacto=atajo_exacto)
+                latencias, recalls, rangos_reciprocos, tokens, unicos = [], [], [], [], []
+                
+                for pregunta, esperadas in preguntas:
+                    inicio = time.perf_counter()
+                    documentos = recuperador.invoke(pregunta)
+                    latencias.append((time.perf_counter() - inicio) * 1000)
+                    
+                    claves = [
+                        (documento.metadata.get('tipo'), documento.metadata.get(f"id_{documento.metadata.get('tipo')}"))
+                        for documento in documentos
+                    ]
+                    esperadas = set(map(tuple, esperadas))
+                    recalls.append(len(esperadas & set(claves)) / len(esperadas))
+                    rango = next((i for i, clave in enumerate(claves, start=1) if clave in esperadas), None)
+                    rangos_reciprocos.append(1 / rango if rango else 0.0)
+                    
+                    _, total_tokens = self.ensamblador_contexto.ensamblar(documentos, pregunta, registrar=False)
+                    tokens.append(total_tokens)
+                    unicos.append(len(set(claves)) / len(claves) if claves else 1.0)
+                
+                recall = float(np.mean(recalls))
+                tokens_medios = float(np.mean(tokens))
+                reporte[estrategia] = {
+                    'recall': recall,
+                    'mrr': float(np.mean(rangos_reciprocos)),
+                    'latencia_media_ms': float(np.mean(latencias)),
+                    'latencia_p95_ms': float(np.percentile(latencias, 95)),
+                    'tokens_contexto': tokens_medios,
+                    'recall_por_1k_tokens': recall / tokens_medios * 1000 if tokens_medios else 0.0,
+                    'documentos_unicos': float(np.mean(unicos))
+                }
+            
+            print(f"📊 Recuperación sobre {len(preguntas)} preguntas (k={self.parametros_recuperacion['k']}):")
+            for estrategia, datos in reporte.items():
+                print(f"   - {estrategia:<9} recall={datos['recall']:.3f}  mrr={datos['mrr']:.3f}  "
+                      f"media={datos['latencia_media_ms']:.2f}ms  p95={datos['latencia_p95_ms']:.2f}ms  "
+                      f"tokens={datos['tokens_contexto']:.0f}  recall/1k tokens={datos['recall_por_1k_tokens']:.3f}")
+            
+            return reporte
+            
+        except Exception as e:
+            print(f"❌ Error generando reporte de recuperación: {e}")
+            return {}
         
 # def main():
 #     print("🎮 BOT PRODUCTOS GAMER")
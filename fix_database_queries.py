@@ -42,6 +42,9 @@ class GestorBaseConocimientoFixed:
         
         self.nombre_vectorstore = "conocimiento_completo"
         
+        # Vectorstore en memoria: se construye una sola vez y se reutiliza en cada búsqueda
+        self.vectorstore = None
+        
         # Auto-inicialización
         self._inicializar()
     
@@ -531,6 +534,8 @@ class GestorBaseConocimientoFixed:
     
     def _procesar_todo_el_contenido(self):
         """Proceso completo de toda la base de conocimiento"""
+        # El índice en memoria queda desactualizado: se reconstruye en el próximo obtener_vectorstore()
+        self.vectorstore = None
         self._ejecutar_consulta("DELETE FROM base_conocimiento_analisis")
         
         total_procesados = 0
@@ -633,8 +638,11 @@ class GestorBaseConocimientoFixed:
         
         return base_metadata
     
-    def obtener_vectorstore(self):
+    def obtener_vectorstore(self, recargar=False):
         """FUNCIÓN PRINCIPAL - Obtiene FAISS optimizado con todo el contenido"""
+        if self.vectorstore is not None and not recargar:
+            return self.vectorstore
+        
         try:
             print("🔄 Creando FAISS desde base de conocimiento completa...")
             embeddings_data = self._ejecutar_consulta(
@@ -671,6 +679,7 @@ class GestorBaseConocimientoFixed:
             for tipo, cantidad in tipos.items():
                 print(f"   - {tipo.capitalize()}: {cantidad}")
             
+            self.vectorstore = vectorstore
             return vectorstore
             
         except Exception as e:
@@ -679,7 +688,7 @@ class GestorBaseConocimientoFixed:
             return None
     
     def buscar_contenido(self, consulta, k=5, filtro_tipo=None):
-        """Busca contenido específico en la base de conocimiento"""
+        """Busca contenido específico en la base de conocimiento (sobre el índice en memoria)"""
         vectorstore = self.obtener_vectorstore()
         if not vectorstore:
             return []
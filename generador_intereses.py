@@ -1,6 +1,7 @@
 import mysql.connector
 import json
-import requests
+from openai import APIStatusError
+from cliente_llm import ClienteLLM
 from datetime import datetime
 
 class GeneradorIntereses:
@@ -20,6 +21,7 @@ class GeneradorIntereses:
         
         # Clave API de OpenAI
         self.api_key = ""
+        self.cliente_llm = ClienteLLM.obtener(api_key=self.api_key)
 
     def obtener_conversaciones_cliente(self, telefono, tipo_conversacion):
         """
@@ -167,38 +169,21 @@ REGLAS IMPORTANTES:
 RESPUESTA (solo JSON):
 """
             
-            # Llamada a OpenAI
-            endpoint = 'https://api.openai.com/v1/chat/completions'
-            headers = {
-                'Content-Type': 'application/json',
-                'Authorization': f'Bearer {self.api_key}'
-            }
-            
-            payload = {
-                'model': 'gpt-4o-mini',
-                'messages': [
-                    {
-                        'role': 'system',
-                        'content': 'Eres un analizador de intereses de clientes. SIEMPRE responde únicamente con JSON válido.'
-                    },
-                    {
-                        'role': 'user',
-                        'content': prompt
-                    }
-                ],
-                'temperature': 0.1,  # Muy bajo para respuestas consistentes
-                'max_tokens': 300
-            }
-            
-            response = requests.post(endpoint, headers=headers, json=payload, timeout=30)
-            
-            if response.status_code != 200:
-                print(f"Error en API OpenAI: {response.status_code}")
+            # Llamada a OpenAI por el cliente compartido (pool, límites por modelo y reintentos)
+            try:
+                respuesta_ai = self.cliente_llm.chat(
+                    'gpt-4o-mini',
+                    [
+                        {'role': 'system', 'content': 'Eres un analizador de intereses de clientes. SIEMPRE responde únicamente con JSON válido.'},
+                        {'role': 'user', 'content': prompt}
+                    ],
+                    temperature=0.1,  # Muy bajo para respuestas consistentes
+                    max_tokens=300
+                ).strip()
+            except APIStatusError as e:
+                print(f"Error en API OpenAI: {e.status_code}")
                 return []
             
-            data = response.json()
-            respuesta_ai = data['choices'][0]['message']['content'].strip()
-            
             # Intentar parsear el JSON
             try:
                 intereses = json.loads(respuesta_ai)
@@ -418,36 +403,21 @@ REGLAS IMPORTANTES:
 RESPUESTA (solo JSON):
 """
             
-            endpoint = 'https://api.openai.com/v1/chat/completions'
-            headers = {
-                'Content-Type': 'application/json',
-                'Authorization': f'Bearer {self.api_key}'
-            }
-            
-            payload = {
-                'model': 'gpt-4o-mini',
-                'messages': [
-                    {
-                        'role': 'system',
-                        'content': 'Eres un experto en análisis de intenciones de compra. SIEMPRE responde únicamente con JSON válido.'
-                    },
-                    {
-                        'role': 'user',
-                        'content': prompt
-                    }
-                ],
-                'temperature': 0.1,
-                'max_tokens': 300
-            }
-            
-            response = requests.post(endpoint, headers=headers, json=payload, timeout=30)
-            
-            if response.status_code != 200:
-                print(f"Error en API OpenAI: {response.status_code}")
+            # Llamada a OpenAI por el cliente compartido (pool, límites por modelo y reintentos)
+            try:
+                respuesta_ai = self.cliente_llm.chat(
+                    'gpt-4o-mini',
+                    [
+                        {'role': 'system', 'content': 'Eres un experto en análisis de intenciones de compra. SIEMPRE responde únicamente con JSON válido.'},
+                        {'role': 'user', 'content': prompt}
+                    ],
+                    temperature=0.1,  # Muy bajo para respuestas consistentes
+                    max_tokens=300
+                ).strip()
+            except APIStatusError as e:
+                print(f"Error en API OpenAI: {e.status_code}")
                 return []
             
-            data = response.json()
-            respuesta_ai = data['choices'][0]['message']['content'].strip()
             print(f"🤖 Respuesta de OpenAI: {respuesta_ai}")
             
             try:
@@ -465,7 +435,7 @@ RESPUESTA (solo JSON):
             print(f"Error en análisis de mensaje directo: {e}")
             return []
 
-    def procesar_intereses_cliente(self, telefono, tipo_conversacion, mensaje_usuario=None):
+    def procesar_intereses_cliente(self, telefono, tipo_conversacion, mensaje_usuario=None, productos_disponibles=None):
         """
         Función principal que procesa los intereses de un cliente
         VERSIÓN MEJORADA con análisis de mensaje directo para chat_auto
@@ -474,6 +444,7 @@ RESPUESTA (solo JSON):
             telefono (str): Número de teléfono del cliente
             tipo_conversacion (str): 'inicial_3', 'final_3', 'chat_auto', etc.
             mensaje_usuario (str): Mensaje del usuario (para chat_auto)
+            productos_disponibles (dict): Productos {nombre: id} ya consultados (ej. para un lote); si no, se consultan
         
         Returns:
             dict: Respuesta con estado del proceso
@@ -493,7 +464,8 @@ RESPUESTA (solo JSON):
                     }
                 
                 # Obtener productos disponibles
-                productos_disponibles = self.obtener_productos_disponibles()
+                if productos_disponibles is None:
+                    productos_disponibles = self.obtener_productos_disponibles()
                 if not productos_disponibles:
                     return {
                         'estado': 'error',
@@ -545,7 +517,8 @@ RESPUESTA (solo JSON):
                 }
             
             # 2. Obtener productos disponibles
-            productos_disponibles = self.obtener_productos_disponibles()
+            if productos_disponibles is None:
+                productos_disponibles = self.obtener_productos_disponibles()
             
             if not productos_disponibles:
                 return {
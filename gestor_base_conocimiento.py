@@ -1,33 +1,77 @@
 import mysql.connector
 import json
+import hashlib
+import os
 import pickle
+import threading
+import time
+import faiss
+import numpy as np
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from openai import OpenAI
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+from proveedores_embeddings import EmbeddingsConCache, crear_embeddings, nombre_modelo
+from cliente_llm import ClienteLLM
+from indice_lexico import IndiceBM25
 from langchain.schema import Document
 import sys
 import traceback
 
 class GestorBaseConocimiento:
-    def __init__(self):
+    def __init__(self, usar_snapshot=True, modo_indice='flat', embeddings=None):
         # Configuración única
         self.configuracion_bd = {
             'host': 'localhost', 'user': 'root', 'password': '', 
             'database': 'bot_productos_db', 'charset': 'utf8mb4'
         }
         
-        self.cliente_openai = OpenAI(
-            api_key=""
-        )
+        # Cliente OpenAI compartido (pool de conexiones, límites por modelo y reintentos; ver cliente_llm)
+        self.cliente_llm = ClienteLLM.obtener(api_key="")
+        self.cliente_openai = self.cliente_llm.openai
+        
+        # Embedder intercambiable (OpenAI por defecto; ver proveedores_embeddings)
+        self.embeddings_base = embeddings or crear_embeddings('openai', self.cliente_llm.api_key)
         
-        self.embeddings = OpenAIEmbeddings(
-            openai_api_key=self.cliente_openai.api_key,
-            model="text-embedding-ada-002"
+        # Las consultas pasan por una caché LRU/TTL (persistida en disco) antes de llegar al modelo
+        self.embeddings = EmbeddingsConCache(
+            self.embeddings_base,
+            max_entradas=5000,
+            ttl_segundos=7 * 24 * 3600,
+            ruta=os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache_embeddings.pkl")
         )
         
         self.nombre_vectorstore = "conocimiento_completo"
         
+        # Generación de embeddings por lotes
+        self.modelo_embeddings = nombre_modelo(self.embeddings_base)
+        self.tamano_lote_embeddings = 100     # Textos por request a la API
+        self.max_lotes_concurrentes = 4       # Requests simultáneos como máximo
+        
+        # Snapshot en disco del índice FAISS (se reutiliza si la huella de la tabla no cambió)
+        self.usar_snapshot = usar_snapshot
+        self.ruta_snapshot = os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshot_faiss")
+        
+        # Índice en memoria (lo actualiza la sincronización incremental)
+        self.vectorstore = None
+        
+        # Sub-índices por tipo de entidad (producto, promocion, coleccion, sucursal) para búsquedas filtradas
+        self.subindices = {}
+        self._metadatos_numericos = {}
+        
+        # Índice BM25 de nombres, códigos y colecciones (búsquedas exactas sin embeddings, ranking léxico híbrido)
+        self.indice_lexico = IndiceBM25()
+        
+        # Tipo de índice FAISS: 'flat' (exacto), 'ivf_flat', 'ivf_pq' o 'ivf_sq8' (aproximados, para catálogos grandes)
+        self.modo_indice = modo_indice
+        self.nprobe = 8                       # Listas invertidas visitadas por búsqueda en modos IVF
+        
+        # Aumenta con cada sincronización que cambia el contenido (invalida respuestas cacheadas)
+        self.version_catalogo = 0
+        self._lock_sincronizacion = threading.Lock()  # Una sincronización a la vez (inicio y endpoint)
+        
         # Auto-inicialización
         self._inicializar()
     
@@ -52,6 +96,30 @@ class GestorBaseConocimiento:
             print(f"❌ Error BD: {e}")
             return [] if obtener_datos else False
     
+    def _ejecutar_lote(self, consulta, filas):
+        """Ejecuta la misma sentencia para muchas filas en una sola transacción"""
+        if not filas:
+            return 0
+        
+        conexion = None
+        try:
+            conexion = mysql.connector.connect(**self.configuracion_bd)
+            conexion.autocommit = False
+            cursor = conexion.cursor()
+            
+            cursor.executemany(consulta, filas)
+            conexion.commit()
+            return len(filas)
+            
+        except Exception as e:
+            print(f"❌ Error BD (lote de {len(filas)}): {e}")
+            if conexion:
+                conexion.rollback()
+            return False
+        finally:
+            if conexion and conexion.is_connected():
+                conexion.close()
+    
     def _inicializar(self):
         """Inicialización automática completa"""
         print("🚀 Inicializando gestor completo...")
@@ -61,14 +129,19 @@ class GestorBaseConocimiento:
             print("❌ Sin conexión a BD")
             return
         
+        # Convertir embeddings antiguos (listas pickle) al formato binario float32
+        self.migrar_embeddings_binarios()
+        
         # Verificar si necesita procesar contenido
         count = self._ejecutar_consulta("SELECT COUNT(*) FROM base_conocimiento_analisis", obtener_datos=True)
         
         if not count or count[0][0] == 0:
             print("📝 Procesando toda la base de conocimiento...")
-            self._procesar_todo_el_contenido()
         else:
-            print(f"✅ Base lista con {count[0][0]} registros")
+            # Cambios del catálogo hechos con el bot apagado (y re-embebido si cambió el embedder):
+            # solo se re-embeben las entidades cuyo texto cambió
+            print(f"✅ Base lista con {count[0][0]} registros, sincronizando cambios del catálogo...")
+        self.sincronizar_base_conocimiento()
     
     # ============================================
     # CONSULTAS PARA OBTENER DATOS COMPLETOS
@@ -490,78 +563,234 @@ class GestorBaseConocimiento:
     # PROCESAMIENTO PRINCIPAL
     # ============================================
     
-    def _procesar_todo_el_contenido(self):
-        """Proceso completo de toda la base de conocimiento"""
-        # Limpiar tabla
-        self._ejecutar_consulta("DELETE FROM base_conocimiento_analisis")
-        
-        total_procesados = 0
-        
-        # Procesar productos
-        print("📦 Procesando productos...")
-        productos = self._obtener_productos_completos()
-        if productos:
-            exitosos = self._procesar_entidades(productos, 'producto', self._generar_texto_producto)
-            total_procesados += exitosos
-            print(f"✅ Productos procesados: {exitosos}/{len(productos)}")
-        
-        # Procesar promociones
-        print("🎯 Procesando promociones...")
-        promociones = self._obtener_promociones_completas()
-        if promociones:
-            exitosos = self._procesar_entidades(promociones, 'promocion', self._generar_texto_promocion)
-            total_procesados += exitosos
-            print(f"✅ Promociones procesadas: {exitosos}/{len(promociones)}")
-        
-        # Procesar colecciones
-        print("📂 Procesando colecciones...")
-        colecciones = self._obtener_colecciones_completas()
-        if colecciones:
-            exitosos = self._procesar_entidades(colecciones, 'coleccion', self._generar_texto_coleccion)
-            total_procesados += exitosos
-            print(f"✅ Colecciones procesadas: {exitosos}/{len(colecciones)}")
-        
-        # Procesar sucursales
-        print("🏢 Procesando sucursales...")
-        sucursales = self._obtener_sucursales_completas()
-        if sucursales:
-            exitosos = self._procesar_entidades(sucursales, 'sucursal', self._generar_texto_sucursal)
-            total_procesados += exitosos
-            print(f"✅ Sucursales procesadas: {exitosos}/{len(sucursales)}")
-        
-        print(f"🎉 TOTAL PROCESADO: {total_procesados} registros en la base de conocimiento")
+    def _fuentes_conocimiento(self):
+        """Entidades que alimentan la base de conocimiento: (tipo, consulta, generador de texto, etiqueta)"""
+        return [
+            ('producto', self._obtener_productos_completos, self._generar_texto_producto, "📦 Productos"),
+            ('promocion', self._obtener_promociones_completas, self._generar_texto_promocion, "🎯 Promociones"),
+            ('coleccion', self._obtener_colecciones_completas, self._generar_texto_coleccion, "📂 Colecciones"),
+            ('sucursal', self._obtener_sucursales_completas, self._generar_texto_sucursal, "🏢 Sucursales")
+        ]
     
-    def _procesar_entidades(self, entidades, tipo, generador_texto):
-        """Procesa cualquier tipo de entidad y genera embeddings"""
-        exitosos = 0
+    def _hash_contenido(self, texto):
+        """Hash del texto de una entidad (equivale a SHA2(contenido, 256) en MySQL)"""
+        return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+    
+    def _clave_entidad(self, metadata):
+        """Identifica la entidad de origen de un registro: (tipo, id de la entidad)"""
+        tipo = metadata.get('tipo')
+        return (tipo, metadata.get(f'id_{tipo}')) if tipo else None
+    
+    def sincronizar_base_conocimiento(self):
+        """Sincronización incremental: solo re-embebe las entidades cuyo texto cambió.
+        Corre al iniciar y después de editar el catálogo (POST /api/sincronizar_base_conocimiento);
+        aplica los mismos cambios al índice en memoria."""
+        with self._lock_sincronizacion:
+            return self._sincronizar()
+    
+    def _sincronizar(self):
+        # Estado actual de la tabla (el hash lo calcula MySQL, no se transfiere el contenido)
+        registros = self._ejecutar_consulta(
+            "SELECT id, SHA2(contenido, 256) AS hash_contenido, metadata FROM base_conocimiento_analisis ORDER BY id",
+            obtener_datos=True, dictionary=True
+        )
         
-        for entidad in entidades:
-            try:
-                # Generar texto y embedding
-                texto = generador_texto(entidad)
+        existentes = {}
+        obsoletos = []
+        for registro in registros:
+            metadata = json.loads(registro['metadata']) if registro['metadata'] else {}
+            clave = self._clave_entidad(metadata)
+            if clave is None or clave in existentes:
+                obsoletos.append(registro['id'])  # Registros sin entidad o duplicados
+            else:
+                existentes[clave] = (registro['id'], registro['hash_contenido'], metadata)
+        
+        id_maximo_previo = max((registro['id'] for registro in registros), default=0)
+        vistos = set()
+        cambios_texto = []
+        cambios_metadata = []
+        total_nuevos = 0
+        cambio_modelo = False
+        
+        for tipo, obtener_entidades, generador_texto, etiqueta in self._fuentes_conocimiento():
+            print(f"{etiqueta}: sincronizando...")
+            nuevas = []
+            
+            for entidad in obtener_entidades():
+                try:
+                    texto = generador_texto(entidad)
+                    metadata = json.loads(json.dumps(self._generar_metadata(entidad, tipo)))
+                except Exception as e:
+                    nombre = entidad.get('nombre', f'ID_{entidad.get(f"id_{tipo}", "unknown")}')
+                    print(f"❌ Error en {tipo} {nombre}: {e}")
+                    continue
                 
-                respuesta = self.cliente_openai.embeddings.create(
-                    input=texto, model="text-embedding-ada-002"
-                )
-                embedding = respuesta.data[0].embedding
+                clave = self._clave_entidad(metadata)
+                vistos.add(clave)
                 
-                # Metadata específica por tipo
-                metadata = self._generar_metadata(entidad, tipo)
+                if clave not in existentes:
+                    nuevas.append(entidad)
+                    continue
                 
-                # Insertar
-                consulta = "INSERT INTO base_conocimiento_analisis (contenido, embedding, metadata) VALUES (%s, %s, %s)"
-                if self._ejecutar_consulta(consulta, (texto, pickle.dumps(embedding), json.dumps(metadata))):
-                    exitosos += 1
-                    
+                id_registro, hash_previo, metadata_previa = existentes[clave]
+                # Registros previos al etiquetado de modelo fueron embebidos con ada-002
+                modelo_previo = metadata_previa.get('modelo_embedding', "text-embedding-ada-002")
+                if self._hash_contenido(texto) != hash_previo or modelo_previo != self.modelo_embeddings:
+                    cambios_texto.append((id_registro, texto, metadata))
+                    cambio_modelo = cambio_modelo or modelo_previo != self.modelo_embeddings
+                elif metadata != metadata_previa:
+                    cambios_metadata.append((id_registro, metadata))
+            
+            if nuevas:
+                exitosos = self._procesar_entidades(nuevas, tipo, generador_texto)
+                total_nuevos += exitosos
+                print(f"✅ Nuevos de tipo {tipo}: {exitosos}/{len(nuevas)}")
+        
+        # Entidades que ya no están activas
+        obsoletos += [id_registro for clave, (id_registro, _, _) in existentes.items() if clave not in vistos]
+        if obsoletos:
+            marcadores = ','.join(['%s'] * len(obsoletos))
+            self._ejecutar_consulta(f"DELETE FROM base_conocimiento_analisis WHERE id IN ({marcadores})", tuple(obsoletos))
+        
+        actualizados = self._actualizar_entidades(cambios_texto)
+        self._ejecutar_lote(
+            "UPDATE base_conocimiento_analisis SET metadata = %s WHERE id = %s",
+            [(json.dumps(metadata), id_registro) for id_registro, metadata in cambios_metadata]
+        )
+        
+        print(f"🎉 SINCRONIZACIÓN: {total_nuevos} nuevos, {actualizados} re-embebidos, "
+              f"{len(cambios_metadata)} con metadata actualizada, {len(obsoletos)} eliminados")
+        
+        # Aplicar los mismos cambios al índice en memoria
+        ids_modificados = [id_registro for id_registro, _, _ in cambios_texto] + [id_registro for id_registro, _ in cambios_metadata]
+        hubo_cambios = total_nuevos or ids_modificados or obsoletos
+        if hubo_cambios:
+            self.version_catalogo += 1
+        if self.vectorstore is not None and hubo_cambios:
+            self._actualizar_indice(obsoletos + ids_modificados, ids_modificados, id_maximo_previo, reconstruir=cambio_modelo)
+        
+        return {
+            'nuevos': total_nuevos,
+            'actualizados': actualizados,
+            'metadata_actualizada': len(cambios_metadata),
+            'eliminados': len(obsoletos)
+        }
+    
+    def _actualizar_entidades(self, cambios):
+        """Re-embebe por lotes y actualiza registros existentes cuyo texto cambió"""
+        if not cambios:
+            return 0
+        
+        embeddings = self._generar_embeddings([texto for _, texto, _ in cambios])
+        
+        filas = [
+            (texto, self._serializar_embedding(embedding), json.dumps(metadata), id_registro)
+            for (id_registro, texto, metadata), embedding in zip(cambios, embeddings)
+            if embedding is not None
+        ]
+        
+        consulta = "UPDATE base_conocimiento_analisis SET contenido = %s, embedding = %s, metadata = %s WHERE id = %s"
+        return self._ejecutar_lote(consulta, filas) or 0
+    
+    def _actualizar_indice(self, ids_quitar, ids_agregar, id_maximo_previo, reconstruir=False):
+        """Quita y agrega documentos del índice FAISS en memoria (y de los sub-índices) por id de registro"""
+        if self.modo_indice != 'flat' or reconstruir:
+            # Los índices IVF no admiten borrado con compactación, y un cambio de modelo puede cambiar
+            # la dimensión: en esos casos se reconstruye con los vectores guardados
+            print("🔄 Reconstruyendo índice desde los embeddings guardados...")
+            self.obtener_vectorstore(recargar=True)
+            return
+        
+        try:
+            ids_quitar = [str(id_registro) for id_registro in ids_quitar]
+            for vectorstore in [self.vectorstore, *self.subindices.values()]:
+                presentes = set(vectorstore.index_to_docstore_id.values())
+                ids_presentes = [id_ for id_ in ids_quitar if id_ in presentes]
+                if ids_presentes:
+                    vectorstore.delete(ids_presentes)
+            
+            # Registros modificados o insertados en esta sincronización
+            marcadores = ','.join(['%s'] * len(ids_agregar))
+            condicion = f"id > %s OR id IN ({marcadores})" if ids_agregar else "id > %s"
+            textos, matriz, metadatas, ids = self._cargar_registros(condicion, (id_maximo_previo, *ids_agregar))
+            if ids:
+                self.vectorstore.add_embeddings(list(zip(textos, matriz)), metadatas=metadatas, ids=ids)
+                
+                for tipo, particion in self._particionar_por_tipo(textos, matriz, metadatas, ids).items():
+                    if tipo in self.subindices:
+                        sub_textos, sub_matriz, sub_metadatas, sub_ids = particion
+                        self.subindices[tipo].add_embeddings(list(zip(sub_textos, sub_matriz)), metadatas=sub_metadatas, ids=sub_ids)
+                    else:
+                        self.subindices[tipo] = self._construir_vectorstore(*particion)
+            
+            self._metadatos_numericos = {}
+            self._construir_indice_lexico()
+            print(f"🔄 Índice actualizado: -{len(ids_quitar)} +{len(ids)} documentos")
+            
+            if self.usar_snapshot:
+                huella = self._calcular_huella()
+                if huella:
+                    self._guardar_snapshot(huella)
+            
+        except Exception as e:
+            print(f"❌ Error actualizando índice en memoria: {e}")
+            traceback.print_exc()
+    
+    def _procesar_entidades(self, entidades, tipo, generador_texto):
+        """Procesa cualquier tipo de entidad: embeddings por lotes e inserción masiva"""
+        textos, metadatas = [], []
+        
+        for entidad in entidades:
+            try:
+                textos.append(generador_texto(entidad))
+                metadatas.append(self._generar_metadata(entidad, tipo))
             except Exception as e:
                 nombre = entidad.get('nombre', f'ID_{entidad.get(f"id_{tipo}", "unknown")}')
                 print(f"❌ Error en {tipo} {nombre}: {e}")
         
-        return exitosos
+        embeddings = self._generar_embeddings(textos)
+        
+        filas = [
+            (texto, self._serializar_embedding(embedding), json.dumps(metadata))
+            for texto, embedding, metadata in zip(textos, embeddings, metadatas)
+            if embedding is not None
+        ]
+        
+        consulta = "INSERT INTO base_conocimiento_analisis (contenido, embedding, metadata) VALUES (%s, %s, %s)"
+        return self._ejecutar_lote(consulta, filas) or 0
+    
+    def _generar_embeddings(self, textos):
+        """Genera embeddings en lotes (un request por lote) con concurrencia acotada.
+        Devuelve una lista alineada con textos; None donde el lote falló."""
+        if not textos:
+            return []
+        
+        lotes = [textos[i:i + self.tamano_lote_embeddings] for i in range(0, len(textos), self.tamano_lote_embeddings)]
+        print(f"🧮 Generando {len(textos)} embeddings en {len(lotes)} lotes...")
+        
+        with ThreadPoolExecutor(max_workers=self.max_lotes_concurrentes) as ejecutor:
+            resultados = list(ejecutor.map(self._embeber_lote, lotes))
+        
+        embeddings = []
+        for lote, resultado in zip(lotes, resultados):
+            embeddings.extend(resultado if resultado is not None else [None] * len(lote))
+        return embeddings
+    
+    def _embeber_lote(self, lote):
+        """Un request de embeddings para todo el lote (los reintentos los hace el cliente compartido)"""
+        try:
+            if not isinstance(self.embeddings_base, OpenAIEmbeddings):
+                # Embedders locales: sin API ni rate limits
+                return self.embeddings_base.embed_documents(lote)
+            return self.cliente_llm.embeddings(self.modelo_embeddings, lote)
+            
+        except Exception as e:
+            print(f"❌ Error generando embeddings del lote de {len(lote)}: {e}")
+            return None
     
     def _generar_metadata(self, entidad, tipo):
         """Genera metadata específica según el tipo de entidad"""
-        base_metadata = {'tipo': tipo}
+        base_metadata = {'tipo': tipo, 'modelo_embedding': self.modelo_embeddings}
         
         if tipo == 'producto':
             base_metadata.update({
@@ -569,7 +798,10 @@ class GestorBaseConocimiento:
                 'nombre': entidad['nombre'],
                 'precio': float(entidad['precio_base'] or 0),
                 'stock': int(entidad['stock_global'] or 0),
-                'codigo': entidad.get('codigo', '')
+                'codigo': entidad.get('codigo', ''),
+                'colecciones': [
+                    item.split('|')[0] for item in (entidad.get('colecciones') or '').split(';') if item.strip()
+                ]
             })
         elif tipo == 'promocion':
             base_metadata.update({
@@ -602,44 +834,181 @@ class GestorBaseConocimiento:
         
         return base_metadata
     
-    def obtener_vectorstore(self):
-        """FUNCIÓN PRINCIPAL - Obtiene FAISS optimizado con todo el contenido"""
+    # ============================================
+    # ALMACENAMIENTO BINARIO DE EMBEDDINGS
+    # ============================================
+    
+    def _serializar_embedding(self, embedding):
+        """Embedding como bytes float32 empaquetados (4 bytes por dimensión)"""
+        return np.asarray(embedding, dtype=np.float32).tobytes()
+    
+    def migrar_embeddings_binarios(self):
+        """Convierte los embeddings guardados como pickle de listas Python a float32 empaquetado"""
+        # Los pickle empiezan con el opcode PROTO (0x80); la conversión confirma que realmente lo son
+        candidatos = self._ejecutar_consulta(
+            "SELECT id, embedding FROM base_conocimiento_analisis WHERE LEFT(embedding, 1) = 0x80",
+            obtener_datos=True, dictionary=True
+        )
+        
+        filas = []
+        for row in candidatos:
+            try:
+                vector = pickle.loads(row['embedding'])
+            except Exception:
+                continue  # Ya era binario y casualmente empieza con 0x80
+            if isinstance(vector, list):
+                filas.append((self._serializar_embedding(vector), row['id']))
+        
+        if filas:
+            print(f"🔧 Migrando {len(filas)} embeddings a formato binario float32...")
+            migrados = self._ejecutar_lote("UPDATE base_conocimiento_analisis SET embedding = %s WHERE id = %s", filas)
+            print(f"✅ Embeddings migrados: {migrados or 0}/{len(filas)}")
+        
+        return len(filas)
+    
+    def _cargar_registros(self, condicion=None, parametros=None):
+        """Lee registros y sus embeddings en una sola matriz contigua: (textos, matriz, metadatas, ids)"""
+        consulta = "SELECT id, contenido, embedding, metadata FROM base_conocimiento_analisis"
+        if condicion:
+            consulta += f" WHERE {condicion}"
+        filas = self._ejecutar_consulta(consulta + " ORDER BY id", parametros, obtener_datos=True, dictionary=True)
+        
+        # Todos los vectores válidos comparten el mismo tamaño en bytes
+        longitudes = Counter(len(row['embedding'] or b'') for row in filas)
+        longitud = longitudes.most_common(1)[0][0] if longitudes else 0
+        
+        textos, bloques, metadatas, ids = [], [], [], []
+        for row in filas:
+            if not row['embedding'] or len(row['embedding']) != longitud or longitud % 4:
+                print(f"⚠️ Embedding inválido en registro {row['id']}")
+                continue
+            
+            textos.append(row['contenido'])
+            bloques.append(bytes(row['embedding']))
+            metadatas.append(json.loads(row['metadata']) if row['metadata'] else {})
+            ids.append(str(row['id']))
+        
+        matriz = np.frombuffer(b''.join(bloques), dtype=np.float32).reshape(len(bloques), longitud // 4)
+        return textos, matriz, metadatas, ids
+    
+    def _construir_vectorstore(self, textos, matriz, metadatas, ids):
+        """Arma el vectorstore FAISS a partir de la matriz de embeddings, sin volver a embeber"""
+        index = self._crear_indice(matriz)
+        
+        docstore = InMemoryDocstore({
+            id_: Document(id=id_, page_content=texto, metadata=metadata)
+            for id_, texto, metadata in zip(ids, textos, metadatas)
+        })
+        index_to_docstore_id = dict(enumerate(ids))
+        
+        return FAISS(self.embeddings, index, docstore, index_to_docstore_id)
+    
+    def _crear_indice(self, matriz, modo=None):
+        """Índice FAISS del modo configurado, entrenado y cargado con la matriz de embeddings"""
+        modo = modo or self.modo_indice
+        total, dimension = matriz.shape
+        
+        # ~4·sqrt(n) listas, con al menos 39 vectores de entrenamiento por centroide
+        nlist = min(int(4 * np.sqrt(total)), total // 39)
+        
+        # Catálogos (o sub-índices) chicos no justifican un índice aproximado;
+        # PQ de 8 bits necesita ~39 vectores por cada uno de sus 256 centroides
+        if modo == 'flat' or nlist < 1 or (modo == 'ivf_pq' and total < 39 * 256):
+            index = faiss.IndexFlatL2(dimension)
+            index.add(matriz)
+            return index
+        
+        if modo == 'ivf_flat':
+            codificacion = "Flat"
+        elif modo == 'ivf_pq':
+            # Sub-cuantizadores de 8 bits; m debe dividir la dimensión
+            m = next((m for m in (64, 48, 32, 16, 8) if dimension % m == 0), 8)
+            codificacion = f"PQ{m}"
+        elif modo == 'ivf_sq8':
+            codificacion = "SQ8"
+        else:
+            raise ValueError(f"Modo de índice no soportado: {modo}")
+        
+        index = faiss.index_factory(dimension, f"IVF{nlist},{codificacion}")
+        index.train(matriz)
+        index.add(matriz)
+        index.nprobe = self.nprobe
+        # Mapa directo posición -> lista invertida: permite reconstruct() (lo usa la búsqueda MMR)
+        faiss.extract_index_ivf(index).make_direct_map()
+        return index
+    
+    def _parametros_busqueda(self, index, posiciones=None):
+        """Parámetros de búsqueda FAISS: pre-filtro por posiciones y nprobe en índices IVF"""
+        selector = faiss.IDSelectorBatch(posiciones.astype(np.int64)) if posiciones is not None else None
+        
+        if faiss.try_extract_index_ivf(index) is not None:
+            return faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe)
+        if selector is not None:
+            return faiss.SearchParameters(sel=selector)
+        return None
+    
+    def _particionar_por_tipo(self, textos, matriz, metadatas, ids):
+        """Agrupa los registros por tipo: {tipo: (textos, matriz, metadatas, ids)}"""
+        posiciones_por_tipo = {}
+        for posicion, metadata in enumerate(metadatas):
+            posiciones_por_tipo.setdefault(metadata.get('tipo', 'desconocido'), []).append(posicion)
+        
+        return {
+            tipo: (
+                [textos[i] for i in posiciones],
+                matriz[posiciones],
+                [metadatas[i] for i in posiciones],
+                [ids[i] for i in posiciones]
+            )
+            for tipo, posiciones in posiciones_por_tipo.items()
+        }
+    
+    def _construir_subindices(self, textos, matriz, metadatas, ids):
+        """Un vectorstore por tipo de entidad"""
+        return {
+            tipo: self._construir_vectorstore(*particion)
+            for tipo, particion in self._particionar_por_tipo(textos, matriz, metadatas, ids).items()
+        }
+    
+    def obtener_vectorstore(self, recargar=False):
+        """FUNCIÓN PRINCIPAL - Obtiene FAISS desde los embeddings ya guardados (sin llamadas a la API).
+        El índice se construye una vez y queda en memoria; solo la sincronización lo modifica."""
+        if self.vectorstore is not None and not recargar:
+            return self.vectorstore
+        
         try:
+            # Reutilizar snapshot en disco si la tabla no cambió
+            huella = self._calcular_huella() if self.usar_snapshot else None
+            if huella and self._cargar_snapshot(huella):
+                return self.vectorstore
+            
             print("🔄 Creando FAISS desde base de conocimiento completa...")
-            embeddings_data = self._ejecutar_consulta(
-                "SELECT contenido, embedding, metadata FROM base_conocimiento_analisis ORDER BY id",
-                obtener_datos=True, dictionary=True
-            )
+            textos, matriz, metadatas, ids = self._cargar_registros()
             
-            if not embeddings_data:
+            if not ids:
                 print("❌ Sin embeddings en la base")
                 return None
             
-            # Preparar documentos para FAISS
-            documentos = []
-            for row in embeddings_data:
-                metadata = json.loads(row['metadata']) if row['metadata'] else {}
-                doc = Document(
-                    page_content=row['contenido'],
-                    metadata=metadata
-                )
-                documentos.append(doc)
-            
-            # Crear FAISS directamente desde documentos
-            vectorstore = FAISS.from_documents(
-                documents=documentos,
-                embedding=self.embeddings
-            )
+            # Construir el índice directamente con los vectores guardados
+            vectorstore = self._construir_vectorstore(textos, matriz, metadatas, ids)
             
             tipos = {}
-            for doc in documentos:
-                tipo = doc.metadata.get('tipo', 'desconocido')
+            for metadata in metadatas:
+                tipo = metadata.get('tipo', 'desconocido')
                 tipos[tipo] = tipos.get(tipo, 0) + 1
             
-            print(f"✅ Vectorstore creado con {len(documentos)} documentos:")
+            print(f"✅ Vectorstore creado con {len(ids)} documentos:")
             for tipo, cantidad in tipos.items():
                 print(f"   - {tipo.capitalize()}: {cantidad}")
             
+            self.vectorstore = vectorstore
+            self.subindices = self._construir_subindices(textos, matriz, metadatas, ids)
+            self._metadatos_numericos = {}
+            self._construir_indice_lexico()
+            
+            if huella:
+                self._guardar_snapshot(huella)
+            
             return vectorstore
             
         except Exception as e:
@@ -647,22 +1016,277 @@ class GestorBaseConocimiento:
             traceback.print_exc()
             return None
     
-    def buscar_contenido(self, consulta, k=5, filtro_tipo=None):
-        """Busca contenido específico en la base de conocimiento"""
-        vectorstore = self.obtener_vectorstore()
-        if not vectorstore:
+    # ============================================
+    # SNAPSHOT EN DISCO DEL ÍNDICE
+    # ============================================
+    
+    def _calcular_huella(self):
+        """Huella del contenido de base_conocimiento_analisis: total de filas + id máximo + hash"""
+        resultado = self._ejecutar_consulta("""
+            SELECT 
+                COUNT(*), 
+                COALESCE(MAX(id), 0),
+                COALESCE(SUM(CRC32(CONCAT(id, '|', MD5(contenido), '|', MD5(embedding), '|', COALESCE(metadata, '')))), 0)
+            FROM base_conocimiento_analisis
+        """, obtener_datos=True)
+        
+        if not resultado:
+            return None
+        
+        total, id_maximo, hash_contenido = resultado[0]
+        return f"{total}:{id_maximo}:{hash_contenido}"
+    
+    def _cargar_snapshot(self, huella):
+        """Carga índice, sub-índices y docstores guardados si corresponden a la huella actual"""
+        ruta_huella = os.path.join(self.ruta_snapshot, "huella.json")
+        if not os.path.exists(ruta_huella):
+            return False
+        
+        try:
+            with open(ruta_huella, 'r', encoding='utf-8') as f:
+                datos_huella = json.load(f)
+            
+            if datos_huella.get('huella') != huella or datos_huella.get('modo_indice', 'flat') != self.modo_indice:
+                print("🔄 Snapshot desactualizado, se reconstruirá el índice")
+                return False
+            
+            vectorstore = self._leer_indice_snapshot(self.nombre_vectorstore)
+            subindices = {
+                tipo: self._leer_indice_snapshot(f"{self.nombre_vectorstore}_{tipo}")
+                for tipo in datos_huella.get('tipos', [])
+            }
+            
+            self.vectorstore = vectorstore
+            self.subindices = subindices
+            self._metadatos_numericos = {}
+            self._construir_indice_lexico()
+            print(f"⚡ Vectorstore cargado desde snapshot con {vectorstore.index.ntotal} documentos")
+            return True
+            
+        except Exception as e:
+            print(f"⚠️ No se pudo cargar el snapshot: {e}")
+            return False
+    
+    def _leer_indice_snapshot(self, nombre):
+        """Lee un índice FAISS y su docstore desde la carpeta del snapshot"""
+        # Mapear el índice en memoria en lugar de copiarlo (cuando el tipo de índice lo permite)
+        index = faiss.read_index(os.path.join(self.ruta_snapshot, f"{nombre}.faiss"), faiss.IO_FLAG_MMAP)
+        index_ivf = faiss.try_extract_index_ivf(index)
+        if index_ivf is not None:
+            index_ivf.nprobe = self.nprobe
+        with open(os.path.join(self.ruta_snapshot, f"{nombre}.pkl"), 'rb') as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        
+        return FAISS(self.embeddings, index, docstore, index_to_docstore_id)
+    
+    def _guardar_snapshot(self, huella):
+        """Guarda índice, sub-índices y docstores en disco junto con la huella que los valida"""
+        ruta_huella = os.path.join(self.ruta_snapshot, "huella.json")
+        
+        try:
+            os.makedirs(self.ruta_snapshot, exist_ok=True)
+            
+            # Invalidar la huella anterior antes de sobrescribir los archivos
+            if os.path.exists(ruta_huella):
+                os.remove(ruta_huella)
+            
+            self.vectorstore.save_local(self.ruta_snapshot, index_name=self.nombre_vectorstore)
+            for tipo, subindice in self.subindices.items():
+                subindice.save_local(self.ruta_snapshot, index_name=f"{self.nombre_vectorstore}_{tipo}")
+            
+            with open(ruta_huella, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'huella': huella,
+                    'tipos': list(self.subindices),
+                    'modo_indice': self.modo_indice,
+                    'fecha': datetime.now().isoformat()
+                }, f)
+            
+            print(f"💾 Snapshot guardado en {self.ruta_snapshot}")
+            
+        except Exception as e:
+            print(f"⚠️ No se pudo guardar el snapshot: {e}")
+    
+    # ============================================
+    # BÚSQUEDA FILTRADA POR SUB-ÍNDICES
+    # ============================================
+    
+    def buscar_contenido(self, consulta, k=5, filtro_tipo=None, filtros=None):
+        """Busca contenido específico en la base de conocimiento (k-NN sobre el índice en memoria)
+        
+        Args:
+            consulta: Texto a buscar
+            k: Cantidad exacta de resultados (si existen suficientes documentos que cumplan los filtros)
+            filtro_tipo: Tipo o lista de tipos ('producto', 'promocion', 'coleccion', 'sucursal')
+            filtros: Rangos sobre metadata numérica, ej. {'precio': (None, 500), 'stock': (1, None)}
+        """
+        if self.obtener_vectorstore() is None:
             return []
         
         try:
-            # Búsqueda básica
-            resultados = vectorstore.similarity_search(consulta, k=k*2)  # Buscar más para filtrar
+            # Solo se consultan los sub-índices de los tipos pedidos
+            if filtro_tipo is None:
+                tipos = list(self.subindices)
+            elif isinstance(filtro_tipo, str):
+                tipos = [filtro_tipo]
+            else:
+                tipos = list(filtro_tipo)
             
-            # Filtrar por tipo si se especifica
-            if filtro_tipo:
-                resultados = [r for r in resultados if r.metadata.get('tipo') == filtro_tipo]
+            vector = np.array([self.embeddings.embed_query(consulta)], dtype=np.float32)
             
-            return resultados[:k]
+            candidatos = []
+            for tipo in tipos:
+                subindice = self.subindices.get(tipo)
+                if subindice is None or subindice.index.ntotal == 0:
+                    continue
+                
+                # Pre-filtro numérico: la búsqueda solo considera las posiciones que cumplen los rangos
+                posiciones = None
+                if filtros:
+                    posiciones = np.flatnonzero(self._mascara_filtros(tipo, filtros))
+                    if len(posiciones) == 0:
+                        continue
+                parametros = self._parametros_busqueda(subindice.index, posiciones)
+                
+                distancias, posiciones = subindice.index.search(vector, k, params=parametros)
+                for distancia, posicion in zip(distancias[0], posiciones[0]):
+                    if posicion == -1:
+                        continue
+                    documento = subindice.docstore.search(subindice.index_to_docstore_id[posicion])
+                    candidatos.append((float(distancia), documento))
+            
+            # Unir resultados de los sub-índices por distancia (mismo espacio de embeddings)
+            candidatos.sort(key=lambda candidato: candidato[0])
+            return [documento for _, documento in candidatos[:k]]
             
         except Exception as e:
             print(f"❌ Error en búsqueda: {e}")
             return []
+    
+    def _construir_indice_lexico(self):
+        """Reconstruye el índice BM25 desde los documentos del índice en memoria"""
+        entradas = []
+        for id_documento in self.vectorstore.index_to_docstore_id.values():
+            metadata = self.vectorstore.docstore.search(id_documento).metadata
+            entradas.append((id_documento, metadata.get('nombre', ''), metadata.get('codigo', ''), metadata.get('colecciones', [])))
+        
+        self.indice_lexico.construir(entradas)
+    
+    def buscar_exacto(self, consulta, k=10):
+        """Documentos por código o nombre exacto resueltos con el índice léxico (sin llamada de embeddings).
+        Devuelve None si la consulta no contiene un código o nombre específico del catálogo."""
+        if self.obtener_vectorstore() is None:
+            return None
+        
+        ids_documentos = self.indice_lexico.buscar_exacto(consulta, max_resultados=k)
+        if not ids_documentos:
+            return None
+        return [self.vectorstore.docstore.search(id_documento) for id_documento in ids_documentos]
+    
+    def buscar_lexico(self, consulta, k=10):
+        """Ranking BM25 sobre nombres, códigos y colecciones: lista de (documento, puntaje)"""
+        if self.obtener_vectorstore() is None:
+            return []
+        
+        return [
+            (self.vectorstore.docstore.search(id_documento), puntaje)
+            for id_documento, puntaje in self.indice_lexico.buscar(consulta, k)
+        ]
+    
+    def _mascara_filtros(self, tipo, filtros):
+        """Posiciones del sub-índice cuya metadata numérica cae dentro de los rangos pedidos"""
+        columnas = self._columnas_numericas(tipo)
+        mascara = np.ones(self.subindices[tipo].index.ntotal, dtype=bool)
+        
+        for campo, (minimo, maximo) in filtros.items():
+            valores = columnas.get(campo)
+            if valores is None:
+                return np.zeros_like(mascara)  # El tipo no tiene ese campo
+            if minimo is not None:
+                mascara &= valores >= minimo
+            if maximo is not None:
+                mascara &= valores <= maximo
+        
+        return mascara
+    
+    def _columnas_numericas(self, tipo):
+        """Columnas de metadata numérica del sub-índice alineadas por posición (se cachean hasta la próxima sincronización)"""
+        if tipo not in self._metadatos_numericos:
+            subindice = self.subindices[tipo]
+            metadatas = [
+                subindice.docstore.search(subindice.index_to_docstore_id[posicion]).metadata
+                for posicion in range(subindice.index.ntotal)
+            ]
+            
+            campos = {
+                campo for metadata in metadatas for campo, valor in metadata.items()
+                if isinstance(valor, (int, float)) and not isinstance(valor, bool)
+            }
+            self._metadatos_numericos[tipo] = {
+                campo: np.array([metadata.get(campo, np.nan) for metadata in metadatas], dtype=np.float64)
+                for campo in campos
+            }
+        
+        return self._metadatos_numericos[tipo]
+    
+    # ============================================
+    # REPORTE DE RECALL VS LATENCIA POR TIPO DE ÍNDICE
+    # ============================================
+    
+    def reporte_recall_latencia(self, modos=('ivf_flat', 'ivf_pq', 'ivf_sq8'), num_consultas=100, k=10):
+        """Compara cada modo de índice contra el índice exacto (flat) usando los embeddings guardados como consultas"""
+        try:
+            _, matriz, _, ids = self._cargar_registros()
+            if not ids:
+                print("❌ Sin embeddings en la base")
+                return {}
+            
+            generador = np.random.default_rng(42)
+            muestra = generador.choice(len(ids), size=min(num_consultas, len(ids)), replace=False)
+            consultas = np.ascontiguousarray(matriz[muestra])
+            
+            reporte = {}
+            referencia = None
+            for modo in ('flat', *[modo for modo in modos if modo != 'flat']):
+                inicio = time.perf_counter()
+                index = self._crear_indice(matriz, modo)
+                tiempo_construccion = time.perf_counter() - inicio
+                
+                latencias, resultados = [], []
+                for consulta in consultas:
+                    inicio = time.perf_counter()
+                    _, posiciones = index.search(consulta.reshape(1, -1), k, params=self._parametros_busqueda(index))
+                    latencias.append((time.perf_counter() - inicio) * 1000)
+                    resultados.append(set(posiciones[0]) - {-1})
+                
+                if referencia is None:
+                    referencia = resultados  # El índice exacto es la verdad de referencia
+                
+                aciertos = sum(len(obtenidos & esperados) for obtenidos, esperados in zip(resultados, referencia))
+                esperados_total = sum(len(esperados) for esperados in referencia)
+                
+                reporte[modo] = {
+                    'indice': type(index).__name__,
+                    'recall': aciertos / esperados_total if esperados_total else 0.0,
+                    'latencia_media_ms': float(np.mean(latencias)),
+                    'latencia_p95_ms': float(np.percentile(latencias, 95)),
+                    'construccion_s': tiempo_construccion,
+                    'memoria_mb': faiss.serialize_index(index).nbytes / (1024 * 1024)
+                }
+            
+            print(f"📊 Recall@{k} vs latencia ({len(ids)} documentos, {len(consultas)} consultas, nprobe={self.nprobe}):")
+            for modo, datos in reporte.items():
+                print(f"   - {modo:<9} {datos['indice']:<24} recall={datos['recall']:.3f}  "
+                      f"media={datos['latencia_media_ms']:.2f}ms  p95={datos['latencia_p95_ms']:.2f}ms  "
+                      f"construcción={datos['construccion_s']:.2f}s  memoria={datos['memoria_mb']:.1f}MB")
+            
+            return reporte
+            
+        except Exception as e:
+            print(f"❌ Error generando reporte de recall/latencia: {e}")
+            traceback.print_exc()
+            return {}
+    
+    def estadisticas_cache_embeddings(self):
+        """Métricas de la caché de embeddings de consulta (tasa de aciertos, tamaño)"""
+        return self.embeddings.estadisticas()
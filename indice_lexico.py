@@ -0,0 +1,126 @@
+import re
+import numpy as np
+from recuperador import terminos
+
+def _con_compuestos(lista_terminos):
+    """Agrega pares contiguos unidos ("rtx 4070" -> "rtx4070") para que coincidan ambas formas de escribirlos"""
+    return lista_terminos + [a + b for a, b in zip(lista_terminos, lista_terminos[1:])]
+
+class IndiceBM25:
+    """Índice invertido BM25 en memoria sobre nombres, códigos y colecciones del catálogo.
+
+    Resuelve localmente (sin embeddings) búsquedas por código o nombre exacto y aporta
+    el ranking léxico de la búsqueda híbrida.
+    """
+    
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids = []
+        self._postings = {}          # término -> (posiciones, frecuencias)
+        self._idf = {}
+        self._longitudes = np.zeros(0, dtype=np.float32)
+        self._nombres = []           # términos del nombre de cada documento (para frases exactas)
+        self._terminos_nombre = {}   # término -> posiciones cuyo nombre lo contiene
+        self._codigos = {}           # código normalizado -> posiciones
+        self._compuestos = {}        # pares contiguos del nombre unidos ("rtx4070") -> posiciones
+    
+    def construir(self, entradas):
+        """entradas: iterable de (id_documento, nombre, código, colecciones)"""
+        ids, listas_terminos, nombres, codigos = [], [], [], {}
+        
+        for id_documento, nombre, codigo, colecciones in entradas:
+            posicion = len(ids)
+            ids.append(id_documento)
+            
+            terminos_nombre = terminos(nombre)
+            nombres.append(terminos_nombre)
+            
+            codigo = re.sub(r'[\W_]+', '', codigo or '').lower()
+            if len(codigo) >= 3:
+                codigos.setdefault(codigo, []).append(posicion)
+            
+            texto = ' '.join([nombre or '', codigo, *(colecciones or [])])
+            listas_terminos.append(_con_compuestos(terminos(texto)))
+        
+        frecuencias = {}
+        for posicion, lista in enumerate(listas_terminos):
+            for termino in lista:
+                por_documento = frecuencias.setdefault(termino, {})
+                por_documento[posicion] = por_documento.get(posicion, 0) + 1
+        
+        total = len(ids)
+        self._postings = {
+            termino: (np.fromiter(por_documento.keys(), dtype=np.int64), np.fromiter(por_documento.values(), dtype=np.float32))
+            for termino, por_documento in frecuencias.items()
+        }
+        self._idf = {
+            termino: float(np.log(1 + (total - len(por_documento) + 0.5) / (len(por_documento) + 0.5)))
+            for termino, por_documento in frecuencias.items()
+        }
+        self._longitudes = np.array([len(lista) for lista in listas_terminos], dtype=np.float32)
+        
+        self._terminos_nombre = {}
+        self._compuestos = {}
+        for posicion, terminos_nombre in enumerate(nombres):
+            for termino in set(terminos_nombre):
+                self._terminos_nombre.setdefault(termino, set()).add(posicion)
+            for a, b in zip(terminos_nombre, terminos_nombre[1:]):
+                self._compuestos.setdefault(a + b, set()).add(posicion)
+        
+        self.ids = ids
+        self._nombres = nombres
+        self._codigos = codigos
+    
+    def buscar(self, consulta, k=10):
+        """Los k documentos con mayor puntaje BM25: lista de (id_documento, puntaje)"""
+        if not self.ids:
+            return []
+        
+        puntajes = np.zeros(len(self.ids), dtype=np.float32)
+        normalizacion = self.k1 * (1 - self.b + self.b * self._longitudes / max(float(self._longitudes.mean()), 1.0))
+        
+        for termino in set(_con_compuestos(terminos(consulta))):
+            if termino not in self._postings:
+                continue
+            posiciones, frecuencias = self._postings[termino]
+            puntajes[posiciones] += self._idf[termino] * frecuencias * (self.k1 + 1) / (frecuencias + normalizacion[posiciones])
+        
+        candidatos = np.flatnonzero(puntajes)
+        mejores = candidatos[np.argsort(-puntajes[candidatos], kind='stable')[:k]]
+        return [(self.ids[posicion], float(puntajes[posicion])) for posicion in mejores]
+    
+    def buscar_exacto(self, consulta, max_resultados=10):
+        """Documentos cuyo código aparece en la consulta, o cuyo nombre contiene la frase más larga
+        de la consulta que sea específica (2+ palabras, o un modelo con números como "ps5"). None si no hay coincidencia
+        exacta o si es demasiado genérica (más de max_resultados documentos)."""
+        terminos_consulta = terminos(consulta)
+        
+        posiciones = set()
+        for termino in _con_compuestos(terminos_consulta):
+            posiciones.update(self._codigos.get(termino, ()))
+        if posiciones:
+            return [self.ids[posicion] for posicion in sorted(posiciones)][:max_resultados]
+        
+        for largo in range(len(terminos_consulta), 0, -1):
+            for inicio in range(len(terminos_consulta) - largo + 1):
+                frase = terminos_consulta[inicio:inicio + largo]
+                if largo < 2 and (len(frase[0]) < 3 or not any(c.isdigit() for c in frase[0])):
+                    continue
+                
+                candidatos = set.intersection(*(self._terminos_nombre.get(termino, set()) for termino in frase))
+                coincidencias = {posicion for posicion in candidatos if self._contiene_frase(self._nombres[posicion], frase)}
+                if largo == 1:
+                    # Modelo escrito junto ("rtx4070") cuando el nombre lo tiene separado ("RTX 4070")
+                    coincidencias |= self._compuestos.get(frase[0], set())
+                coincidencias = sorted(coincidencias)
+                if coincidencias:
+                    if len(coincidencias) > max_resultados:
+                        return None
+                    return [self.ids[posicion] for posicion in coincidencias]
+        
+        return None
+    
+    def _contiene_frase(self, secuencia, frase):
+        largo = len(frase)
+        return any(secuencia[i:i + largo] == frase for i in range(len(secuencia) - largo + 1))
@@ -0,0 +1,106 @@
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+class ExtractorInteresesDiferido:
+    """Extrae los intereses de los clientes después de responderles, fuera del camino de la respuesta.
+
+    - Debounce por cliente: los mensajes que llegan seguidos se juntan en una sola extracción, que corre
+      'espera_debounce' segundos después del último mensaje (o a lo sumo 'espera_maxima' después del primero).
+    - Lotes: los clientes que vencen juntos se procesan en un lote que consulta la lista de productos una sola vez.
+    - Concurrencia acotada: como máximo 'max_concurrencia' lotes a la vez, y nunca dos extracciones del mismo cliente.
+    """
+    
+    def __init__(self, generador_intereses, espera_debounce=10, espera_maxima=60, max_concurrencia=2, tamano_lote=8):
+        self.generador_intereses = generador_intereses
+        self.espera_debounce = espera_debounce
+        self.espera_maxima = espera_maxima
+        self.tamano_lote = tamano_lote
+        self.ejecutor = ThreadPoolExecutor(max_workers=max_concurrencia, thread_name_prefix="intereses")
+        
+        self._pendientes = {}     # telefono -> {'mensajes': [...], 'primero': t, 'vence': t}
+        self._en_proceso = set()
+        self._condicion = threading.Condition()
+        self._planificador = None
+        self.estadisticas_extraccion = {'mensajes_recibidos': 0, 'extracciones': 0, 'lotes': 0, 'errores': 0}
+    
+    def programar(self, telefono, mensaje):
+        """Agenda la extracción de intereses del mensaje (no bloquea)"""
+        ahora = time.time()
+        with self._condicion:
+            pendiente = self._pendientes.setdefault(telefono, {'mensajes': [], 'primero': ahora})
+            pendiente['mensajes'].append(mensaje)
+            pendiente['vence'] = min(ahora + self.espera_debounce, pendiente['primero'] + self.espera_maxima)
+            self.estadisticas_extraccion['mensajes_recibidos'] += 1
+            
+            if self._planificador is None:
+                self._planificador = threading.Thread(target=self._planificar, name="planificador-intereses", daemon=True)
+                self._planificador.start()
+            self._condicion.notify()
+    
+    def _planificar(self):
+        while True:
+            with self._condicion:
+                ahora = time.time()
+                vencidos = [
+                    telefono for telefono, pendiente in self._pendientes.items()
+                    if pendiente['vence'] <= ahora and telefono not in self._en_proceso
+                ]
+                
+                if not vencidos:
+                    proximos = [
+                        pendiente['vence'] for telefono, pendiente in self._pendientes.items()
+                        if telefono not in self._en_proceso
+                    ]
+                    # Sin pendientes se espera un aviso de programar() o de un lote terminado
+                    self._condicion.wait(max(min(proximos) - ahora, 0.01) if proximos else None)
+                    continue
+                
+                trabajos = []
+                for telefono in vencidos:
+                    trabajos.append((telefono, self._pendientes.pop(telefono)['mensajes']))
+                    self._en_proceso.add(telefono)
+            
+            for inicio in range(0, len(trabajos), self.tamano_lote):
+                self.ejecutor.submit(self._procesar_lote, trabajos[inicio:inicio + self.tamano_lote])
+    
+    def _procesar_lote(self, trabajos):
+        try:
+            # Una sola consulta de productos para todo el lote
+            productos_disponibles = self.generador_intereses.obtener_productos_disponibles()
+            self._contar('lotes')
+            
+            for telefono, mensajes in trabajos:
+                try:
+                    print(f"🎯 Extrayendo intereses de {telefono} ({len(mensajes)} mensajes)")
+                    resultado = self.generador_intereses.procesar_intereses_cliente(
+                        telefono, "chat_auto", "\n".join(mensajes),
+                        productos_disponibles=productos_disponibles
+                    )
+                    print(f"💾 Intereses procesados: {resultado.get('estado')}")
+                    self._contar('extracciones')
+                    if resultado.get('estado') != 'exito':
+                        self._contar('errores')
+                except Exception as e:
+                    print(f"⚠️ Error procesando intereses de {telefono}: {e}")
+                    traceback.print_exc()
+                    self._contar('errores')
+        finally:
+            with self._condicion:
+                for telefono, _ in trabajos:
+                    self._en_proceso.discard(telefono)
+                self._condicion.notify()
+    
+    def _contar(self, clave):
+        """Suma 1 a una estadística (los lotes corren en varios hilos)"""
+        with self._condicion:
+            self.estadisticas_extraccion[clave] += 1
+    
+    def estadisticas(self):
+        with self._condicion:
+            return {
+                **self.estadisticas_extraccion,
+                'clientes_pendientes': len(self._pendientes),
+                'clientes_en_proceso': len(self._en_proceso)
+            }
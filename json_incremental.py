@@ -0,0 +1,80 @@
+import re
+
+class ExtractorCampoJSON:
+    """Extrae el valor de un campo de texto de un objeto JSON que llega por fragmentos (streaming).
+
+    agregar() devuelve solo el texto nuevo del campo ya decodificado, sin esperar a que el JSON termine.
+    """
+    
+    ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+    
+    def __init__(self, campo):
+        self.campo = campo
+        self._patron_inicio = re.compile(r'"' + re.escape(campo) + r'"\s*:\s*"')
+        self._buffer = ""
+        self._posicion = 0
+        self.estado = 'buscando'  # 'buscando' -> 'leyendo' -> 'completo'
+        self.valor = ""
+    
+    def agregar(self, fragmento):
+        """Agrega un fragmento del JSON crudo; devuelve el texto del campo decodificado en este paso"""
+        self._buffer += fragmento
+        
+        if self.estado == 'buscando':
+            coincidencia = self._patron_inicio.search(self._buffer)
+            if not coincidencia:
+                return ""
+            self._posicion = coincidencia.end()
+            self.estado = 'leyendo'
+        
+        if self.estado != 'leyendo':
+            return ""
+        
+        nuevo = self._leer_cadena()
+        self.valor += nuevo
+        return nuevo
+    
+    def _leer_cadena(self):
+        """Decodifica desde la posición actual hasta la comilla de cierre o hasta donde haya datos completos"""
+        buffer = self._buffer
+        partes = []
+        
+        while self._posicion < len(buffer):
+            caracter = buffer[self._posicion]
+            
+            if caracter == '"':
+                self._posicion += 1
+                self.estado = 'completo'
+                break
+            
+            if caracter != '\\':
+                partes.append(caracter)
+                self._posicion += 1
+                continue
+            
+            # Secuencia de escape: si llegó cortada se espera al próximo fragmento
+            if self._posicion + 1 >= len(buffer):
+                break
+            
+            escape = buffer[self._posicion + 1]
+            if escape != 'u':
+                partes.append(self.ESCAPES.get(escape, escape))
+                self._posicion += 2
+                continue
+            
+            if self._posicion + 6 > len(buffer):
+                break
+            codigo = int(buffer[self._posicion + 2:self._posicion + 6], 16)
+            
+            # Pares sustitutos (emojis fuera del plano básico, ej. 🎮)
+            if 0xD800 <= codigo < 0xDC00:
+                if self._posicion + 12 > len(buffer):
+                    break
+                bajo = int(buffer[self._posicion + 8:self._posicion + 12], 16)
+                partes.append(chr(0x10000 + ((codigo - 0xD800) << 10) + (bajo - 0xDC00)))
+                self._posicion += 12
+            else:
+                partes.append(chr(codigo))
+                self._posicion += 6
+        
+        return ''.join(partes)
@@ -13,6 +13,35 @@ class ManejadorConversaciones:
             'database': 'bot_productos_db',
             'charset': 'utf8mb4'
         }
+        
+        self._crear_tabla_resumen()
+    
+    def _crear_tabla_resumen(self):
+        """
+        Crea la tabla del resumen acumulado por conversación si no existe
+        """
+        conexion = None
+        try:
+            conexion = mysql.connector.connect(**self.db_config)
+            cursor = conexion.cursor()
+            
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS resumen_conversacion (
+                    id_conversacion INT PRIMARY KEY,
+                    resumen TEXT NOT NULL,
+                    id_ultimo_mensaje INT NULL,
+                    fecha_actualizacion DATETIME NOT NULL
+                )
+            """)
+            conexion.commit()
+            
+        except Exception as e:
+            # Sin la tabla cada turno fallaría al leer o guardar el resumen: mejor no arrancar
+            raise RuntimeError(f"No se pudo crear la tabla resumen_conversacion: {e}") from e
+        finally:
+            if conexion and conexion.is_connected():
+                cursor.close()
+                conexion.close()
     
     def obtener_o_crear_cliente(self, telefono):
         """
@@ -239,4 +268,67 @@ class ManejadorConversaciones:
         finally:
             if conexion and conexion.is_connected():
                 cursor.close()
-                conexion.close()
\ No newline at end of file
+                conexion.close()
+    
+    def obtener_resumen(self, telefono):
+        """
+        Obtiene el resumen acumulado más reciente del cliente
+        (el de la conversación activa o, si recién empieza una, el de la anterior)
+        """
+        conexion = None
+        try:
+            conexion = mysql.connector.connect(**self.db_config)
+            cursor = conexion.cursor()
+            
+            cursor.execute("""
+                SELECT r.resumen
+                FROM resumen_conversacion r
+                INNER JOIN conversacion c ON r.id_conversacion = c.id_conversacion
+                INNER JOIN cliente cl ON c.id_cliente = cl.id_cliente
+                WHERE cl.telefono = %s
+                ORDER BY r.fecha_actualizacion DESC
+                LIMIT 1
+            """, (telefono,))
+            
+            resultado = cursor.fetchone()
+            return resultado[0] if resultado else ""
+            
+        except Exception as e:
+            print(f"❌ Error obteniendo resumen: {e}")
+            return ""
+        finally:
+            if conexion and conexion.is_connected():
+                cursor.close()
+                conexion.close()
+    
+    def guardar_resumen(self, id_conversacion, resumen, id_ultimo_mensaje=None):
+        """
+        Guarda (o reemplaza) el resumen acumulado de la conversación
+        """
+        conexion = None
+        try:
+            conexion = mysql.connector.connect(**self.db_config)
+            cursor = conexion.cursor()
+            
+            cursor.execute("""
+                INSERT INTO resumen_conversacion (id_conversacion, resumen, id_ultimo_mensaje, fecha_actualizacion)
+                VALUES (%s, %s, %s, NOW())
+                ON DUPLICATE KEY UPDATE
+                    resumen = VALUES(resumen),
+                    id_ultimo_mensaje = VALUES(id_ultimo_mensaje),
+                    fecha_actualizacion = NOW()
+            """, (id_conversacion, resumen, id_ultimo_mensaje))
+            
+            conexion.commit()
+            print(f"✅ Resumen actualizado: conversación {id_conversacion}")
+            return True
+            
+        except Exception as e:
+            print(f"❌ Error guardando resumen: {e}")
+            if conexion:
+                conexion.rollback()
+            return False
+        finally:
+            if conexion and conexion.is_connected():
+                cursor.close()
+                conexion.close()
@@ -0,0 +1,197 @@
+import atexit
+import hashlib
+import os
+import pickle
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+class EmbeddingsHash(Embeddings):
+    """Embedder determinístico sin red (feature hashing de palabras y trigramas).
+    No captura semántica: sirve para pruebas y benchmarks reproducibles."""
+    
+    def __init__(self, dimension=384):
+        self.dimension = dimension
+        self.modelo = f"hash-{dimension}"
+    
+    def _normalizar(self, texto):
+        """Minúsculas y sin acentos"""
+        texto = unicodedata.normalize('NFKD', texto.lower())
+        return ''.join(c for c in texto if not unicodedata.combining(c))
+    
+    def _rasgos(self, texto):
+        """Palabras completas y trigramas de caracteres de cada palabra"""
+        palabras = re.findall(r'\w+', self._normalizar(texto))
+        rasgos = list(palabras)
+        for palabra in palabras:
+            marcada = f"#{palabra}#"
+            rasgos.extend(marcada[i:i + 3] for i in range(len(marcada) - 2))
+        return rasgos
+    
+    def _embeber(self, texto):
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for rasgo in self._rasgos(texto):
+            # blake2b es estable entre procesos (hash() de Python no lo es)
+            digest = int.from_bytes(hashlib.blake2b(rasgo.encode('utf-8'), digest_size=8).digest(), 'little')
+            signo = 1.0 if digest & 1 else -1.0
+            vector[(digest >> 1) % self.dimension] += signo
+        
+        norma = np.linalg.norm(vector)
+        return (vector / norma if norma else vector).tolist()
+    
+    def embed_documents(self, texts):
+        return [self._embeber(texto) for texto in texts]
+    
+    def embed_query(self, text):
+        return self._embeber(text)
+
+class EmbeddingsLocales(Embeddings):
+    """Modelo sentence-transformers ejecutado localmente en CPU (sin round-trip de red por consulta)"""
+    
+    def __init__(self, modelo="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2", dispositivo='cpu', tamano_lote=64):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError("Para embeddings locales instala sentence-transformers: pip install sentence-transformers") from e
+        
+        self.modelo = modelo
+        self.tamano_lote = tamano_lote
+        self._modelo = SentenceTransformer(modelo, device=dispositivo)
+    
+    def embed_documents(self, texts):
+        return self._modelo.encode(
+            list(texts), batch_size=self.tamano_lote, normalize_embeddings=True, convert_to_numpy=True
+        ).tolist()
+    
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+class EmbeddingsConCache(Embeddings):
+    """Envuelve un embedder con una caché LRU/TTL de embeddings de consulta.
+    La clave es el texto normalizado: preguntas repetidas no vuelven a llamar al modelo."""
+    
+    def __init__(self, embeddings, max_entradas=5000, ttl_segundos=7 * 24 * 3600, ruta=None):
+        self.embeddings = embeddings
+        self.modelo = nombre_modelo(embeddings)
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self.ruta = ruta
+        
+        self._entradas = OrderedDict()  # clave -> (vector float32, timestamp)
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        
+        if ruta:
+            self._cargar()
+            atexit.register(self.guardar)
+    
+    def _clave(self, texto):
+        """Minúsculas, sin acentos, sin signos de puntuación y con espacios colapsados"""
+        normalizado = unicodedata.normalize('NFKD', texto.lower())
+        normalizado = ''.join(c for c in normalizado if not unicodedata.combining(c))
+        return ' '.join(re.findall(r'\w+', normalizado)) or texto.strip()
+    
+    def embed_query(self, text):
+        clave = self._clave(text)
+        ahora = time.time()
+        
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and ahora - entrada[1] < self.ttl_segundos:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return entrada[0].tolist()
+            self.fallos += 1
+        
+        # La llamada al modelo va fuera del lock para no serializar consultas distintas
+        vector = self.embeddings.embed_query(text)
+        
+        with self._lock:
+            self._entradas[clave] = (np.asarray(vector, dtype=np.float32), ahora)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+        
+        return vector
+    
+    def embed_documents(self, texts):
+        # Los documentos se embeben una sola vez al sincronizar y quedan guardados en la BD
+        return self.embeddings.embed_documents(texts)
+    
+    def estadisticas(self):
+        """Aciertos, fallos, tasa de aciertos y tamaño de la caché"""
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': round(self.aciertos / total, 4) if total else 0.0,
+                'entradas': len(self._entradas),
+                'max_entradas': self.max_entradas
+            }
+    
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+    
+    def guardar(self):
+        """Persiste la caché en disco (se llama también al cerrar el proceso)"""
+        if not self.ruta:
+            return
+        
+        try:
+            with self._lock:
+                datos = {
+                    'modelo': self.modelo,
+                    'entradas': [(clave, vector.tobytes(), fecha) for clave, (vector, fecha) in self._entradas.items()]
+                }
+            temporal = f"{self.ruta}.tmp"
+            with open(temporal, 'wb') as f:
+                pickle.dump(datos, f)
+            os.replace(temporal, self.ruta)
+        
+        except Exception as e:
+            print(f"⚠️ No se pudo guardar la caché de embeddings: {e}")
+    
+    def _cargar(self):
+        if not os.path.exists(self.ruta):
+            return
+        
+        try:
+            with open(self.ruta, 'rb') as f:
+                datos = pickle.load(f)
+            
+            # Vectores de otro modelo no son comparables con el índice actual
+            if datos.get('modelo') != self.modelo:
+                return
+            
+            ahora = time.time()
+            for clave, vector, fecha in datos.get('entradas', [])[-self.max_entradas:]:
+                if ahora - fecha < self.ttl_segundos:
+                    self._entradas[clave] = (np.frombuffer(vector, dtype=np.float32), fecha)
+            
+            print(f"⚡ Caché de embeddings cargada con {len(self._entradas)} consultas")
+        
+        except Exception as e:
+            print(f"⚠️ No se pudo cargar la caché de embeddings: {e}")
+
+def crear_embeddings(proveedor='openai', api_key="", modelo=None):
+    """Crea el embedder configurado: 'openai', 'local' o 'hash'"""
+    if proveedor == 'openai':
+        # Usa el pool de conexiones compartido del proceso
+        from cliente_llm import ClienteLLM
+        return ClienteLLM.obtener(api_key).embeddings_langchain(modelo or "text-embedding-ada-002")
+    if proveedor == 'local':
+        return EmbeddingsLocales(modelo) if modelo else EmbeddingsLocales()
+    if proveedor == 'hash':
+        return EmbeddingsHash()
+    raise ValueError(f"Proveedor de embeddings no soportado: {proveedor}")
+
+def nombre_modelo(embeddings):
+    """Identificador del modelo de un embedder (se guarda en la metadata de cada registro)"""
+    return getattr(embeddings, 'model', None) or getattr(embeddings, 'modelo', None) or type(embeddings).__name__
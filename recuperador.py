@@ -0,0 +1,87 @@
+import re
+import unicodedata
+from typing import Any
+from langchain_core.retrievers import BaseRetriever
+
+ESTRATEGIAS_RECUPERACION = ('similitud', 'mmr', 'umbral', 'hibrida')
+
+# Palabras que no ayudan a distinguir documentos en la parte léxica de la búsqueda híbrida
+PALABRAS_VACIAS = {
+    'de', 'la', 'el', 'los', 'las', 'un', 'una', 'unos', 'unas', 'y', 'o', 'en', 'con', 'por', 'para', 'que',
+    'del', 'al', 'se', 'me', 'te', 'tu', 'mi', 'su', 'es', 'hay', 'tienen', 'tiene', 'tienes', 'quiero',
+    'busco', 'cual', 'cuales', 'como', 'hola', 'favor', 'algo', 'alguna', 'algun', 'lo', 'le', 'si', 'no'
+}
+
+def normalizar_texto(texto):
+    """Minúsculas y sin acentos"""
+    texto = unicodedata.normalize('NFKD', (texto or "").lower())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+def terminos(texto):
+    """Términos de búsqueda de un texto (sin palabras vacías)"""
+    return [palabra for palabra in re.findall(r'[^\W_]+', normalizar_texto(texto)) if palabra not in PALABRAS_VACIAS]
+
+class RecuperadorConfigurable(BaseRetriever):
+    """Retriever sobre el índice en memoria de GestorBaseConocimiento con estrategia configurable.
+
+    - 'similitud': los k vecinos más cercanos.
+    - 'mmr': máxima relevancia marginal entre fetch_k candidatos (menos documentos casi repetidos).
+    - 'umbral': vecinos con similitud coseno >= umbral_similitud (como máximo k).
+    - 'hibrida': fusión de rangos (RRF) entre la búsqueda densa y el índice BM25 del gestor.
+
+    Con atajo_exacto, una consulta con código o nombre exacto de producto se resuelve con el índice
+    léxico sin calcular su embedding. Solo se mira la pregunta: lo que viene después de la primera
+    línea en blanco (contexto previo de la conversación) no cuenta para el atajo.
+    """
+    
+    gestor: Any
+    estrategia: str = 'mmr'
+    k: int = 10
+    fetch_k: int = 20
+    lambda_mult: float = 0.8
+    umbral_similitud: float = 0.78
+    constante_rrf: int = 60
+    atajo_exacto: bool = True
+    
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        vectorstore = self.gestor.obtener_vectorstore()
+        if vectorstore is None:
+            return []
+        
+        if self.atajo_exacto:
+            exactos = self.gestor.buscar_exacto(query.split('\n\n')[0], k=self.k)
+            if exactos:
+                return exactos
+        
+        vector = self.gestor.embeddings.embed_query(query)
+        
+        if self.estrategia == 'similitud':
+            return vectorstore.similarity_search_by_vector(vector, k=self.k)
+        
+        if self.estrategia == 'mmr':
+            return vectorstore.max_marginal_relevance_search_by_vector(
+                vector, k=self.k, fetch_k=self.fetch_k, lambda_mult=self.lambda_mult
+            )
+        
+        candidatos = vectorstore.similarity_search_with_score_by_vector(vector, k=self.fetch_k)
+        
+        if self.estrategia == 'umbral':
+            # Vectores normalizados: distancia L2 al cuadrado = 2 - 2·coseno
+            return [documento for documento, distancia in candidatos if 1 - distancia / 2 >= self.umbral_similitud][:self.k]
+        
+        if self.estrategia == 'hibrida':
+            lexicos = self.gestor.buscar_lexico(query, k=self.fetch_k)
+            return self._fusionar([documento for documento, _ in candidatos], [documento for documento, _ in lexicos])
+        
+        raise ValueError(f"Estrategia de recuperación no soportada: {self.estrategia}")
+    
+    def _fusionar(self, *rankings):
+        """Reciprocal rank fusion: suma 1/(c + rango) de cada ranking en el que aparece el documento"""
+        puntajes, documentos = {}, {}
+        for ranking in rankings:
+            for rango, documento in enumerate(ranking, start=1):
+                documentos.setdefault(documento.id, documento)
+                puntajes[documento.id] = puntajes.get(documento.id, 0.0) + 1 / (self.constante_rrf + rango)
+        
+        mejores = sorted(puntajes, key=lambda id_documento: -puntajes[id_documento])[:self.k]
+        return [documentos[id_documento] for id_documento in mejores]
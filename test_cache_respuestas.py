@@ -0,0 +1,93 @@
+"""
+Pruebas de CacheRespuestasSemantica (reutilización de respuestas para preguntas casi repetidas)
+Ejecutar: python -m pytest test_cache_respuestas.py
+"""
+
+import time
+import numpy as np
+
+from cache_respuestas import CacheRespuestasSemantica
+
+DOCUMENTOS = [('producto', 1), ('coleccion', 7)]
+
+def _vector(*componentes):
+    vector = np.zeros(8, dtype=np.float32)
+    vector[:len(componentes)] = componentes
+    return vector
+
+def test_pregunta_similar_con_los_mismos_documentos_reutiliza_la_respuesta():
+    cache = CacheRespuestasSemantica(umbral_similitud=0.95)
+    cache.guardar(_vector(1, 0), DOCUMENTOS, 1, '{"respuesta_agente": "Sí, tenemos"}')
+    
+    # Coseno ~0.995 y el orden de los documentos no importa
+    assert cache.buscar(_vector(1, 0.1), list(reversed(DOCUMENTOS)), 1) == '{"respuesta_agente": "Sí, tenemos"}'
+    assert cache.estadisticas()['aciertos'] == 1
+
+def test_pregunta_distinta_no_reutiliza():
+    cache = CacheRespuestasSemantica(umbral_similitud=0.95)
+    cache.guardar(_vector(1, 0), DOCUMENTOS, 1, "a")
+    
+    # Coseno ~0.89, por debajo del umbral
+    assert cache.buscar(_vector(1, 0.5), DOCUMENTOS, 1) is None
+    assert cache.estadisticas()['fallos'] == 1
+
+def test_otros_documentos_recuperados_no_reutilizan():
+    cache = CacheRespuestasSemantica()
+    cache.guardar(_vector(1, 0), DOCUMENTOS, 1, "a")
+    
+    assert cache.buscar(_vector(1, 0), [('producto', 1)], 1) is None
+    assert cache.buscar(_vector(1, 0), DOCUMENTOS + [('producto', 2)], 1) is None
+
+def test_cambio_de_version_del_catalogo_invalida_todo():
+    cache = CacheRespuestasSemantica()
+    cache.guardar(_vector(1, 0), DOCUMENTOS, 1, "a")
+    
+    assert cache.buscar(_vector(1, 0), DOCUMENTOS, 2) is None
+    assert cache.estadisticas()['entradas'] == 0
+    # Volver a la versión anterior tampoco recupera la entrada borrada
+    assert cache.buscar(_vector(1, 0), DOCUMENTOS, 1) is None
+
+def test_entradas_vencidas_no_se_usan():
+    cache = CacheRespuestasSemantica(ttl_segundos=0.05)
+    cache.guardar(_vector(1, 0), DOCUMENTOS, 1, "a")
+    time.sleep(0.1)
+    
+    assert cache.buscar(_vector(1, 0), DOCUMENTOS, 1) is None
+
+def test_se_descartan_las_entradas_menos_usadas_al_superar_el_maximo():
+    cache = CacheRespuestasSemantica(max_entradas=2)
+    cache.guardar(_vector(1, 0), DOCUMENTOS, 1, "a")
+    cache.guardar(_vector(0, 1), DOCUMENTOS, 1, "b")
+    
+    # Usar "a" la vuelve la más reciente: al agregar "c" se descarta "b"
+    assert cache.buscar(_vector(1, 0), DOCUMENTOS, 1) == "a"
+    cache.guardar(_vector(0, 0, 1), DOCUMENTOS, 1, "c")
+    
+    assert cache.buscar(_vector(0, 1), DOCUMENTOS, 1) is None
+    assert cache.buscar(_vector(1, 0), DOCUMENTOS, 1) == "a"
+    assert cache.buscar(_vector(0, 0, 1), DOCUMENTOS, 1) == "c"
+    assert cache.estadisticas()['entradas'] == 2
+
+def test_se_elige_la_entrada_mas_similar():
+    cache = CacheRespuestasSemantica(umbral_similitud=0.9)
+    cache.guardar(_vector(1, 0.3), DOCUMENTOS, 1, "lejana")
+    cache.guardar(_vector(1, 0.05), DOCUMENTOS, 1, "cercana")
+    
+    assert cache.buscar(_vector(1, 0), DOCUMENTOS, 1) == "cercana"
+
+def test_invalidar():
+    cache = CacheRespuestasSemantica()
+    cache.guardar(_vector(1, 0), DOCUMENTOS, 1, "a")
+    cache.invalidar()
+    
+    assert cache.buscar(_vector(1, 0), DOCUMENTOS, 1) is None
+
+def test_otro_espacio_no_reutiliza():
+    cache = CacheRespuestasSemantica()
+    cache.guardar(_vector(1, 0), DOCUMENTOS, 1, '{"respuesta_agente": "Sí"}', espacio="json:abc")
+    
+    # Misma pregunta y documentos pero otro prompt o formato de respuesta
+    assert cache.buscar(_vector(1, 0), DOCUMENTOS, 1, espacio="texto:abc") is None
+    assert cache.buscar(_vector(1, 0), DOCUMENTOS, 1, espacio="json:def") is None
+    assert cache.buscar(_vector(1, 0), DOCUMENTOS, 1) is None
+    assert cache.buscar(_vector(1, 0), DOCUMENTOS, 1, espacio="json:abc") == '{"respuesta_agente": "Sí"}'
@@ -0,0 +1,153 @@
+"""
+Pruebas de ClienteLLM (reintentos, límite de concurrencia por modelo y presupuesto de tiempo) sin red
+Ejecutar: python -m pytest test_cliente_llm.py
+"""
+
+import asyncio
+import json
+import threading
+import time
+
+import httpx
+import pytest
+from openai import APIStatusError, APITimeoutError
+
+from cliente_llm import ClienteLLM, TransporteLLM, TransporteLLMAsync
+
+def _respuesta_chat(request, contenido="hola"):
+    cuerpo = json.loads(request.content)
+    return httpx.Response(200, json={
+        'id': 'chatcmpl-prueba', 'object': 'chat.completion', 'created': 0, 'model': cuerpo['model'],
+        'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': contenido}}]
+    })
+
+class ServidorFalso:
+    """Handler de httpx.MockTransport que cuenta llamadas y requests simultáneos"""
+    
+    def __init__(self, respuestas=None, demora=0.0):
+        self.respuestas = list(respuestas or [])   # Respuestas forzadas para las primeras llamadas
+        self.demora = demora
+        self.llamadas = 0
+        self.activos = 0
+        self.max_activos = 0
+        self._lock = threading.Lock()
+    
+    def __call__(self, request):
+        with self._lock:
+            self.llamadas += 1
+            self.activos += 1
+            self.max_activos = max(self.max_activos, self.activos)
+            forzada = self.respuestas.pop(0) if self.respuestas else None
+        try:
+            time.sleep(self.demora)
+            return forzada(request) if forzada else _respuesta_chat(request)
+        finally:
+            with self._lock:
+                self.activos -= 1
+
+@pytest.fixture
+def cliente():
+    cliente = ClienteLLM(api_key="sk-prueba")
+    cliente.limites_modelo = {'gpt-4o-mini': 2, 'default': 2}
+    return cliente
+
+def _usar_servidor(cliente, servidor):
+    cliente.http_client._transport = TransporteLLM(cliente, httpx.MockTransport(servidor))
+    cliente.http_client_async._transport = TransporteLLMAsync(cliente, httpx.MockTransport(servidor))
+
+def _mensajes():
+    return [{'role': 'user', 'content': 'hola'}]
+
+def test_reintenta_429_respetando_retry_after(cliente):
+    servidor = ServidorFalso(respuestas=[
+        lambda request: httpx.Response(429, headers={'retry-after': '0'}, json={'error': {'message': 'rate limit'}}),
+        lambda request: httpx.Response(503, headers={'retry-after': '0'}, json={'error': {'message': 'ocupado'}})
+    ])
+    _usar_servidor(cliente, servidor)
+    
+    assert cliente.chat('gpt-4o-mini', _mensajes()) == "hola"
+    assert servidor.llamadas == 3
+    # Los cupos de los intentos fallidos y del exitoso se devolvieron
+    assert cliente.semaforo('gpt-4o-mini')._value == 2
+
+def test_error_no_reintentable_no_se_reintenta(cliente):
+    servidor = ServidorFalso(respuestas=[lambda request: httpx.Response(400, json={'error': {'message': 'mal'}})])
+    _usar_servidor(cliente, servidor)
+    
+    with pytest.raises(APIStatusError):
+        cliente.chat('gpt-4o-mini', _mensajes())
+    assert servidor.llamadas == 1
+    assert cliente.semaforo('gpt-4o-mini')._value == 2
+
+def test_presupuesto_de_tiempo_corta_los_reintentos(cliente):
+    cliente.presupuesto_segundos = 0.2
+    servidor = ServidorFalso(respuestas=[lambda request: httpx.Response(503, headers={'retry-after': '1'})] * 5)
+    _usar_servidor(cliente, servidor)
+    
+    inicio = time.monotonic()
+    with pytest.raises(APIStatusError):
+        cliente.chat('gpt-4o-mini', _mensajes())
+    # Esperar el Retry-After excedería el presupuesto: se devuelve el error sin dormir
+    assert time.monotonic() - inicio < 0.5
+    assert servidor.llamadas == 1
+    assert cliente.semaforo('gpt-4o-mini')._value == 2
+
+def test_limite_de_concurrencia_por_modelo(cliente):
+    servidor = ServidorFalso(demora=0.05)
+    _usar_servidor(cliente, servidor)
+    
+    hilos = [threading.Thread(target=cliente.chat, args=('gpt-4o-mini', _mensajes())) for _ in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    
+    assert servidor.llamadas == 8
+    assert servidor.max_activos == 2
+    assert cliente.semaforo('gpt-4o-mini')._value == 2
+
+def test_sin_cupo_dentro_del_presupuesto(cliente):
+    cliente.presupuesto_segundos = 0.1
+    _usar_servidor(cliente, ServidorFalso())
+    
+    semaforo = cliente.semaforo('gpt-4o-mini')
+    semaforo.acquire()
+    semaforo.acquire()
+    try:
+        # El SDK de OpenAI convierte el httpx.PoolTimeout del transporte en APITimeoutError
+        with pytest.raises(APITimeoutError):
+            cliente.chat('gpt-4o-mini', _mensajes())
+    finally:
+        semaforo.release()
+        semaforo.release()
+
+def test_async_respeta_el_limite_y_libera_los_cupos(cliente):
+    servidor = ServidorFalso(
+        respuestas=[lambda request: httpx.Response(429, headers={'retry-after': '0'})],
+        demora=0.02
+    )
+    _usar_servidor(cliente, servidor)
+    
+    async def principal():
+        respuestas = await asyncio.gather(*[cliente.chat_async('gpt-4o-mini', _mensajes()) for _ in range(5)])
+        return respuestas, cliente.semaforo_async('gpt-4o-mini')._value
+    
+    respuestas, libres = asyncio.run(principal())
+    
+    assert respuestas == ["hola"] * 5
+    assert servidor.llamadas == 6
+    assert libres == 2
+
+def test_semaforos_async_de_loops_cerrados_se_descartan(cliente):
+    _usar_servidor(cliente, ServidorFalso())
+    
+    async def principal():
+        await cliente.chat_async('gpt-4o-mini', _mensajes())
+        return asyncio.get_running_loop()
+    
+    primer_loop = asyncio.run(principal())
+    segundo_loop = asyncio.run(principal())
+    
+    assert primer_loop.is_closed()
+    assert primer_loop not in cliente._semaforos_async
+    assert list(cliente._semaforos_async.keys()) == [segundo_loop]
@@ -0,0 +1,281 @@
+"""
+Pruebas de ColaTrabajos y PoolTrabajadores (cola persistente en SQLite)
+Ejecutar: python -m pytest test_cola_trabajos.py
+"""
+
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from cola_trabajos import ColaTrabajos, PoolTrabajadores
+
+@pytest.fixture
+def cola(tmp_path):
+    return ColaTrabajos(str(tmp_path / "cola.db"))
+
+def _estado(cola, id_trabajo):
+    with sqlite3.connect(cola.ruta) as conexion:
+        return conexion.execute("SELECT estado, error FROM trabajos WHERE id = ?", (id_trabajo,)).fetchone()
+
+def _esperar(condicion, timeout=5):
+    limite = time.time() + timeout
+    while not condicion() and time.time() < limite:
+        time.sleep(0.02)
+    return condicion()
+
+def test_clave_duplicada_se_ignora(cola):
+    primero = cola.encolar('turno', {'mensaje': 'hola'}, clave='SM1')
+    
+    assert primero is not None
+    assert cola.encolar('turno', {'mensaje': 'hola'}, clave='SM1') is None
+    assert cola.contiene('SM1') and not cola.contiene('SM2')
+    assert cola.estadisticas() == {'pendiente': 1}
+
+def test_tomar_reserva_y_completar(cola):
+    id_trabajo = cola.encolar('turno', {'mensaje': 'hola'})
+    
+    trabajo = cola.tomar()
+    assert trabajo['id'] == id_trabajo and trabajo['ids'] == [id_trabajo]
+    assert trabajo['datos'] == {'mensaje': 'hola'} and trabajo['intentos'] == 1
+    # Reservado: nadie más lo toma
+    assert cola.tomar() is None
+    
+    cola.completar(id_trabajo)
+    assert cola.estadisticas() == {'completado': 1}
+
+def test_retraso(cola):
+    cola.encolar('envio', {}, retraso=0.1)
+    
+    assert cola.tomar() is None
+    time.sleep(0.15)
+    assert cola.tomar() is not None
+
+def test_un_trabajo_por_grupo_y_en_orden(cola):
+    a1 = cola.encolar('turno', {'n': 1}, grupo='591700')
+    a2 = cola.encolar('turno', {'n': 2}, grupo='591700')
+    b1 = cola.encolar('turno', {'n': 1}, grupo='591800')
+    
+    primero, segundo = cola.tomar(), cola.tomar()
+    assert {primero['id'], segundo['id']} == {a1, b1}
+    # a2 espera a que termine a1 aunque haya trabajadores libres
+    assert cola.tomar() is None
+    
+    cola.completar(a1)
+    assert cola.tomar()['id'] == a2
+
+def test_grupo_sigue_bloqueado_mientras_el_anterior_se_reintenta(cola):
+    a1 = cola.encolar('envio', {}, grupo='591700')
+    a2 = cola.encolar('envio', {}, grupo='591700')
+    
+    cola.tomar()
+    cola.fallar(a1, "Twilio caído")
+    
+    # a1 vuelve a pendiente con backoff: a2 no se adelanta
+    assert _estado(cola, a1) == ('pendiente', 'Twilio caído')
+    assert cola.tomar() is None
+    assert _estado(cola, a2)[0] == 'pendiente'
+
+def test_fallar_agota_los_intentos(cola):
+    id_trabajo = cola.encolar('envio', {}, max_intentos=2)
+    
+    cola.tomar()
+    cola.fallar(id_trabajo, "error 1")
+    with sqlite3.connect(cola.ruta) as conexion:
+        conexion.execute("UPDATE trabajos SET disponible_en = 0 WHERE id = ?", (id_trabajo,))
+    
+    assert cola.tomar()['intentos'] == 2
+    cola.fallar(id_trabajo, "error 2")
+    assert _estado(cola, id_trabajo) == ('error', 'error 2')
+    assert cola.tomar() is None
+
+def test_reserva_vencida_se_vuelve_a_entregar_si_quedan_intentos(tmp_path):
+    cola = ColaTrabajos(str(tmp_path / "cola.db"), duracion_reserva=0)
+    id_trabajo = cola.encolar('envio', {}, max_intentos=2)
+    
+    assert cola.tomar()['intentos'] == 1
+    # El trabajador murió sin completar ni fallar: al vencer la reserva se vuelve a entregar
+    trabajo = cola.tomar()
+    assert trabajo['id'] == id_trabajo and trabajo['intentos'] == 2
+
+def test_reserva_vencida_sin_intentos_queda_en_error(tmp_path):
+    cola = ColaTrabajos(str(tmp_path / "cola.db"), duracion_reserva=0)
+    turno = cola.encolar('turno', {'n': 1}, grupo='591700', max_intentos=1)
+    siguiente = cola.encolar('turno', {'n': 2}, grupo='591700', max_intentos=1)
+    
+    assert cola.tomar()['id'] == turno
+    # Un turno de un solo intento no se procesa dos veces, y no bloquea al siguiente del cliente
+    assert cola.tomar()['id'] == siguiente
+    assert _estado(cola, turno) == ('error', 'Reserva vencida sin intentos restantes')
+
+def test_migra_tablas_de_la_version_anterior(tmp_path):
+    ruta = str(tmp_path / "cola.db")
+    with sqlite3.connect(ruta) as conexion:
+        conexion.execute("""
+            CREATE TABLE trabajos (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, tipo TEXT NOT NULL, datos TEXT NOT NULL, clave TEXT UNIQUE,
+                estado TEXT NOT NULL DEFAULT 'pendiente', intentos INTEGER NOT NULL DEFAULT 0,
+                max_intentos INTEGER NOT NULL DEFAULT 3, disponible_en REAL NOT NULL, error TEXT,
+                creado_en REAL NOT NULL, actualizado_en REAL NOT NULL
+            )
+        """)
+        conexion.execute(
+            "INSERT INTO trabajos (tipo, datos, disponible_en, creado_en, actualizado_en) VALUES ('envio', '{}', 0, 0, 0)"
+        )
+    
+    cola = ColaTrabajos(ruta)
+    trabajo = cola.tomar()
+    
+    assert trabajo['tipo'] == 'envio' and trabajo['grupo'] is None
+    assert cola.encolar('turno', {}, grupo='591700') is not None
+
+def test_pool_ejecuta_los_manejadores(cola):
+    procesados = []
+    terminado = threading.Event()
+    
+    def manejador(datos):
+        procesados.append(datos['n'])
+        if len(procesados) == 3:
+            terminado.set()
+    
+    for numero in range(3):
+        cola.encolar('turno', {'n': numero}, grupo='591700')
+    PoolTrabajadores(cola, {'turno': manejador}, num_trabajadores=3, intervalo_sondeo=0.05).iniciar()
+    
+    assert terminado.wait(5)
+    assert procesados == [0, 1, 2]
+    assert _esperar(lambda: cola.estadisticas() == {'completado': 3})
+
+def test_pool_falla_el_trabajo_si_el_manejador_lanza(cola):
+    id_trabajo = cola.encolar('turno', {}, max_intentos=1)
+    
+    def manejador(datos):
+        raise ValueError("sin conexión")
+    
+    PoolTrabajadores(cola, {'turno': manejador}, num_trabajadores=1, intervalo_sondeo=0.05).iniciar()
+    
+    assert _esperar(lambda: _estado(cola, id_trabajo)[0] == 'error')
+    assert _estado(cola, id_trabajo) == ('error', 'sin conexión')
+
+def _disponible_en(cola, id_trabajo):
+    with sqlite3.connect(cola.ruta) as conexion:
+        return conexion.execute("SELECT disponible_en FROM trabajos WHERE id = ?", (id_trabajo,)).fetchone()[0]
+
+def test_rafaga_se_entrega_en_un_solo_lote(cola):
+    ids = [cola.encolar('turno', {'mensaje': texto}, grupo='591700', ventana_agrupacion=0.1, espera_maxima=1)
+           for texto in ('hola', 'tienen ps5?', 'precio?')]
+    
+    # Dentro de la ventana nadie lo toma
+    assert cola.tomar() is None
+    time.sleep(0.15)
+    
+    trabajo = cola.tomar()
+    assert trabajo['ids'] == ids
+    assert [datos['mensaje'] for datos in trabajo['lote']] == ['hola', 'tienen ps5?', 'precio?']
+    assert cola.tomar() is None
+
+def test_cada_mensaje_nuevo_posterga_a_los_pendientes(cola):
+    primero = cola.encolar('turno', {}, grupo='591700', ventana_agrupacion=10, espera_maxima=60)
+    antes = _disponible_en(cola, primero)
+    time.sleep(0.05)
+    segundo = cola.encolar('turno', {}, grupo='591700', ventana_agrupacion=10, espera_maxima=60)
+    
+    assert _disponible_en(cola, primero) > antes
+    assert _disponible_en(cola, primero) == pytest.approx(_disponible_en(cola, segundo), abs=0.01)
+
+def test_la_postergacion_no_supera_la_espera_maxima(cola):
+    primero = cola.encolar('turno', {}, grupo='591700', ventana_agrupacion=10, espera_maxima=2)
+    with sqlite3.connect(cola.ruta) as conexion:
+        creado_en = conexion.execute("SELECT creado_en FROM trabajos WHERE id = ?", (primero,)).fetchone()[0]
+    
+    for _ in range(3):
+        cola.encolar('turno', {}, grupo='591700', ventana_agrupacion=10, espera_maxima=2)
+    
+    # Un cliente que escribe sin parar no posterga su respuesta más de espera_maxima
+    assert _disponible_en(cola, primero) == pytest.approx(creado_en + 2)
+
+def test_espera_maxima_vencida_entrega_el_lote_sin_esperar_la_ventana(cola):
+    cola.encolar('turno', {'n': 1}, grupo='591700', ventana_agrupacion=10, espera_maxima=0.1)
+    time.sleep(0.15)
+    cola.encolar('turno', {'n': 2}, grupo='591700', ventana_agrupacion=10, espera_maxima=0.1)
+    
+    # El primero ya cumplió su espera máxima y se lleva al segundo en el mismo lote
+    trabajo = cola.tomar()
+    assert [datos['n'] for datos in trabajo['lote']] == [1, 2]
+
+def test_agrupacion_solo_dentro_del_grupo_y_el_tipo(cola):
+    a1 = cola.encolar('turno', {}, grupo='591700', ventana_agrupacion=0.05)
+    a2 = cola.encolar('turno', {}, grupo='591700', ventana_agrupacion=0.05)
+    b1 = cola.encolar('turno', {}, grupo='591800', ventana_agrupacion=0.05)
+    envio = cola.encolar('envio', {}, grupo='591700')
+    time.sleep(0.1)
+    
+    tomados = [cola.tomar(), cola.tomar()]
+    # El envío no se posterga ni entra en el lote
+    assert sorted(trabajo['ids'] for trabajo in tomados) == sorted([[a1, a2], [b1]])
+    assert _estado(cola, envio)[0] == 'pendiente'
+    assert cola.tomar() is None
+    
+    cola.completar(a1)
+    cola.completar(a2)
+    assert cola.tomar()['id'] == envio
+
+def test_trabajo_intermedio_corta_el_lote(cola):
+    # Mensaje, envío del PDF y dos mensajes más: el PDF sale antes de responder a los dos últimos
+    t1 = cola.encolar('turno', {'n': 1}, grupo='591700', ventana_agrupacion=0.05)
+    pdf = cola.encolar('envio', {}, grupo='591700')
+    t2 = cola.encolar('turno', {'n': 2}, grupo='591700', ventana_agrupacion=0.05)
+    t3 = cola.encolar('turno', {'n': 3}, grupo='591700', ventana_agrupacion=0.05)
+    time.sleep(0.1)
+    
+    assert cola.tomar()['ids'] == [t1]
+    assert cola.tomar() is None
+    cola.completar(t1)
+    
+    assert cola.tomar()['id'] == pdf
+    assert cola.tomar() is None
+    cola.completar(pdf)
+    
+    assert cola.tomar()['ids'] == [t2, t3]
+
+def test_reintento_de_twilio_no_posterga_la_rafaga(cola):
+    primero = cola.encolar('turno', {}, clave='SM1', grupo='591700', ventana_agrupacion=10, espera_maxima=60)
+    antes = _disponible_en(cola, primero)
+    time.sleep(0.05)
+    
+    assert cola.encolar('turno', {}, clave='SM1', grupo='591700', ventana_agrupacion=10, espera_maxima=60) is None
+    assert _disponible_en(cola, primero) == antes
+
+def test_pool_entrega_el_lote_y_completa_todos(cola):
+    lotes = []
+    for texto in ('hola', 'precio?'):
+        cola.encolar('turno', {'mensaje': texto}, grupo='591700', ventana_agrupacion=0.05)
+    
+    PoolTrabajadores(cola, {'turno': lotes.append}, num_trabajadores=2, intervalo_sondeo=0.05,
+                     tipos_en_lote=('turno',)).iniciar()
+    
+    assert _esperar(lambda: cola.estadisticas() == {'completado': 2})
+    assert lotes == [[{'mensaje': 'hola'}, {'mensaje': 'precio?'}]]
+
+def test_envio_programado_respeta_el_orden_de_llegada(cola):
+    # Como programar_envio_whatsapp: el PDF se encola al final del turno, con retraso
+    t1 = cola.encolar('turno', {'n': 1}, grupo='591700', ventana_agrupacion=0.05)
+    time.sleep(0.1)
+    assert cola.tomar()['ids'] == [t1]
+    
+    t2 = cola.encolar('turno', {'n': 2}, grupo='591700', ventana_agrupacion=0.05)   # Llegó durante el turno
+    pdf = cola.encolar('envio', {}, grupo='591700', retraso=0.4)
+    t3 = cola.encolar('turno', {'n': 3}, grupo='591700', ventana_agrupacion=0.05)   # Llegó después del PDF
+    cola.completar(t1)
+    time.sleep(0.1)
+    
+    # El mensaje que ya esperaba se responde antes que el PDF, y sin juntarse con el que llegó después
+    assert cola.tomar()['ids'] == [t2]
+    cola.completar(t2)
+    assert cola.tomar() is None
+    
+    time.sleep(0.4)
+    assert cola.tomar()['id'] == pdf
+    cola.completar(pdf)
+    assert cola.tomar()['ids'] == [t3]
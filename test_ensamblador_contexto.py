@@ -0,0 +1,83 @@
+"""
+Pruebas de EnsambladorContexto (contexto de la base de conocimiento dentro de un presupuesto de tokens)
+Ejecutar: python -m pytest test_ensamblador_contexto.py
+"""
+
+from langchain_core.documents import Document
+
+from ensamblador_contexto import EnsambladorContexto
+
+TEXTO_PRODUCTO = """
+    PRODUCTO: PlayStation 5 Slim
+    CÓDIGO: PS5-SLIM
+    PRECIO: Bs. 4500
+    IMAGEN: https://ejemplo.com/ps5.jpg
+    ESTADO: activo
+
+    UBICACIONES Y STOCK:
+    - Sucursal Centro: 4 unidades
+    - Sucursal Norte: 2 unidades
+
+    PRECIOS ESPECIALES:
+    - Mayorista: Bs. 4200
+
+    PROMOCIONES:
+    Sin promociones activas
+"""
+
+def _documento(texto, numero=0):
+    return Document(page_content=texto, metadata={'tipo': 'producto', 'id_producto': numero})
+
+def test_limpiar_quita_sangrias_campos_y_secciones_no_pedidas():
+    ensamblador = EnsambladorContexto()
+    texto = ensamblador.limpiar(TEXTO_PRODUCTO, "¿Tienen la PS5?")
+    lineas = texto.splitlines()
+    
+    assert lineas[0] == "PRODUCTO: PlayStation 5 Slim"
+    assert all(linea == linea.strip() and linea for linea in lineas)
+    assert not any(linea.startswith(('IMAGEN:', 'ESTADO:')) for linea in lineas)
+    assert "UBICACIONES Y STOCK:" not in texto and "Sucursal Centro" not in texto
+    assert "PRECIOS ESPECIALES:" not in texto and "Mayorista" not in texto
+    # Sección vacía: se quitan el encabezado y el "Sin ..."
+    assert "PROMOCIONES:" not in texto and "Sin promociones" not in texto
+
+def test_limpiar_conserva_las_secciones_que_la_pregunta_necesita():
+    ensamblador = EnsambladorContexto()
+    
+    texto = ensamblador.limpiar(TEXTO_PRODUCTO, "¿En qué sucursal está y cuánto cuesta?")
+    assert "UBICACIONES Y STOCK:" in texto and "- Sucursal Norte: 2 unidades" in texto
+    assert "PRECIOS ESPECIALES:" in texto and "- Mayorista: Bs. 4200" in texto
+    
+    # Sin acentos ni mayúsculas también cuenta
+    texto = ensamblador.limpiar(TEXTO_PRODUCTO, "DONDE LO RETIRO")
+    assert "UBICACIONES Y STOCK:" in texto
+    assert "PRECIOS ESPECIALES:" not in texto
+
+def test_ensamblar_respeta_el_presupuesto_y_el_orden():
+    ensamblador = EnsambladorContexto(presupuesto_tokens=300, min_tokens_recorte=20)
+    documentos = [_documento(f"PRODUCTO: Producto {numero}\n" + "Detalle del producto. " * 30, numero) for numero in range(6)]
+    
+    seleccionados, total = ensamblador.ensamblar(documentos, "producto", registrar=False)
+    
+    assert 0 < total <= 300
+    assert total == sum(ensamblador.contar_tokens(documento.page_content) for documento in seleccionados)
+    assert len(seleccionados) < len(documentos)
+    # Mismo orden de relevancia y metadatos intactos
+    assert [documento.metadata['id_producto'] for documento in seleccionados] == list(range(len(seleccionados)))
+    # El último que no entraba completo se recortó
+    assert seleccionados[-1].page_content.endswith("\n…")
+
+def test_ensamblar_no_recorta_si_queda_poco_espacio():
+    ensamblador = EnsambladorContexto(min_tokens_recorte=80)
+    primero = _documento("PRODUCTO: Corto\nCÓDIGO: C1", 1)
+    largo = _documento("PRODUCTO: Largo\n" + "Texto de relleno. " * 100, 2)
+    ensamblador.presupuesto_tokens = ensamblador.contar_tokens(ensamblador.limpiar(primero.page_content, "")) + 50
+    
+    seleccionados, total = ensamblador.ensamblar([primero, largo], "producto", registrar=False)
+    
+    # Después del primero quedan menos de 80 tokens: el largo se descarta en vez de recortarse
+    assert [documento.metadata['id_producto'] for documento in seleccionados] == [1]
+    assert total == ensamblador.contar_tokens(seleccionados[0].page_content)
+
+def test_ensamblar_sin_documentos():
+    assert EnsambladorContexto().ensamblar([], "hola", registrar=False) == ([], 0)
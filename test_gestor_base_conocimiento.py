@@ -0,0 +1,108 @@
+"""
+Pruebas de la sincronización incremental de GestorBaseConocimiento sobre una tabla en memoria (sin MySQL ni API)
+Ejecutar: python -m pytest test_gestor_base_conocimiento.py
+"""
+
+import hashlib
+import threading
+
+import pytest
+
+from gestor_base_conocimiento import GestorBaseConocimiento
+
+class GestorEnMemoria(GestorBaseConocimiento):
+    """base_conocimiento_analisis como diccionario id -> (contenido, metadata) y embeddings falsos"""
+    
+    def __init__(self, productos):
+        self.productos = productos
+        self.filas = {}
+        self.siguiente_id = 1
+        self.embebidos = []
+        self.modelo_embeddings = 'modelo-prueba'
+        self.vectorstore = None
+        self.version_catalogo = 0
+        self._lock_sincronizacion = threading.Lock()
+    
+    def _fuentes_conocimiento(self):
+        return [('producto', lambda: list(self.productos), self._texto_producto, "📦 Productos")]
+    
+    def _texto_producto(self, producto):
+        return f"PRODUCTO: {producto['nombre']}\nPRECIO: Bs. {producto['precio_base']}"
+    
+    def _generar_embeddings(self, textos):
+        self.embebidos += textos
+        return [[1.0, 0.0]] * len(textos)
+    
+    def _ejecutar_consulta(self, consulta, parametros=None, obtener_datos=False, dictionary=False):
+        if consulta.startswith("SELECT id, SHA2(contenido, 256)"):
+            return [
+                {'id': id_fila, 'hash_contenido': hashlib.sha256(contenido.encode('utf-8')).hexdigest(), 'metadata': metadata}
+                for id_fila, (contenido, metadata) in sorted(self.filas.items())
+            ]
+        if consulta.startswith("DELETE FROM base_conocimiento_analisis"):
+            for id_fila in parametros:
+                del self.filas[id_fila]
+            return len(parametros)
+        raise AssertionError(f"Consulta inesperada: {consulta}")
+    
+    def _ejecutar_lote(self, consulta, filas):
+        for fila in filas:
+            if consulta.startswith("INSERT"):
+                contenido, _, metadata = fila
+                self.filas[self.siguiente_id] = (contenido, metadata)
+                self.siguiente_id += 1
+            elif "SET contenido" in consulta:
+                contenido, _, metadata, id_fila = fila
+                self.filas[id_fila] = (contenido, metadata)
+            else:
+                metadata, id_fila = fila
+                self.filas[id_fila] = (self.filas[id_fila][0], metadata)
+        return len(filas)
+
+def _producto(id_producto, nombre, precio, stock=5):
+    return {'id_producto': id_producto, 'nombre': nombre, 'precio_base': precio, 'stock_global': stock, 'codigo': f"C{id_producto}"}
+
+@pytest.fixture
+def gestor():
+    gestor = GestorEnMemoria([_producto(1, "PS5 Slim", 4500), _producto(2, "Mouse G502", 350)])
+    gestor.sincronizar_base_conocimiento()
+    gestor.embebidos.clear()
+    return gestor
+
+def test_primera_sincronizacion_embebe_todo():
+    gestor = GestorEnMemoria([_producto(1, "PS5 Slim", 4500), _producto(2, "Mouse G502", 350)])
+    
+    assert gestor.sincronizar_base_conocimiento() == {'nuevos': 2, 'actualizados': 0, 'metadata_actualizada': 0, 'eliminados': 0}
+    assert len(gestor.embebidos) == 2 and len(gestor.filas) == 2
+    assert gestor.version_catalogo == 1
+
+def test_sin_cambios_no_re_embebe_ni_cambia_la_version(gestor):
+    assert gestor.sincronizar_base_conocimiento() == {'nuevos': 0, 'actualizados': 0, 'metadata_actualizada': 0, 'eliminados': 0}
+    assert gestor.embebidos == []
+    assert gestor.version_catalogo == 1
+
+def test_solo_se_re_embebe_la_entidad_editada(gestor):
+    gestor.productos[0]['precio_base'] = 4200
+    gestor.productos[1]['stock_global'] = 0    # Cambia la metadata pero no el texto
+    
+    resultado = gestor.sincronizar_base_conocimiento()
+    
+    assert resultado == {'nuevos': 0, 'actualizados': 1, 'metadata_actualizada': 1, 'eliminados': 0}
+    assert gestor.embebidos == ["PRODUCTO: PS5 Slim\nPRECIO: Bs. 4200"]
+    assert gestor.version_catalogo == 2
+    assert gestor.filas[1][0] == "PRODUCTO: PS5 Slim\nPRECIO: Bs. 4200"
+
+def test_altas_y_bajas(gestor):
+    gestor.productos[:] = [gestor.productos[0], _producto(3, "Switch OLED", 2900)]
+    
+    resultado = gestor.sincronizar_base_conocimiento()
+    
+    assert resultado == {'nuevos': 1, 'actualizados': 0, 'metadata_actualizada': 0, 'eliminados': 1}
+    assert gestor.embebidos == ["PRODUCTO: Switch OLED\nPRECIO: Bs. 2900"]
+    assert sorted(contenido.split('\n')[0] for contenido, _ in gestor.filas.values()) == ["PRODUCTO: PS5 Slim", "PRODUCTO: Switch OLED"]
+
+def test_cambio_de_embedder_re_embebe_todo(gestor):
+    gestor.modelo_embeddings = 'otro-modelo'
+    
+    assert gestor.sincronizar_base_conocimiento()['actualizados'] == 2
+    assert len(gestor.embebidos) == 2
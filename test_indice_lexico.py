@@ -0,0 +1,92 @@
+"""
+Pruebas de IndiceBM25 (búsqueda léxica por nombre, código y colecciones del catálogo)
+Ejecutar: python -m pytest test_indice_lexico.py
+"""
+
+import pytest
+
+from indice_lexico import IndiceBM25
+
+CATALOGO = [
+    ('p1', 'PlayStation 5 Slim', 'PS5-SLIM', ['Consolas']),
+    ('p2', 'Control DualSense PS5', 'DS-PS5-01', ['Accesorios', 'Consolas']),
+    ('p3', 'Laptop ASUS ROG Strix G16 RTX 4070', 'G614JI-N4070', ['Laptops gaming']),
+    ('p4', 'Laptop Lenovo Legion 5 RTX 4060', 'LEG5-4060', ['Laptops gaming']),
+    ('p5', 'Tarjeta de video MSI RTX 4070 Super', 'MSI-4070S', ['Componentes']),
+    ('p6', 'Mouse Logitech G502 Hero', 'LOG-G502', ['Accesorios']),
+]
+
+@pytest.fixture
+def indice():
+    indice = IndiceBM25()
+    indice.construir(CATALOGO)
+    return indice
+
+def _ids(resultados):
+    return [id_documento for id_documento, _ in resultados]
+
+@pytest.mark.parametrize("consulta", [
+    "tienen el PS5-SLIM?",
+    "precio del ps5 slim",     # código escrito separado: "ps5" + "slim" -> "ps5slim"
+    "PS5SLIM",
+    "ps5_slim"
+])
+def test_codigo_en_cualquier_forma(indice, consulta):
+    assert indice.buscar_exacto(consulta) == ['p1']
+
+def test_codigo_con_varios_guiones(indice):
+    assert indice.buscar_exacto("g614ji-n4070 disponible?") == ['p3']
+    assert indice.buscar_exacto("DSPS501") == ['p2']
+
+def test_codigo_corto_no_se_indexa():
+    indice = IndiceBM25()
+    indice.construir([('x', 'Cable HDMI', 'AB', [])])
+    
+    assert indice.buscar_exacto("ab") is None
+
+def test_frase_exacta_del_nombre(indice):
+    assert indice.buscar_exacto("quiero el mouse logitech g502") == ['p6']
+    assert indice.buscar_exacto("Lenovo Legion") == ['p4']
+
+def test_modelo_escrito_junto(indice):
+    # "rtx4070" coincide con nombres que dicen "RTX 4070"
+    assert indice.buscar_exacto("rtx4070") == ['p3', 'p5']
+
+def test_palabra_generica_no_es_coincidencia_exacta(indice):
+    # Una sola palabra sin números no es específica ("laptop" está en varios nombres)
+    assert indice.buscar_exacto("laptop") is None
+    assert indice.buscar_exacto("hola, que tal") is None
+
+def test_demasiadas_coincidencias(indice):
+    assert indice.buscar_exacto("rtx 4070", max_resultados=1) is None
+    assert indice.buscar_exacto("rtx 4070", max_resultados=5) == ['p3', 'p5']
+
+def test_bm25_prioriza_los_terminos_raros(indice):
+    resultados = indice.buscar("rtx 4070 super", k=3)
+    
+    assert _ids(resultados)[0] == 'p5'
+    assert set(_ids(resultados)) >= {'p3', 'p5'}
+    puntajes = [puntaje for _, puntaje in resultados]
+    assert puntajes == sorted(puntajes, reverse=True)
+
+def test_bm25_busca_en_colecciones_sin_acentos(indice):
+    assert set(_ids(indice.buscar("accesorios"))) == {'p2', 'p6'}
+    assert _ids(indice.buscar("CONSOLAS", k=1)) in (['p1'], ['p2'])
+
+def test_bm25_respeta_k_y_omite_sin_coincidencias(indice):
+    assert len(indice.buscar("laptop", k=1)) == 1
+    assert indice.buscar("impresora") == []
+
+def test_indice_vacio():
+    indice = IndiceBM25()
+    indice.construir([])
+    
+    assert indice.buscar("ps5") == []
+    assert indice.buscar_exacto("ps5") is None
+
+def test_reconstruir_reemplaza_el_contenido(indice):
+    indice.construir([('n1', 'Nintendo Switch OLED', 'NSW-OLED', ['Consolas'])])
+    
+    assert indice.buscar_exacto("PS5-SLIM") is None
+    assert indice.buscar_exacto("nsw oled") == ['n1']
+    assert indice.ids == ['n1']
@@ -0,0 +1,66 @@
+"""
+Pruebas de ExtractorCampoJSON (lectura de un campo de texto de un JSON que llega por fragmentos)
+Ejecutar: python -m pytest test_json_incremental.py
+"""
+
+import json
+from json_incremental import ExtractorCampoJSON
+
+RESPUESTA = {
+    "interes": "alto",
+    "respuesta_agente": "¡Hola! 🎮 Tenemos la \"PS5 Slim\" a Bs. 4.500\nEnvío gratis\\sin costo\t✅ Ñandú",
+    "intereses_productos": [{"nombre": "PS5 Slim", "nivel_interes": "alto"}],
+    "resumen_conversacion": "respuesta_agente: no confundir"
+}
+
+def _extraer(fragmentos, campo="respuesta_agente"):
+    """Pasa los fragmentos por el extractor; devuelve el texto acumulado de lo que devolvió cada paso"""
+    extractor = ExtractorCampoJSON(campo)
+    texto = "".join(extractor.agregar(fragmento) for fragmento in fragmentos)
+    return extractor, texto
+
+def test_json_completo_en_un_fragmento():
+    extractor, texto = _extraer([json.dumps(RESPUESTA, ensure_ascii=False)])
+    
+    assert texto == RESPUESTA["respuesta_agente"]
+    assert extractor.valor == RESPUESTA["respuesta_agente"]
+    assert extractor.estado == 'completo'
+
+def test_todos_los_cortes_en_dos_fragmentos():
+    """El resultado no depende de dónde se corta el JSON, incluso a mitad de un escape \\uXXXX"""
+    for ensure_ascii in (False, True):
+        crudo = json.dumps(RESPUESTA, ensure_ascii=ensure_ascii)
+        for corte in range(len(crudo) + 1):
+            extractor, texto = _extraer([crudo[:corte], crudo[corte:]])
+            assert texto == RESPUESTA["respuesta_agente"], (ensure_ascii, corte)
+            assert extractor.estado == 'completo'
+
+def test_caracter_por_caracter():
+    for ensure_ascii in (False, True):
+        crudo = json.dumps(RESPUESTA, ensure_ascii=ensure_ascii, indent=2)
+        extractor, texto = _extraer(list(crudo))
+        assert texto == RESPUESTA["respuesta_agente"]
+        assert extractor.estado == 'completo'
+
+def test_emoji_como_par_sustituto():
+    crudo = json.dumps({"respuesta_agente": "Listo 🎮🕹️"}, ensure_ascii=True)
+    assert "\\ud83c\\udfae" in crudo
+    
+    _, texto = _extraer(list(crudo))
+    assert texto == "Listo 🎮🕹️"
+
+def test_no_devuelve_nada_antes_del_campo_ni_despues_del_cierre():
+    extractor = ExtractorCampoJSON("respuesta_agente")
+    
+    assert extractor.agregar('{"interes": "alto", "respuesta_') == ""
+    assert extractor.estado == 'buscando'
+    assert extractor.agregar('agente": "Hola') == "Hola"
+    assert extractor.agregar('", "resumen_conversacion": "otro texto"}') == ""
+    assert extractor.valor == "Hola"
+    assert extractor.estado == 'completo'
+
+def test_campo_ausente():
+    extractor, texto = _extraer(['{"interes": "bajo", ', '"resumen_conversacion": "x"}'])
+    
+    assert texto == ""
+    assert extractor.estado == 'buscando'
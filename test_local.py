@@ -155,6 +155,39 @@ def test_generar_pdf():
         print_result(False, f"Error: {e}")
         return False
 
+def test_sincronizar_base_conocimiento():
+    """Prueba la sincronización incremental del catálogo (sin cambios no re-embebe nada)"""
+    print_header("PRUEBA DE SINCRONIZACIÓN DE LA BASE DE CONOCIMIENTO")
+    
+    try:
+        # La primera llamada aplica lo que haya cambiado; la segunda no debe encontrar cambios
+        requests.post(f"{BASE_URL}/api/sincronizar_base_conocimiento", timeout=120)
+        response = requests.post(f"{BASE_URL}/api/sincronizar_base_conocimiento", timeout=120)
+        
+        if response.status_code == 200:
+            data = response.json()
+            
+            if data.get('exito'):
+                cambios = data.get('cambios') or {}
+                print(f"   🔄 Cambios: {cambios}")
+                print(f"   🏷️ Versión del catálogo: {data.get('version_catalogo')}")
+                
+                if any(cambios.values()):
+                    print_result(False, "La segunda sincronización no debería encontrar cambios")
+                    return False
+                print_result(True, "Sincronización incremental sin cambios pendientes")
+                return True
+            else:
+                print_result(False, f"Error sincronizando: {data.get('error')}")
+                return False
+        else:
+            print_result(False, f"Error HTTP {response.status_code}")
+            return False
+            
+    except Exception as e:
+        print_result(False, f"Error: {e}")
+        return False
+
 def test_envio_whatsapp():
     """Prueba el envío real por WhatsApp (requiere configuración Twilio)"""
     print_header("PRUEBA DE ENVÍO WHATSAPP")
@@ -276,7 +309,8 @@ def main():
         ("Comando intereses", test_comando_intereses),
         ("Generación PDF", test_generar_pdf),
         ("Envío WhatsApp", test_envio_whatsapp),
-        ("Simulación Webhook", test_simulacion_webhook)
+        ("Simulación Webhook", test_simulacion_webhook),
+        ("Sincronización base de conocimiento", test_sincronizar_base_conocimiento)
     ]
     
     resultados = []
@@ -0,0 +1,18 @@
+"""
+Pruebas de ManejadorConversaciones al arrancar (sin MySQL)
+Ejecutar: python -m pytest test_manejador_conversaciones.py
+"""
+
+import mysql.connector
+import pytest
+
+from manejador_conversaciones import ManejadorConversaciones
+
+def test_sin_tabla_de_resumen_no_arranca(monkeypatch):
+    def conectar(**config):
+        raise mysql.connector.Error("Can't connect to MySQL server on 'localhost'")
+    
+    monkeypatch.setattr(mysql.connector, 'connect', conectar)
+    
+    with pytest.raises(RuntimeError, match="resumen_conversacion"):
+        ManejadorConversaciones()